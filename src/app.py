@@ -4,9 +4,11 @@ import dash_bootstrap_components as dbc
 # ==================== INICIALIZAR APP ====================
 import dash_bootstrap_components as dbc
 from dash import Dash, html, dcc
+from utils.tarefas import gerenciador_tarefas  # Callbacks em segundo plano (None sem dash[diskcache])
 
 app = Dash(
     __name__,
     external_stylesheets=[dbc.themes.BOOTSTRAP],  # ✅ ESSENCIAL
-    suppress_callback_exceptions=True
+    suppress_callback_exceptions=True,
+    background_callback_manager=gerenciador_tarefas
 )
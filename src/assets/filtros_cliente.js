@@ -0,0 +1,234 @@
+// =============================================================================
+// FILTROS NO NAVEGADOR (DASHBOARD CEO)
+// =============================================================================
+//
+// Callbacks clientside do modo PICMONEY_FILTROS_CLIENTE=1: o cubo compacto
+// (utils.cubo.compactar_cubo) é enviado uma vez por sessão para um dcc.Store e
+// cada clique em "Aplicar Filtros" re-agrega as células no navegador, sem ida
+// ao servidor, reproduzindo os gráficos de utils/graphs.py montados a partir
+// do cubo e os KPIs de resgates e ticket médio. Usuários ativos,
+// estabelecimentos e o gráfico de faixa etária continuam no servidor, então
+// cada clique ainda faz esses pedidos.
+
+(function () {
+    // Cubo decodificado (vetores tipados) por versão dos dados
+    let decodificado = null;
+
+    function vetor(compacto) {
+        // base64 -> bytes -> TypedArray do tipo indicado pelo servidor
+        const binario = atob(compacto.dados);
+        const bytes = new Uint8Array(binario.length);
+        for (let i = 0; i < binario.length; i++) {
+            bytes[i] = binario.charCodeAt(i);
+        }
+        return new window[compacto.tipo](bytes.buffer);
+    }
+
+    function decodificar(cubo) {
+        if (decodificado && decodificado.versao === cubo.versao) {
+            return decodificado;
+        }
+        const colunas = {};
+        Object.keys(cubo.colunas).forEach(function (d) { colunas[d] = vetor(cubo.colunas[d]); });
+        const medidas = {};
+        Object.keys(cubo.medidas).forEach(function (m) { medidas[m] = vetor(cubo.medidas[m]); });
+        decodificado = {
+            versao: cubo.versao,
+            colunas: colunas,
+            medidas: medidas,
+            horas: vetor(cubo.horas),
+        };
+        return decodificado;
+    }
+
+    function posicao(rotulos, valor) {
+        // 'all' (ou vazio) = sem filtro; valor desconhecido não seleciona nada
+        if (valor === null || valor === undefined || valor === '' || valor === 'all') {
+            return null;
+        }
+        return rotulos.indexOf(valor);
+    }
+
+    function selecionar(cubo, d, categoria, tipo, bairro, inicio, fim) {
+        // Células do período (dias ordenados) que atendem aos filtros
+        const filtros = [
+            [d.colunas.categoria_estabelecimento, posicao(cubo.rotulos.categoria_estabelecimento, categoria)],
+            [d.colunas.tipo_cupom, posicao(cubo.rotulos.tipo_cupom, tipo)],
+            [d.colunas.bairro_estabelecimento, posicao(cubo.rotulos.bairro_estabelecimento, bairro)],
+        ].filter(function (f) { return f[1] !== null; });
+        const dias = d.colunas.data;
+        const primeiro = inicio ? cubo.dias.findIndex(function (x) { return x >= inicio.slice(0, 10); }) : 0;
+        let ultimo = cubo.dias.length - 1;
+        if (fim) {
+            ultimo = -1;
+            cubo.dias.forEach(function (x, i) { if (x <= fim.slice(0, 10)) { ultimo = i; } });
+        }
+        const selecao = [];
+        if (primeiro < 0 || filtros.some(function (f) { return f[1] < 0; })) {
+            return selecao;
+        }
+        for (let i = 0; i < cubo.n; i++) {
+            const dia = dias[i];
+            if ((inicio || fim) && (dia < primeiro || dia > ultimo)) {
+                continue;
+            }
+            if (filtros.every(function (f) { return f[0][i] === f[1]; })) {
+                selecao.push(i);
+            }
+        }
+        return selecao;
+    }
+
+    function somarPor(selecao, codigos, tamanho, medida) {
+        const somas = new Array(tamanho).fill(0);
+        selecao.forEach(function (i) {
+            if (codigos[i] >= 0) {
+                somas[codigos[i]] += medida[i];
+            }
+        });
+        return somas;
+    }
+
+    function barrasOrdenadas(rotulos, somas, limite) {
+        // Combinações com resgates, da maior para a menor (como os gráficos do servidor)
+        const barras = [];
+        somas.forEach(function (v, i) { if (v !== 0) { barras.push([rotulos[i], v]); } });
+        barras.sort(function (a, b) { return b[1] - a[1]; });
+        const exibidas = limite ? barras.slice(0, limite) : barras;
+        return {x: exibidas.map(function (b) { return b[0]; }), y: exibidas.map(function (b) { return b[1]; })};
+    }
+
+    function comTraco(figura, propriedades) {
+        // Cópia da figura com as propriedades do primeiro traço substituídas
+        const nova = Object.assign({}, figura);
+        nova.data = figura.data.slice();
+        nova.data[0] = Object.assign({}, figura.data[0], propriedades);
+        return nova;
+    }
+
+    function heatmapHoraCategoria(cubo, d, selecao, top) {
+        const nCat = cubo.rotulos.categoria_estabelecimento.length;
+        const categorias = d.colunas.categoria_estabelecimento;
+        const contagens = [];
+        for (let h = 0; h < 24; h++) {
+            contagens.push(new Array(nCat).fill(0));
+        }
+        selecao.forEach(function (i) {
+            if (categorias[i] < 0) {
+                return;
+            }
+            for (let h = 0; h < 24; h++) {
+                contagens[h][categorias[i]] += d.horas[i * 24 + h];
+            }
+        });
+        // Categorias com mais resgates (até 'top'), na ordem dos rótulos
+        const totais = contagens[0].map(function (_, c) {
+            return contagens.reduce(function (s, linha) { return s + linha[c]; }, 0);
+        });
+        let colunas = totais.map(function (_, c) { return c; }).filter(function (c) { return totais[c] !== 0; });
+        if (colunas.length > top) {
+            colunas = colunas.slice().sort(function (a, b) { return totais[b] - totais[a]; }).slice(0, top);
+        }
+        colunas.sort(function (a, b) { return a - b; });
+        const horas = [];
+        const z = [];
+        contagens.forEach(function (linha, h) {
+            const valores = colunas.map(function (c) { return linha[c]; });
+            if (valores.some(function (v) { return v !== 0; })) {
+                horas.push(h);
+                z.push(valores);
+            }
+        });
+        return {
+            x: colunas.map(function (c) { return cubo.rotulos.categoria_estabelecimento[c]; }),
+            y: horas,
+            z: z,
+        };
+    }
+
+    function segmentoTipo(cubo, d, selecao) {
+        // Pivô tipo de cupom x categoria, apenas com as linhas/colunas presentes
+        const nCat = cubo.rotulos.categoria_estabelecimento.length;
+        const nTipo = cubo.rotulos.tipo_cupom.length;
+        const somas = somarPor(selecao.filter(function (i) { return d.colunas.tipo_cupom[i] >= 0; }),
+                               Array.from(d.colunas.categoria_estabelecimento, function (c, i) {
+                                   return c < 0 ? -1 : d.colunas.tipo_cupom[i] * nCat + c;
+                               }), nCat * nTipo, d.medidas.resgates);
+        const tipos = [];
+        const categorias = [];
+        somas.forEach(function (v, k) {
+            if (v !== 0) {
+                const t = Math.floor(k / nCat);
+                const c = k % nCat;
+                if (tipos.indexOf(t) < 0) { tipos.push(t); }
+                if (categorias.indexOf(c) < 0) { categorias.push(c); }
+            }
+        });
+        tipos.sort(function (a, b) { return a - b; });
+        categorias.sort(function (a, b) { return a - b; });
+        return {
+            x: categorias.map(function (c) { return cubo.rotulos.categoria_estabelecimento[c]; }),
+            y: tipos.map(function (t) { return cubo.rotulos.tipo_cupom[t]; }),
+            z: tipos.map(function (t) { return categorias.map(function (c) { return somas[t * nCat + c]; }); }),
+        };
+    }
+
+    function formatarInteiro(valor) {
+        return Math.round(valor).toLocaleString('en-US');
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        ceo: {
+            pedir_cubo: function (versao, cubo) {
+                // Pede o cubo ao servidor só se a sessão não tiver o da versão atual
+                if (cubo && cubo.versao === versao) {
+                    return window.dash_clientside.no_update;
+                }
+                return versao;
+            },
+
+            filtrar: function (n_clicks, categoria, tipo, bairro, inicio, fim, cubo,
+                               figResgSeg, figWeek, figHeatmap, figHt) {
+                const semMudanca = window.dash_clientside.no_update;
+                if (!n_clicks || !cubo) {
+                    return [semMudanca, semMudanca, semMudanca, semMudanca, semMudanca, semMudanca];
+                }
+                if (!(inicio && fim)) {
+                    inicio = null;
+                    fim = null;
+                }
+                const d = decodificar(cubo);
+                const selecao = selecionar(cubo, d, categoria, tipo, bairro, inicio, fim);
+
+                // KPIs
+                let transacoes = 0;
+                let valor = 0;
+                let nValor = 0;
+                selecao.forEach(function (i) {
+                    transacoes += d.medidas.transacoes[i];
+                    valor += d.medidas.valor_cupom[i];
+                    nValor += d.medidas.valor_cupom_n[i];
+                });
+                // valor_cupom em centavos
+                const ticket = nValor ? 'R$ ' + (valor / 100 / nValor).toFixed(2) : 'R$ nan';
+
+                // Gráficos
+                const porCategoria = somarPor(selecao, d.colunas.categoria_estabelecimento,
+                                              cubo.rotulos.categoria_estabelecimento.length, d.medidas.resgates);
+                const diasSemana = Array.from(d.colunas.data, function (dia) {
+                    return dia < 0 ? -1 : (dia + cubo.primeiro_dia_semana) % 7;
+                });
+                const porDiaSemana = somarPor(selecao, diasSemana, 7, d.medidas.resgates);
+
+                return [
+                    comTraco(figResgSeg, barrasOrdenadas(cubo.rotulos.categoria_estabelecimento, porCategoria, 10)),
+                    comTraco(figWeek, barrasOrdenadas(cubo.nomes_dias, porDiaSemana, null)),
+                    comTraco(figHeatmap, heatmapHoraCategoria(cubo, d, selecao, 15)),
+                    comTraco(figHt, segmentoTipo(cubo, d, selecao)),
+                    formatarInteiro(transacoes),
+                    ticket,
+                ];
+            },
+        },
+    });
+})();
@@ -7,7 +7,8 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet
 import io
 import base64
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.tarefas import callback_tarefa  # Relatório gerado como tarefa em segundo plano
 
 def gerar_layout_botao_ceo():
     return html.Div([
@@ -17,6 +18,16 @@ def gerar_layout_botao_ceo():
             color="danger",
             className="mt-4"
         ),
+        # Visível apenas enquanto o relatório está sendo gerado
+        dbc.Button(
+            [html.I(className="fas fa-times mr-2"), " Cancelar"],
+            id="btn-cancelar-pdf-ceo",
+            color="secondary",
+            outline=True,
+            className="mt-4 ml-2",
+            style={'display': 'none'}
+        ),
+        html.Small(id="progresso-pdf-ceo", className="text-muted d-block mt-2"),
         dcc.Loading(
             id="loading-pdf-ceo",
             type="circle",
@@ -39,7 +50,8 @@ def converter_figura_para_imagem(fig, width=600, height=350):
         print(f"Erro ao converter figura: {e}")
         return None
 
-@app.callback(
+@callback_tarefa(
+    app,
     Output("download-pdf-ceo", "children"),
     Input("btn-gerar-pdf-ceo", "n_clicks"),
     [
@@ -51,9 +63,20 @@ def converter_figura_para_imagem(fig, width=600, height=350):
         State("graph-devices", "figure"),
         State("kpi-cards", "children"),
     ],
+    chave="pdf-ceo",
+    progress=Output("progresso-pdf-ceo", "children"),
+    progress_default="",
+    cancel=Input("btn-cancelar-pdf-ceo", "n_clicks"),
+    running=[
+        (Output("btn-gerar-pdf-ceo", "disabled"), True, False),
+        (Output("btn-cancelar-pdf-ceo", "style"), {'display': 'inline-block'}, {'display': 'none'}),
+    ],
+    # O número de cliques não entra na chave: pedidos repetidos com os mesmos
+    # gráficos acompanham a tarefa já em andamento
+    cache_args_to_ignore=[0],
     prevent_initial_call=True
 )
-def gerar_relatorio_pdf_ceo(n_clicks, fig_resg_seg, fig_week, fig_heatmap, 
+def gerar_relatorio_pdf_ceo(set_progress, n_clicks, fig_resg_seg, fig_week, fig_heatmap,
                             fig_age_coupon, fig_ht, fig_devices, kpis):
     """Gera relatório em PDF com todos os gráficos e KPIs da página CEO"""
     if not n_clicks:
@@ -94,11 +117,16 @@ def gerar_relatorio_pdf_ceo(n_clicks, fig_resg_seg, fig_week, fig_heatmap,
     ]
 
     # Converter todas as figuras em paralelo (MUITO MAIS RÁPIDO!)
+    set_progress(f"Convertendo gráficos (0/{len(figuras)})...")
+    imagens_bytes = [None] * len(figuras)
     with ThreadPoolExecutor(max_workers=6) as executor:
-        imagens_bytes = list(executor.map(
-            lambda fig: converter_figura_para_imagem(fig[0], 600, 350),
-            figuras
-        ))
+        tarefas = {
+            executor.submit(converter_figura_para_imagem, fig, 600, 350): i
+            for i, (fig, _) in enumerate(figuras)
+        }
+        for concluidas, tarefa in enumerate(as_completed(tarefas), start=1):
+            imagens_bytes[tarefas[tarefa]] = tarefa.result()
+            set_progress(f"Convertendo gráficos ({concluidas}/{len(figuras)})...")
 
     # Adicionar imagens ao PDF
     for (fig, titulo), img_bytes in zip(figuras, imagens_bytes):
@@ -109,6 +137,7 @@ def gerar_relatorio_pdf_ceo(n_clicks, fig_resg_seg, fig_week, fig_heatmap,
             story.append(Spacer(1, 15))
 
     # Finaliza o PDF
+    set_progress("Montando o PDF...")
     doc.build(story)
     buffer.seek(0)
     pdf_base64 = base64.b64encode(buffer.read()).decode("utf-8")
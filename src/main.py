@@ -1,10 +1,11 @@
+import os
 import dash
 import dash_bootstrap_components as dbc
 from dash import Input, Output, State, dcc, html
 from app import app
 from pages import ceo, cfo, projections
 import pandas as pd
-from utils.db_utils import df_trans
+from utils.db_utils import registro, aquecer_datasets
 
 # ==================== CONFIGURAÇÕES DE ESTILO ====================
 COLORS = {
@@ -67,75 +68,87 @@ nav_items = html.Div([
 ], style={'marginBottom': '30px'})
 
 # ==================== CÁLCULOS ====================
-total_resgates = len(df_trans)
-usuarios_unicos = df_trans['celular'].nunique()
-valor_total_cupons = df_trans['valor_cupom'].sum()
+def calcular_resumo():
+    """Totais exibidos no resumo rápido da sidebar"""
+    agregados = registro.get("trans_agregados")
+    return {
+        'total_resgates': agregados.total_transacoes,
+        'usuarios_unicos': agregados.contar_usuarios(),
+        'valor_total_cupons': agregados.receita,
+    }
 
 # ==================== SEÇÃO DE ESTATÍSTICAS RÁPIDAS ====================
-quick_stats = html.Div([
-    html.P("RESUMO RÁPIDO",
-           style={'fontSize': '11px', 'fontWeight': '600', 'letterSpacing': '1px', 'opacity': '0.6', 'margin': '20px 15px 15px 15px'}),
-    dbc.Row([
-        dbc.Col(
-            dbc.Card(
-                dbc.CardBody([
-                    html.Div([
-                        html.I(className="fas fa-users me-2", style={'color': COLORS['accent']}),
+def criar_quick_stats():
+    resumo = registro.derivado("resumo_rapido", calcular_resumo)
+    usuarios_unicos = resumo['usuarios_unicos']
+    total_resgates = resumo['total_resgates']
+    valor_total_cupons = resumo['valor_total_cupons']
+
+    return html.Div([
+        html.P("RESUMO RÁPIDO",
+               style={'fontSize': '11px', 'fontWeight': '600', 'letterSpacing': '1px', 'opacity': '0.6', 'margin': '20px 15px 15px 15px'}),
+        dbc.Row([
+            dbc.Col(
+                dbc.Card(
+                    dbc.CardBody([
                         html.Div([
-                            html.H5(f"{usuarios_unicos:,}", className="mb-0", style={'color': COLORS['light']}),
-                            html.P("Usuários Únicos", style={'color': COLORS['light']})
-                        ])
-                    ], className="d-flex align-items-center")
-                ]),
-                className="mb-2 bg-transparent border-0"
+                            html.I(className="fas fa-users me-2", style={'color': COLORS['accent']}),
+                            html.Div([
+                                html.H5(f"{usuarios_unicos:,}", className="mb-0", style={'color': COLORS['light']}),
+                                html.P("Usuários Únicos", style={'color': COLORS['light']})
+                            ])
+                        ], className="d-flex align-items-center")
+                    ]),
+                    className="mb-2 bg-transparent border-0"
+                ),
+                xs=12, sm=6, md=12, lg=12
             ),
-            xs=12, sm=6, md=12, lg=12
-        ),
-        dbc.Col(
-            dbc.Card(
-                dbc.CardBody([
-                    html.Div([
-                        html.I(className="fas fa-ticket-alt me-2", style={'color': '#28a745'}),
+            dbc.Col(
+                dbc.Card(
+                    dbc.CardBody([
                         html.Div([
-                            html.H5(f"{total_resgates:,}", className="mb-0", style={'color': COLORS['light']}),
-                            html.P("Total de Resgates", style={'color': COLORS['light']})
-                        ])
-                    ], className="d-flex align-items-center")
-                ]),
-                className="mb-2 bg-transparent border-0"
+                            html.I(className="fas fa-ticket-alt me-2", style={'color': '#28a745'}),
+                            html.Div([
+                                html.H5(f"{total_resgates:,}", className="mb-0", style={'color': COLORS['light']}),
+                                html.P("Total de Resgates", style={'color': COLORS['light']})
+                            ])
+                        ], className="d-flex align-items-center")
+                    ]),
+                    className="mb-2 bg-transparent border-0"
+                ),
+                xs=12, sm=6, md=12, lg=12
             ),
-            xs=12, sm=6, md=12, lg=12
-        ),
-        dbc.Col(
-            dbc.Card(
-                dbc.CardBody([
-                    html.Div([
-                        html.I(className="fas fa-dollar-sign me-2", style={'color': '#ffc107'}),
+            dbc.Col(
+                dbc.Card(
+                    dbc.CardBody([
                         html.Div([
-                            html.H5(f"R$ {valor_total_cupons:,.0f}", className="mb-0", style={'color': COLORS['light']}),
-                            html.P("Valor em Cupons", style={'color': COLORS['light']})
-                        ])
-                    ], className="d-flex align-items-center")
-                ]),
-                className="mb-2 bg-transparent border-0"
+                            html.I(className="fas fa-dollar-sign me-2", style={'color': '#ffc107'}),
+                            html.Div([
+                                html.H5(f"R$ {valor_total_cupons:,.0f}", className="mb-0", style={'color': COLORS['light']}),
+                                html.P("Valor em Cupons", style={'color': COLORS['light']})
+                            ])
+                        ], className="d-flex align-items-center")
+                    ]),
+                    className="mb-2 bg-transparent border-0"
+                ),
+                xs=12, sm=12, md=12, lg=12
             ),
-            xs=12, sm=12, md=12, lg=12
-        ),
-    ], className="px-2")
-])
+        ], className="px-2")
+    ])
 
 
 # ==================== SIDEBAR ====================
-sidebar = dbc.Card(
-    [
-        sidebar_header,
-        nav_items,
-        quick_stats
-    ],
-    body=True,
-    className="bg-dark text-white h-100 shadow-sm",
-    style={"minHeight": "100vh", "borderRadius": "10px", "margin": "0", "padding": "10px", "boxSizing": "border-box", "position": "sticky", "top": "0"}
-)
+def criar_sidebar():
+    return dbc.Card(
+        [
+            sidebar_header,
+            nav_items,
+            criar_quick_stats()
+        ],
+        body=True,
+        className="bg-dark text-white h-100 shadow-sm",
+        style={"minHeight": "100vh", "borderRadius": "10px", "margin": "0", "padding": "10px", "boxSizing": "border-box", "position": "sticky", "top": "0"}
+    )
 
 
 # ==================== BOTÃO MOBILE ====================
@@ -153,35 +166,46 @@ content = html.Div([
 ])
 
 # ==================== LAYOUT PRINCIPAL ====================
-app.layout = dbc.Container(fluid=True, children=[
-    dcc.Location(id="url"),
-    dbc.Row([
-        # SIDEBAR: ocupa 12 colunas no celular, 3 no md, 2 no lg
-        dbc.Col(
-            [
-                sidebar
-            ],
-            id="sidebar-col",
-            xs=12, sm=12, md=3, lg=2,
-            className="d-none d-md-block p-0"  # começa escondida no mobile
-        ),
+def serve_layout():
+    """Layout servido a cada acesso; os dados são carregados na primeira requisição."""
+    return dbc.Container(fluid=True, children=[
+        dcc.Location(id="url"),
+        dbc.Row([
+            # SIDEBAR: ocupa 12 colunas no celular, 3 no md, 2 no lg
+            dbc.Col(
+                [
+                    criar_sidebar()
+                ],
+                id="sidebar-col",
+                xs=12, sm=12, md=3, lg=2,
+                className="d-none d-md-block p-0"  # começa escondida no mobile
+            ),
 
-        # CONTEÚDO PRINCIPAL
-        dbc.Col(
-            [
-                dbc.Button(
-                    html.I(className="fas fa-bars"),
-                    color="primary",
-                    id="toggle-btn",
-                    className="mb-3 d-md-none"  # só aparece em telas pequenas
-                ),
-                html.Div(id="page-content", className="p-3 bg-light rounded-3 shadow-sm")
-            ],
-            xs=12, sm=12, md=9, lg=10,
-            id="content-col"
-        ),
-    ], className="gx-0 gy-0 align-items-start")
-])
+            # CONTEÚDO PRINCIPAL
+            dbc.Col(
+                [
+                    dbc.Button(
+                        html.I(className="fas fa-bars"),
+                        color="primary",
+                        id="toggle-btn",
+                        className="mb-3 d-md-none"  # só aparece em telas pequenas
+                    ),
+                    html.Div(id="page-content", className="p-3 bg-light rounded-3 shadow-sm")
+                ],
+                xs=12, sm=12, md=9, lg=10,
+                id="content-col"
+            ),
+        ], className="gx-0 gy-0 align-items-start")
+    ])
+
+app.layout = serve_layout
+
+# Servidor WSGI (ex.: gunicorn main:server)
+server = app.server
+
+# Pré-carga opcional dos dados na inicialização (PICMONEY_AQUECER=1)
+if os.environ.get("PICMONEY_AQUECER"):
+    aquecer_datasets()
 
 
 # ==================== CALLBACK PARA TOGGLE MENU ====================
@@ -242,9 +266,9 @@ def render_page_content(pathname):
             ], className="mt-4"),
         ])
     elif pathname == "/ceo":
-        return ceo.layout
+        return ceo.layout()
     elif pathname == "/cfo":
-        return cfo.layout
+        return cfo.layout()
     elif pathname == "/projections":
         return projections.layout
     return html.Div([
@@ -3,9 +3,15 @@
 # =============================================================================
 
 # Importação das bibliotecas necessárias
-from dash import dcc, html  # Componentes base do Dash
+import hashlib  # Versão do cubo enviado ao navegador
+import json
+import logging  # Aviso de volta ao modo de filtros no servidor
+import os
+import numpy as np  # customdata das figuras do cross-filter
+from functools import lru_cache  # Fatias compartilhadas entre os callbacks
+from dash import ctx, dcc, html, no_update  # Componentes base do Dash
 import dash_bootstrap_components as dbc  # Componentes estilizados Bootstrap
-from dash.dependencies import Input, Output, State  # Para callbacks
+from dash.dependencies import ClientsideFunction, Input, Output, State  # Para callbacks
 from app import app  # Instância principal da aplicação
 # Importação das funções de geração de gráficos
 from utils.graphs import (
@@ -14,22 +20,25 @@ from utils.graphs import (
     criar_grafico_heatmap,            # Heatmap de atividade
     criar_grafico_faixa_etaria,       # Distribuição por faixa etária
     criar_grafico_segmento_tipo,      # Análise por tipo de segmento
-    criar_grafico_dispositivos        # Uso por tipo de dispositivo
+    criar_grafico_dispositivos,       # Uso por tipo de dispositivo
+    dados_resgates_segmento,          # Cálculos dos gráficos, sem a figura
+    dados_dia_semana,                 # (usados pelo cross-filter)
+    dados_heatmap,
+    dados_faixa_etaria,
+    dados_segmento_tipo,
+    com_valores,                      # Figura pronta com outros valores
+    cache_figuras,                    # Cache das figuras por estado dos filtros
+    normalizar_filtros                # Chave de um estado dos filtros
 )
-# Importação dos dataframes processados
-from utils.db_utils import df_trans, df_players, df_pedestres
-import pandas as pd
+# Registro dos dataframes processados (carregados sob demanda)
+from utils.db_utils import registro
+# Cubo pré-agregado que responde aos filtros da página
+from utils.cubo import Cubo, CuboCruzado, TensorAtividade, compactar_cubo
+# Saídas recalculadas apenas quando os filtros de que dependem mudam
+from utils.saidas import atualizar_figura, estado_filtros, responder
+from utils.tarefas import FILTROS_EM_SEGUNDO_PLANO, callback_tarefa
 from components.botao_relatorio_ceo import gerar_layout_botao_ceo
 
-# Preparação dos dados para filtros interativos
-# Extraímos valores únicos e ordenamos para garantir consistência na interface
-categorias = sorted(df_trans['categoria_estabelecimento'].dropna().unique())
-tipos_cupom = sorted(df_trans['tipo_cupom'].dropna().unique())
-bairros = sorted(df_trans['bairro_estabelecimento'].dropna().unique())
-
-# Garantir que as colunas de data estão no formato correto
-df_trans['data'] = pd.to_datetime(df_trans['data'], format='%d/%m/%Y')
-
 # Definir cores do tema
 COLORS = {
     'primary': '#351D5A',
@@ -38,241 +47,693 @@ COLORS = {
     'info': '#17a2b8'
 }
 
+# Com PICMONEY_FILTROS_CLIENTE=1, o cubo compacto é enviado ao navegador uma vez
+# por sessão e os filtros dos gráficos do cubo são aplicados lá (clientside)
+FILTROS_NO_CLIENTE = os.environ.get("PICMONEY_FILTROS_CLIENTE", "") not in ("", "0")
+
+# Tamanho máximo (caracteres do JSON) do cubo enviado ao navegador. O dcc.Store
+# de sessão fica no sessionStorage (cerca de 5 MB por origem) e os vetores vão
+# em base64, um terço maior que os bytes; acima disso os filtros ficam no servidor
+LIMITE_CUBO_CLIENTE = 2_000_000
+
+logger = logging.getLogger(__name__)
+
+# ==================== CUBO ====================
+def obter_cubo():
+    """Cubo (dia, categoria, tipo de cupom, bairro, com resgates por hora) da versão atual dos dados"""
+    def construir():
+        agregados = registro.get("trans_agregados")
+        cubo = Cubo.de_fatos(agregados.fatos, agregados.horarios)
+        cubo.indice()
+        return cubo
+    return registro.derivado("cubo_ceo", construir)
+
+def obter_tensor():
+    """
+    Tensor denso de resgates [dia, hora, categoria, tipo, bairro] da versão atual
+    dos dados (None se passar de utils.cubo.LIMITE_BYTES_TENSOR)
+    """
+    return registro.derivado("tensor_ceo", lambda: TensorAtividade.de_cubo(obter_cubo()))
+
+def obter_cubo_cliente():
+    """
+    Cubo compacto para o modo de filtros no navegador (ver utils.cubo.compactar_cubo).
+
+    A 'versao' é um hash do conteúdo, então a cópia guardada na sessão do
+    navegador só é reenviada quando os dados mudam (inclusive entre reinícios).
+    """
+    def construir():
+        compacto = compactar_cubo(obter_cubo())
+        conteudo = json.dumps(compacto, sort_keys=True).encode("utf-8")
+        compacto["versao"] = hashlib.sha1(conteudo).hexdigest()
+        compacto["tamanho"] = len(conteudo)
+        return compacto
+    return registro.derivado("cubo_cliente_ceo", construir)
+
+def cubo_cliente_cabe():
+    """Indica se o cubo compacto da versão atual cabe em LIMITE_CUBO_CLIENTE"""
+    return obter_cubo_cliente()["tamanho"] <= LIMITE_CUBO_CLIENTE
+
+# O modo é fixado na importação (os callbacks dependem dele): se o cubo não
+# couber no navegador, os filtros voltam para o servidor
+if FILTROS_NO_CLIENTE and not cubo_cliente_cabe():
+    logger.warning("cubo compacto com %s caracteres (limite %s); filtros do CEO no servidor",
+                   f"{obter_cubo_cliente()['tamanho']:,}", f"{LIMITE_CUBO_CLIENTE:,}")
+    FILTROS_NO_CLIENTE = False
+
+def contar_hora_categoria(cubo, categoria='all', tipo_cupom='all', bairro='all', inicio=None, fim=None):
+    """
+    Matriz [hora, categoria] de resgates para o heatmap.
+
+    Vem do tensor pré-calculado; se ele não tiver o eixo de algum filtro ativo
+    (ou não couber na memória), é calculada a partir da fatia do cubo.
+
+    Returns:
+        (matriz de contagens, rótulos das categorias)
+    """
+    tensor = obter_tensor()
+    filtros = {'categoria_estabelecimento': categoria, 'tipo_cupom': tipo_cupom,
+               'bairro_estabelecimento': bairro}
+    if tensor is not None and tensor.responde(filtros):
+        contagens = tensor.somar(["hour", "categoria_estabelecimento"], filtros, inicio, fim)
+        return contagens, tensor.rotulos["categoria_estabelecimento"]
+    contagens, (_, categorias) = cubo.tensor(["hour", "categoria_estabelecimento"])
+    return contagens, categorias
+
+# ==================== CROSS-FILTER ====================
+# Um clique (ou seleção por área) em um gráfico filtra os demais. Os gráficos
+# são respondidos pelo TensorCruzado do estado atual dos filtros da página
+# (utils.cubo), que só é montado quando esses filtros mudam: cada clique é
+# uma máscara por eixo e uma soma sobre um array pequeno.
+def obter_cubo_cruzado():
+    """Cubo do cross-filter (resgates por faixa etária dos clientes) da versão atual dos dados"""
+    return registro.derivado("cubo_cruzado_ceo", lambda: CuboCruzado.de_horarios(
+        registro.get("trans_agregados").horarios))
+
+@lru_cache(maxsize=16)
+def _tensor_cruzado(versao, filtros):
+    return obter_cubo_cruzado().tensor(**dict(filtros))
+
+def tensor_cruzado(filtros):
+    """Tensor do cross-filter de um estado dos filtros, compartilhado pelos cliques"""
+    return _tensor_cruzado(registro.versao, normalizar_filtros(filtros))
+
+# Dimensão lida de cada propriedade dos pontos do clickData/selectedData, por gráfico
+PONTOS_SELECAO = {
+    'resg_seg': {'x': 'categoria_estabelecimento'},
+    'week': {'x': 'weekday'},
+    'heatmap': {'x': 'categoria_estabelecimento', 'y': 'hour'},
+    'age_coupon': {'x': 'faixa_etaria', 'customdata': 'tipo_cupom'},
+    'ht': {'x': 'categoria_estabelecimento', 'y': 'tipo_cupom'},
+}
+
+# Gráficos de barras também aceitam seleção por caixa ou laço
+SELECAO_EM_AREA = ('resg_seg', 'week', 'age_coupon')
+
+ROTULOS_SELECAO = {
+    'weekday': 'Dia',
+    'hour': 'Hora',
+    'categoria_estabelecimento': 'Categoria',
+    'tipo_cupom': 'Tipo de cupom',
+    'faixa_etaria': 'Faixa etária',
+}
+
+def selecao_dos_pontos(nome, pontos):
+    """Valores selecionados em um gráfico (dimensão -> lista ordenada) a partir dos pontos"""
+    selecao = {}
+    for ponto in pontos:
+        for propriedade, dimensao in PONTOS_SELECAO[nome].items():
+            valor = ponto.get(propriedade)
+            if isinstance(valor, list):
+                valor = valor[0] if valor else None
+            if valor is not None:
+                selecao.setdefault(dimensao, set()).add(valor)
+    return {dimensao: sorted(valores) for dimensao, valores in selecao.items()}
+
+def combinar_selecoes(selecoes, excluir=None):
+    """Interseção das seleções dos gráficos por dimensão (sem a do gráfico 'excluir')"""
+    combinada = {}
+    for fonte, selecao in sorted((selecoes or {}).items()):
+        if fonte == excluir:
+            continue
+        for dimensao, valores in selecao.items():
+            if dimensao in combinada:
+                combinada[dimensao] = [v for v in combinada[dimensao] if v in valores]
+            else:
+                combinada[dimensao] = list(valores)
+    return combinada
+
+def chave_cruzada(selecoes, nome):
+    """Seleção que afeta um gráfico, como texto canônico (filtro 'cruzado' do cache de figuras)"""
+    combinada = combinar_selecoes(selecoes, excluir=nome)
+    return json.dumps(combinada, sort_keys=True) if combinada else None
+
+def resumir_selecao(selecoes):
+    """Texto com a seleção ativa nos gráficos"""
+    combinada = combinar_selecoes(selecoes)
+    if not combinada:
+        return "Clique ou selecione uma área em um gráfico para filtrar os demais."
+    partes = [f"{ROTULOS_SELECAO[d]}: {', '.join(str(v) for v in valores) or 'nenhum'}"
+              for d, valores in combinada.items()]
+    return "Seleção: " + " · ".join(partes)
+
+def construir_grafico_cruzado(nome, filtros, selecoes):
+    """
+    Monta uma figura com a seleção dos outros gráficos aplicada.
+
+    Os valores vêm do tensor do cross-filter e vão para a figura sem seleção
+    do mesmo estado dos filtros (cache de figuras), sem passar pelo plotly.
+    Só quando os traços mudam (ex.: um tipo de cupom some do gráfico de
+    faixa etária) a figura é montada do zero.
+    """
+    tensor = tensor_cruzado(filtros)
+    base = obter_graficos([nome], **filtros)[nome]
+    if nome == 'resg_seg':
+        df = dados_resgates_segmento(tensor.rollup(["categoria_estabelecimento"], selecoes))
+        return com_valores(base, {'x': df["categoria_estabelecimento"], 'y': df["resgates"]})
+    if nome == 'week':
+        df = dados_dia_semana(tensor.rollup(["weekday"], selecoes))
+        return com_valores(base, {'x': df["weekday"], 'y': df["resgates"]})
+    if nome == 'heatmap':
+        hm = dados_heatmap(tensor.somar(["hour", "categoria_estabelecimento"], selecoes),
+                           tensor.rotulos["categoria_estabelecimento"])
+        return com_valores(base, {'x': hm.columns, 'y': hm.index, 'z': hm.to_numpy()})
+    if nome == 'age_coupon':
+        df = dados_faixa_etaria(tensor.rollup(["tipo_cupom", "faixa_etaria"], selecoes), None)
+        tipos = set(df["tipo_cupom"].astype(object))
+        if not tipos <= {traco.get("name") for traco in base["data"]}:
+            return criar_grafico_faixa_etaria(df, None)
+        # Um traço por tipo de cupom que sobrou na seleção, com a cor da figura sem seleção
+        base = {**base, "data": [traco for traco in base["data"] if traco.get("name") in tipos]}
+        tracos = []
+        for traco in base["data"]:
+            linhas = df[df["tipo_cupom"] == traco["name"]]
+            tracos.append({'x': linhas["faixa_etaria"], 'y': linhas["resgates"],
+                           'customdata': np.full((len(linhas), 1), traco["name"], dtype=object)})
+        return com_valores(base, *tracos)
+    if nome == 'ht':
+        pivot = dados_segmento_tipo(tensor.rollup(["categoria_estabelecimento", "tipo_cupom"], selecoes))
+        return com_valores(base, {'x': pivot.columns, 'y': pivot.index, 'z': pivot.to_numpy()})
+    raise KeyError(nome)
+
+# Filtros da página e saídas que dependem de cada um deles ('cruzado' = seleção
+# feita nos outros gráficos, ver chave_cruzada)
+FILTROS = ('categoria', 'tipo_cupom', 'bairro', 'inicio', 'fim')
+DEPENDENCIAS = {
+    'kpis': FILTROS,
+    'resg_seg': FILTROS + ('cruzado',),
+    'week': FILTROS + ('cruzado',),
+    'heatmap': FILTROS + ('cruzado',),
+    'age_coupon': FILTROS + ('cruzado',),
+    'ht': FILTROS + ('cruzado',),
+    'devices': (),  # Base de pedestres inteira: não depende dos filtros
+}
+
+# Gráficos atualizados pelos filtros: nome -> id do dcc.Graph (cada um com seu callback)
+GRAFICOS = {
+    'resg_seg': 'graph-resg-seg',
+    'week': 'graph-week',
+    'heatmap': 'graph-heatmap',
+    'age_coupon': 'graph-age-coupon',
+    'ht': 'graph-ht',
+}
+
+@lru_cache(maxsize=16)
+def _fatia_cubo(versao, filtros):
+    return obter_cubo().fatiar(**dict(filtros))
+
+@lru_cache(maxsize=16)
+def _usuarios_filtrados(versao, filtros):
+    return registro.get("trans_agregados").filtrar(**dict(filtros), tabelas=("usuarios",)).usuarios
+
+def fatia_cubo(filtros):
+    """Fatia do cubo de um estado dos filtros, compartilhada pelos callbacks do mesmo clique"""
+    return _fatia_cubo(registro.versao, normalizar_filtros(filtros))
+
+def usuarios_filtrados(filtros):
+    """Agregado de usuários de um estado dos filtros, compartilhado pelos callbacks"""
+    return _usuarios_filtrados(registro.versao, normalizar_filtros(filtros))
+
+def construir_grafico(nome, filtros, selecoes=None):
+    """
+    Monta uma figura da página (chaves de DEPENDENCIAS) para um estado dos filtros.
+
+    Com 'selecoes' (dimensão -> valores clicados nos outros gráficos), a figura
+    vem do tensor do cross-filter.
+    """
+    if selecoes:
+        return construir_grafico_cruzado(nome, filtros, selecoes)
+    if nome == 'resg_seg':
+        return criar_grafico_resgates_segmento(fatia_cubo(filtros).rollup(["categoria_estabelecimento"]))
+    if nome == 'week':
+        return criar_grafico_dia_semana(fatia_cubo(filtros).rollup(["weekday"]))
+    if nome == 'heatmap':
+        return criar_grafico_heatmap(*contar_hora_categoria(fatia_cubo(filtros), **filtros))
+    if nome == 'age_coupon':
+        return criar_grafico_faixa_etaria(usuarios_filtrados(filtros), None)
+    if nome == 'ht':
+        return criar_grafico_segmento_tipo(
+            fatia_cubo(filtros).rollup(["categoria_estabelecimento", "tipo_cupom"]))
+    if nome == 'devices':
+        return criar_grafico_dispositivos(registro.get("pedestres"))
+    raise KeyError(nome)
+
+def obter_graficos(nomes, categoria='all', tipo_cupom='all', bairro='all', inicio=None, fim=None):
+    """
+    Figuras da página para um estado dos filtros.
+
+    Cada figura fica no cache de figuras com a chave restrita aos filtros de
+    que depende (DEPENDENCIAS), então figuras independentes dos filtros são
+    montadas uma vez por versão dos dados.
+
+    Args:
+        nomes: Figuras desejadas (chaves de DEPENDENCIAS)
+
+    Returns:
+        Dicionário nome -> figura em dict
+    """
+    filtros = {'categoria': categoria, 'tipo_cupom': tipo_cupom, 'bairro': bairro,
+               'inicio': inicio, 'fim': fim}
+    # Sem seleção nos gráficos
+    estado = dict(filtros, cruzado=None)
+    return {
+        nome: cache_figuras.obter("ceo-" + nome,
+                                  {f: estado[f] for f in DEPENDENCIAS[nome]},
+                                  registro.versao, lambda nome=nome: construir_grafico(nome, filtros))
+        for nome in nomes
+    }
+
 # ==================== KPI CARDS ====================
-def create_kpi_card(title, value, icon, color):
+def create_kpi_card(title, value, icon, color, id_valor=None):
+    # id_valor permite atualizar só o valor do card (modo de filtros no navegador)
+    extra = {'id': id_valor} if id_valor else {}
     return dbc.Card([
         dbc.CardBody([
             html.Div([
                 html.I(className=f"fas fa-{icon} fa-2x", style={'color': color}),
                 html.H4(title, className="text-muted mb-0"),
                 html.H2(value, className="font-weight-bold mb-0",
-                       style={'color': color})
+                       style={'color': color}, **extra)
             ])
         ])
     ], className="text-center mb-3", style={'border-left': f'4px solid {color}'})
 
 # Criar KPIs iniciais
-kpi_cards = dbc.Row([
-    dbc.Col(create_kpi_card(
-        "Resgates Totais",
-        f"{len(df_trans):,}",
-        "ticket-alt",
-        COLORS['primary']
-    ), xs=12, sm=6, md=3, className="mb-3"),
-
-    dbc.Col(create_kpi_card(
-        "Usuários Ativos",
-        f"{df_trans['celular'].nunique():,}",
-        "users",
-        COLORS['success']
-    ), xs=12, sm=6, md=3, className="mb-3"),
-
-    dbc.Col(create_kpi_card(
-        "Estabelecimentos",
-        f"{df_trans['nome_estabelecimento'].nunique()}",
-        "store",
-        COLORS['warning']
-    ), xs=12, sm=6, md=3, className="mb-3"),
-
-    dbc.Col(create_kpi_card(
-        "Ticket Médio",
-        f"R$ {df_trans['valor_cupom'].mean():.2f}",
-        "dollar-sign",
-        COLORS['info']
-    ), xs=12, sm=6, md=3, className="mb-3"),
-], className="mb-4 g-3")  # g-3 adiciona espaçamento entre colunas
-
-# ==================== FILTROS ====================
-filtros_card = dbc.Card([
-    dbc.CardHeader([
-        html.H5("🔍 Filtros Avançados", className="mb-0"),
-    ]),
-    dbc.CardBody([
-        dbc.Row([
-            dbc.Col([
-                html.Label("Categoria", className="font-weight-bold"),
-                dbc.Select(
-                    id='filtro-categoria',
-                    options=[{'label': 'Todas', 'value': 'all'}] +
-                            [{'label': c, 'value': c} for c in categorias],
-                    value='all'
-                )
-            ], xs=12, sm=6, md=3, className="mb-3"),
-            dbc.Col([
-                html.Label("Tipo de Cupom", className="font-weight-bold"),
-                dbc.Select(
-                    id='filtro-tipo-cupom',
-                    options=[{'label': 'Todos', 'value': 'all'}] +
-                            [{'label': t, 'value': t} for t in tipos_cupom],
-                    value='all'
-                )
-            ], xs=12, sm=6, md=2, className="mb-3"),
-            dbc.Col([
-                html.Label("Bairro", className="font-weight-bold"),
-                dbc.Select(
-                    id='filtro-bairro',
-                    options=[{'label': 'Todos', 'value': 'all'}] +
-                            [{'label': b, 'value': b} for b in bairros],
-                    value='all'
-                )
-            ], xs=12, sm=6, md=2, className="mb-3"),
-            dbc.Col([
-                html.Label("Período", className="font-weight-bold"),
-                dcc.DatePickerRange(
-                    id='filtro-data',
-                    start_date=df_trans['data'].min(),
-                    end_date=df_trans['data'].max(),
-                    display_format='DD/MM/YYYY',
-                    style={'width': '100%'}
-                )
-            ], xs=12, sm=6, md=3, className="mb-3"),
-            dbc.Col([
-                html.Label("\u00A0", className="font-weight-bold"),
-                dbc.Button("Aplicar Filtros", id='botao-aplicar', color="primary", className="w-100 mt-2")
-            ], xs=12, sm=6, md=2, className="mb-3")
-        ], className="mb-3 align-items-end"),
-    ])
-], className="mb-4")
-
-# ==================== GRÁFICOS INICIAIS ====================
-# Criar gráficos iniciais
-fig_resg_seg = criar_grafico_resgates_segmento(df_trans)
-fig_week = criar_grafico_dia_semana(df_trans)
-fig_heatmap = criar_grafico_heatmap(df_trans)
-fig_age_coupon = criar_grafico_faixa_etaria(df_trans, df_players)
-fig_ht = criar_grafico_segmento_tipo(df_trans)
-fig_devices = criar_grafico_dispositivos(df_pedestres)
-
-# ==================== LAYOUT FINAL ====================
-layout = html.Div([
-    html.H1("Dashboard CEO - Análise Estratégica",
-            style={'color': COLORS['primary']}),
-    html.P("Visão consolidada de resgates totais, usuários e estabelecimentos",
-            className="text-muted lead mb-4"),
-    html.Hr(),
-
-    # KPIs
-    html.Div(id='kpi-cards', children=kpi_cards),
-
-    # Filtros
-    filtros_card,
-
-    # Botão de Gerar Relatório
-    #gerar_layout_botao(),
-    html.Div([
-        gerar_layout_botao_ceo(),
-    ], className="mb-4"),
-
-    # Gráficos
-    dbc.Container([
-        dbc.Row([
-            dbc.Col(dbc.Card([
-                dbc.CardBody(dcc.Graph(id="graph-resg-seg", figure=fig_resg_seg))
-            ]), xs=12, md=7, className="mb-3"),
-            dbc.Col(dbc.Card([
-                dbc.CardBody(dcc.Graph(id="graph-week", figure=fig_week))
-            ]), xs=12, md=5, className="mb-3"),
-        ], className="mb-4"),
-
-        dbc.Row([
-            dbc.Col(dbc.Card([
-                dbc.CardBody(dcc.Graph(id="graph-heatmap", figure=fig_heatmap))
-            ]), xs=12, md=8, className="mb-3"),
-            dbc.Col(dbc.Card([
-                dbc.CardBody(dcc.Graph(id="graph-age-coupon", figure=fig_age_coupon))
-            ]), xs=12, md=4, className="mb-3"),
-        ], className="mb-4"),
-
-        dbc.Row([
-            dbc.Col(dbc.Card([
-                dbc.CardBody(dcc.Graph(id="graph-ht", figure=fig_ht))
-            ]), xs=12, md=6, className="mb-3"),
-            dbc.Col(dbc.Card([
-                dbc.CardBody(dcc.Graph(id="graph-devices", figure=fig_devices))
-            ]), xs=12, md=6, className="mb-3"),
-        ], className="mb-4"),
-    ], fluid=True)
-], className="p-3")
-
-# ==================== CALLBACK ÚNICO ====================
-@app.callback(
-    [Output('kpi-cards', 'children'),
-     Output('graph-resg-seg', 'figure'),
-     Output('graph-week', 'figure'),
-     Output('graph-heatmap', 'figure'),
-     Output('graph-age-coupon', 'figure'),
-     Output('graph-ht', 'figure'),
-     Output('graph-devices', 'figure')],
-    [Input('botao-aplicar', 'n_clicks')],
-    [State('filtro-categoria', 'value'),
-     State('filtro-tipo-cupom', 'value'),
-     State('filtro-bairro', 'value'),
-     State('filtro-data', 'start_date'),
-     State('filtro-data', 'end_date')]
-)
-def atualizar_dashboard(n_clicks, categoria, tipo_cupom, bairro, start_date, end_date):
-    if n_clicks is None or n_clicks == 0:
-        # Não fazer nada se nenhum clique foi feito
-        from dash import no_update
-        return no_update, no_update, no_update, no_update, no_update, no_update, no_update
-
-    # Aplicar filtros
-    df_filtrado = df_trans.copy()
-
-    if categoria != 'all':
-        df_filtrado = df_filtrado[df_filtrado['categoria_estabelecimento'] == categoria]
+def criar_kpis_iniciais(agregados, cubo):
+    return dbc.Row([
+        dbc.Col(create_kpi_card(
+            "Resgates Totais",
+            f"{cubo.total('transacoes'):,}",
+            "ticket-alt",
+            COLORS['primary'],
+            'kpi-resgates'
+        ), xs=12, sm=6, md=3, className="mb-3"),
 
-    if tipo_cupom != 'all':
-        df_filtrado = df_filtrado[df_filtrado['tipo_cupom'] == tipo_cupom]
+        dbc.Col(create_kpi_card(
+            "Usuários Ativos",
+            f"{agregados.contar_usuarios():,}",
+            "users",
+            COLORS['success'],
+            'kpi-usuarios'
+        ), xs=12, sm=6, md=3, className="mb-3"),
 
-    if bairro != 'all':
-        df_filtrado = df_filtrado[df_filtrado['bairro_estabelecimento'] == bairro]
+        dbc.Col(create_kpi_card(
+            "Estabelecimentos",
+            f"{cubo.lojas_distintas()}",
+            "store",
+            COLORS['warning'],
+            'kpi-estabelecimentos'
+        ), xs=12, sm=6, md=3, className="mb-3"),
 
-    if start_date and end_date:
-        df_filtrado = df_filtrado[
-            (df_filtrado['data'] >= pd.to_datetime(start_date)) &
-            (df_filtrado['data'] <= pd.to_datetime(end_date))
-        ]
+        dbc.Col(create_kpi_card(
+            "Ticket Médio",
+            f"R$ {cubo.ticket_medio:.2f}",
+            "dollar-sign",
+            COLORS['info'],
+            'kpi-ticket'
+        ), xs=12, sm=6, md=3, className="mb-3"),
+    ], className="mb-4 g-3")  # g-3 adiciona espaçamento entre colunas
 
-    # Criar KPIs
-    total_resgates = len(df_filtrado)
-    usuarios_ativos = df_filtrado['celular'].nunique()
-    estabelecimentos = df_filtrado['nome_estabelecimento'].nunique()
-    ticket_medio = df_filtrado['valor_cupom'].mean()
+def criar_kpis_filtrados(categoria='all', tipo_cupom='all', bairro='all', inicio=None, fim=None):
+    """KPIs da página para um estado dos filtros (fatia do cubo e sketches de usuários)"""
+    cubo = fatia_cubo({'categoria': categoria, 'tipo_cupom': tipo_cupom, 'bairro': bairro,
+                       'inicio': inicio, 'fim': fim})
+    total_resgates = cubo.total('transacoes')
+    usuarios_ativos = registro.get("trans_agregados").contar_usuarios(
+        categoria=categoria, tipo_cupom=tipo_cupom, bairro=bairro, inicio=inicio, fim=fim)
+    estabelecimentos = cubo.lojas_distintas()
+    ticket_medio = cubo.ticket_medio
 
-    kpi_cards = dbc.Row([
+    return dbc.Row([
         dbc.Col(create_kpi_card(
             "Resgates Totais",
             f"{total_resgates:,}",
             "ticket-alt",
-            COLORS['primary']
+            COLORS['primary'],
+            'kpi-resgates'
         ), width=3),
         dbc.Col(create_kpi_card(
             "Usuários Ativos",
             f"{usuarios_ativos:,}",
             "users",
-            COLORS['success']
+            COLORS['success'],
+            'kpi-usuarios'
         ), width=3),
         dbc.Col(create_kpi_card(
             "Estabelecimentos",
             f"{estabelecimentos}",
             "store",
-            COLORS['warning']
+            COLORS['warning'],
+            'kpi-estabelecimentos'
         ), width=3),
         dbc.Col(create_kpi_card(
             "Ticket Médio",
             f"R$ {ticket_medio:.2f}",
             "dollar-sign",
-            COLORS['info']
+            COLORS['info'],
+            'kpi-ticket'
         ), width=3),
     ], className="mb-4")
 
-    # Criar gráficos com dados filtrados
-    fig_resg_seg = criar_grafico_resgates_segmento(df_filtrado)
-    fig_week = criar_grafico_dia_semana(df_filtrado)
-    fig_heatmap = criar_grafico_heatmap(df_filtrado)
-    fig_age_coupon = criar_grafico_faixa_etaria(df_filtrado, df_players)
-    fig_ht = criar_grafico_segmento_tipo(df_filtrado)
-    fig_devices = criar_grafico_dispositivos(df_pedestres)
+# ==================== FILTROS ====================
+def criar_filtros(agregados):
+    # Preparação dos dados para filtros interativos
+    # Extraímos valores únicos e ordenamos para garantir consistência na interface
+    categorias = agregados.distintos('categoria_estabelecimento')
+    tipos_cupom = agregados.distintos('tipo_cupom')
+    bairros = agregados.distintos('bairro_estabelecimento')
+
+    return dbc.Card([
+        dbc.CardHeader([
+            html.H5("🔍 Filtros Avançados", className="mb-0"),
+        ]),
+        dbc.CardBody([
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Categoria", className="font-weight-bold"),
+                    dbc.Select(
+                        id='filtro-categoria',
+                        options=[{'label': 'Todas', 'value': 'all'}] +
+                                [{'label': c, 'value': c} for c in categorias],
+                        value='all'
+                    )
+                ], xs=12, sm=6, md=3, className="mb-3"),
+                dbc.Col([
+                    html.Label("Tipo de Cupom", className="font-weight-bold"),
+                    dbc.Select(
+                        id='filtro-tipo-cupom',
+                        options=[{'label': 'Todos', 'value': 'all'}] +
+                                [{'label': t, 'value': t} for t in tipos_cupom],
+                        value='all'
+                    )
+                ], xs=12, sm=6, md=2, className="mb-3"),
+                dbc.Col([
+                    html.Label("Bairro", className="font-weight-bold"),
+                    dbc.Select(
+                        id='filtro-bairro',
+                        options=[{'label': 'Todos', 'value': 'all'}] +
+                                [{'label': b, 'value': b} for b in bairros],
+                        value='all'
+                    )
+                ], xs=12, sm=6, md=2, className="mb-3"),
+                dbc.Col([
+                    html.Label("Período", className="font-weight-bold"),
+                    dcc.DatePickerRange(
+                        id='filtro-data',
+                        start_date=agregados.data_min,
+                        end_date=agregados.data_max,
+                        display_format='DD/MM/YYYY',
+                        style={'width': '100%'}
+                    )
+                ], xs=12, sm=6, md=3, className="mb-3"),
+                dbc.Col([
+                    html.Label("\u00A0", className="font-weight-bold"),
+                    dbc.Button("Aplicar Filtros", id='botao-aplicar', color="primary", className="w-100 mt-2")
+                ], xs=12, sm=6, md=2, className="mb-3")
+            ], className="mb-3 align-items-end"),
+        ])
+    ], className="mb-4")
+
+# ==================== LAYOUT FINAL ====================
+def layout():
+    """Monta o layout da página, carregando os dados no primeiro acesso."""
+    agregados = registro.get("trans_agregados")
+    cubo = obter_cubo()
+
+    # Criar gráficos iniciais a partir do cubo e dos agregados de usuários
+    figuras = obter_graficos([nome for nome in DEPENDENCIAS if nome != 'kpis'])
+
+    return html.Div([
+        html.H1("Dashboard CEO - Análise Estratégica",
+                style={'color': COLORS['primary']}),
+        html.P("Visão consolidada de resgates totais, usuários e estabelecimentos",
+                className="text-muted lead mb-4"),
+        html.Hr(),
+
+        # KPIs
+        html.Div(id='kpi-cards', children=criar_kpis_iniciais(agregados, cubo)),
+
+        # Último estado de filtros aplicado (para recalcular só o que mudou)
+        dcc.Store(id='filtros-aplicados-ceo', data=estado_filtros(
+            {filtro: None for filtro in FILTROS})),
+
+        # Seleção feita nos gráficos (cross-filter): atual e a do clique anterior
+        dcc.Store(id='selecao-ceo', data={'atual': {}, 'anterior': {}}),
+
+        # Modo de filtros no navegador: versão atual do cubo e cópia da sessão
+        *([
+            dcc.Store(id='versao-cubo-ceo', data=obter_cubo_cliente()['versao']),
+            dcc.Store(id='pedido-cubo-ceo'),
+            dcc.Store(id='cubo-cliente-ceo', storage_type='session'),
+        ] if FILTROS_NO_CLIENTE else []),
+
+        # Filtros
+        criar_filtros(agregados),
+
+        # Botão de Gerar Relatório
+        #gerar_layout_botao(),
+        html.Div([
+            gerar_layout_botao_ceo(),
+        ], className="mb-4"),
+
+        # Seleção ativa nos gráficos (cross-filter, só com os filtros no servidor)
+        *([
+            html.Div([
+                html.Small(resumir_selecao({}), id='resumo-selecao-ceo', className="text-muted me-3"),
+                dbc.Button("Limpar seleção", id='botao-limpar-selecao', size="sm",
+                           color="secondary", outline=True),
+            ], className="d-flex align-items-center mb-3"),
+        ] if not FILTROS_NO_CLIENTE else []),
+
+        # Gráficos
+        dbc.Container([
+            dbc.Row([
+                dbc.Col(dbc.Card([
+                    dbc.CardBody(dcc.Graph(id="graph-resg-seg", figure=figuras['resg_seg']))
+                ]), xs=12, md=7, className="mb-3"),
+                dbc.Col(dbc.Card([
+                    dbc.CardBody(dcc.Graph(id="graph-week", figure=figuras['week']))
+                ]), xs=12, md=5, className="mb-3"),
+            ], className="mb-4"),
+
+            dbc.Row([
+                dbc.Col(dbc.Card([
+                    dbc.CardBody(dcc.Graph(id="graph-heatmap", figure=figuras['heatmap']))
+                ]), xs=12, md=8, className="mb-3"),
+                dbc.Col(dbc.Card([
+                    dbc.CardBody(dcc.Graph(id="graph-age-coupon", figure=figuras['age_coupon']))
+                ]), xs=12, md=4, className="mb-3"),
+            ], className="mb-4"),
+
+            dbc.Row([
+                dbc.Col(dbc.Card([
+                    dbc.CardBody(dcc.Graph(id="graph-ht", figure=figuras['ht']))
+                ]), xs=12, md=6, className="mb-3"),
+                dbc.Col(dbc.Card([
+                    dbc.CardBody(dcc.Graph(id="graph-devices", figure=figuras['devices']))
+                ]), xs=12, md=6, className="mb-3"),
+            ], className="mb-4"),
+        ], fluid=True)
+    ], className="p-3")
+
+# ==================== CALLBACKS ====================
+# Um callback para os KPIs (rápido, chega primeiro) e um por gráfico: o Dash
+# dispara todos no mesmo clique e o servidor os atende em paralelo, com as
+# fatias do cubo e dos usuários compartilhadas (fatia_cubo, usuarios_filtrados).
+ESTADOS_FILTROS = [
+    State('filtro-categoria', 'value'),
+    State('filtro-tipo-cupom', 'value'),
+    State('filtro-bairro', 'value'),
+    State('filtro-data', 'start_date'),
+    State('filtro-data', 'end_date'),
+    State('filtros-aplicados-ceo', 'data'),
+]
+
+def filtros_do_clique(categoria, tipo_cupom, bairro, start_date, end_date):
+    """Filtros da página a partir dos valores dos componentes"""
+    periodo = (start_date, end_date) if start_date and end_date else (None, None)
+    return {'categoria': categoria, 'tipo_cupom': tipo_cupom, 'bairro': bairro,
+            'inicio': periodo[0], 'fim': periodo[1]}
+
+def atualizar_kpis(n_clicks, categoria, tipo_cupom, bairro, start_date, end_date, anterior):
+    if n_clicks is None or n_clicks == 0:
+        # Não fazer nada se nenhum clique foi feito
+        return no_update, no_update
+
+    filtros = filtros_do_clique(categoria, tipo_cupom, bairro, start_date, end_date)
+    atual = estado_filtros(filtros)
+    kpis, = responder({'kpis': DEPENDENCIAS['kpis']}, anterior, atual,
+                      lambda nomes: {'kpis': criar_kpis_filtrados(**filtros)})
+    return kpis, atual
+
+if not FILTROS_NO_CLIENTE:
+    callback_tarefa(
+        app,
+        [Output('kpi-cards', 'children'),
+         Output('filtros-aplicados-ceo', 'data')],
+        [Input('botao-aplicar', 'n_clicks')],
+        ESTADOS_FILTROS,
+        chave="ceo-kpis",
+        segundo_plano=FILTROS_EM_SEGUNDO_PLANO
+    )(atualizar_kpis)
+
+def registrar_callback_grafico(nome, id_grafico):
+    """Callback de um gráfico: envia só o que mudou na figura (Patch) ou no_update"""
+    @callback_tarefa(
+        app,
+        Output(id_grafico, 'figure'),
+        [Input('botao-aplicar', 'n_clicks'),
+         Input('selecao-ceo', 'data')],
+        ESTADOS_FILTROS,
+        chave="ceo-" + nome,
+        segundo_plano=FILTROS_EM_SEGUNDO_PLANO
+    )
+    def atualizar_grafico(n_clicks, selecao, categoria, tipo_cupom, bairro, start_date, end_date,
+                          anterior):
+        selecoes = (selecao or {}).get('atual') or {}
+        if ctx.triggered_id == 'selecao-ceo':
+            # Clique em um gráfico: os filtros da página continuam os já aplicados
+            filtros = {f: (anterior or {}).get(f) for f in FILTROS}
+            anterior = dict(filtros, cruzado=chave_cruzada(selecao.get('anterior'), nome))
+        else:
+            if n_clicks is None or n_clicks == 0:
+                return no_update
+            filtros = filtros_do_clique(categoria, tipo_cupom, bairro, start_date, end_date)
+            if anterior is not None:
+                anterior = dict(anterior, cruzado=chave_cruzada(selecoes, nome))
+        atual = estado_filtros(dict(filtros, cruzado=chave_cruzada(selecoes, nome)))
+        return atualizar_figura(
+            "ceo-" + nome, DEPENDENCIAS[nome],
+            estado_filtros(anterior) if anterior is not None else None, atual, registro.versao,
+            lambda: construir_grafico(nome, filtros, combinar_selecoes(selecoes, excluir=nome)))
+    return atualizar_grafico
+
+# Gráficos montados no navegador no modo de filtros no cliente (a partir do cubo)
+GRAFICOS_CLIENTE = ('resg_seg', 'week', 'heatmap', 'ht')
+
+# Callbacks dos gráficos, por nome
+atualizar_graficos = {nome: registrar_callback_grafico(nome, id_grafico)
+                      for nome, id_grafico in GRAFICOS.items()
+                      if not (FILTROS_NO_CLIENTE and nome in GRAFICOS_CLIENTE)}
+
+# Cliques e seleções por área nos gráficos viram a seleção do cross-filter;
+# clicar de novo no mesmo ponto (ou desfazer a seleção) remove a do gráfico
+if not FILTROS_NO_CLIENTE:
+    # id do dcc.Graph -> nome do gráfico
+    NOMES_GRAFICOS = {id_grafico: nome for nome, id_grafico in GRAFICOS.items()}
+
+    @app.callback(
+        [Output('selecao-ceo', 'data'),
+         Output('resumo-selecao-ceo', 'children')],
+        [Input(GRAFICOS[nome], 'clickData') for nome in GRAFICOS]
+        + [Input(GRAFICOS[nome], 'selectedData') for nome in SELECAO_EM_AREA]
+        + [Input('botao-limpar-selecao', 'n_clicks')],
+        State('selecao-ceo', 'data'),
+        prevent_initial_call=True
+    )
+    def selecionar_nos_graficos(*valores):
+        selecao = valores[-1] or {}
+        selecoes = dict(selecao.get('atual') or {})
+        if ctx.triggered_id == 'botao-limpar-selecao':
+            if not selecoes:
+                return no_update, no_update
+            selecoes = {}
+        else:
+            nome = NOMES_GRAFICOS[ctx.triggered_id]
+            gatilho = ctx.triggered[0]
+            nova = selecao_dos_pontos(nome, (gatilho['value'] or {}).get('points', []))
+            repetida = selecoes.get(nome) == nova
+            if not nova or (repetida and gatilho['prop_id'].endswith('.clickData')):
+                if nome not in selecoes:
+                    return no_update, no_update
+                del selecoes[nome]
+            elif repetida:
+                return no_update, no_update
+            else:
+                selecoes[nome] = nova
+        return ({'atual': selecoes, 'anterior': selecao.get('atual') or {}},
+                resumir_selecao(selecoes))
+
+# ==================== FILTROS NO NAVEGADOR ====================
+# O cubo compacto vai para um dcc.Store de sessão (só quando a versão muda) e
+# os KPIs e gráficos do cubo são re-agregados por callbacks clientside
+# (assets/filtros_cliente.js). Usuários ativos, estabelecimentos e faixa
+# etária dependem dos dados por usuário ou por loja e continuam no servidor,
+# então o cubo enviado não cresce com o número de lojas; o preço é que cada
+# "Aplicar" ainda faz dois pedidos ao servidor (esses KPIs e o gráfico de
+# faixa etária). Se uma recarga dos dados deixar o cubo acima de
+# LIMITE_CUBO_CLIENTE, ele deixa de ser enviado até o servidor reiniciar (e
+# voltar ao modo de filtros no servidor).
+if FILTROS_NO_CLIENTE:
+    app.clientside_callback(
+        ClientsideFunction(namespace='ceo', function_name='pedir_cubo'),
+        Output('pedido-cubo-ceo', 'data'),
+        Input('versao-cubo-ceo', 'data'),
+        State('cubo-cliente-ceo', 'data'),
+    )
+
+    @app.callback(
+        Output('cubo-cliente-ceo', 'data'),
+        Input('pedido-cubo-ceo', 'data'),
+        prevent_initial_call=True
+    )
+    def enviar_cubo(versao):
+        if versao is None:
+            return no_update
+        if not cubo_cliente_cabe():
+            logger.warning("cubo compacto acima de LIMITE_CUBO_CLIENTE; não enviado")
+            return no_update
+        return obter_cubo_cliente()
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='ceo', function_name='filtrar'),
+        [Output(GRAFICOS[nome], 'figure') for nome in GRAFICOS_CLIENTE]
+        + [Output('kpi-resgates', 'children'),
+           Output('kpi-ticket', 'children')],
+        Input('botao-aplicar', 'n_clicks'),
+        ESTADOS_FILTROS[:-1]
+        + [State('cubo-cliente-ceo', 'data')]
+        + [State(GRAFICOS[nome], 'figure') for nome in GRAFICOS_CLIENTE],
+        prevent_initial_call=True
+    )
 
-    return kpi_cards, fig_resg_seg, fig_week, fig_heatmap, fig_age_coupon, fig_ht, fig_devices
\ No newline at end of file
+    @app.callback(
+        [Output('kpi-usuarios', 'children'),
+         Output('kpi-estabelecimentos', 'children'),
+         Output('filtros-aplicados-ceo', 'data')],
+        [Input('botao-aplicar', 'n_clicks')],
+        ESTADOS_FILTROS,
+        prevent_initial_call=True
+    )
+    def atualizar_kpis_servidor(n_clicks, categoria, tipo_cupom, bairro, start_date, end_date,
+                                anterior):
+        if not n_clicks:
+            return no_update, no_update, no_update
+        filtros = filtros_do_clique(categoria, tipo_cupom, bairro, start_date, end_date)
+        atual = estado_filtros(filtros)
+        usuarios, estabelecimentos = responder(
+            {'usuarios': DEPENDENCIAS['kpis'], 'estabelecimentos': DEPENDENCIAS['kpis']},
+            anterior, atual, lambda nomes: {
+                'usuarios': f"{registro.get('trans_agregados').contar_usuarios(**filtros):,}",
+                'estabelecimentos': f"{fatia_cubo(filtros).lojas_distintas()}"})
+        return usuarios, estabelecimentos, atual
@@ -3,7 +3,8 @@
 # =============================================================================
 
 # Importação das bibliotecas e componentes necessários
-from dash import dcc, html  # Componentes core do Dash
+from functools import lru_cache  # Fatias compartilhadas entre os callbacks
+from dash import ctx, dcc, html, no_update  # Componentes core do Dash
 import dash_bootstrap_components as dbc  # Componentes Bootstrap
 from dash.dependencies import Input, Output, State  # Para callbacks interativos
 from app import app  # Instância principal da aplicação
@@ -13,11 +14,22 @@ from utils.graphs import (
     criar_grafico_receita_segmento,  # Análise de receita por segmento
     criar_grafico_scatter,           # Gráfico de dispersão para análises correlacionais
     criar_grafico_ticket_medio,      # Análise de ticket médio
-    criar_grafico_distribuicao       # Distribuição de valores
+    ranking_ticket_medio,            # Lojas ordenadas pelo ticket médio
+    paginas_ticket_medio,            # Número de páginas do ranking de lojas
+    criar_grafico_distribuicao,      # Distribuição de valores
+    cache_figuras,                   # Cache das figuras por estado dos filtros
+    normalizar_filtros               # Chave de um estado dos filtros
 )
 
-# Importação dos dados financeiros processados
-from utils.db_utils import df_massa, df_trans  # Dataframes de transações e valores
+# Registro dos dados financeiros processados (carregados sob demanda)
+from utils.db_utils import registro
+from utils.busca_lojas import IndiceLojas, normalizar_nome
+from utils.dimensoes import DimensaoLojas
+from utils.indice import IndiceChaves, intervalo_periodo
+from utils.moeda import reais
+from utils.receita_diaria import ReceitaDiaria
+from utils.saidas import atualizar_figura, estado_filtros
+from utils.tarefas import FILTROS_EM_SEGUNDO_PLANO, callback_tarefa
 import pandas as pd  # Para manipulação adicional de dados
 
 # Importação do componente de geração de relatórios
@@ -36,14 +48,6 @@ COLORS = {
     'info': '#17a2b8'      # Azul para informações complementares
 }
 
-# Preparação e normalização dos dados temporais
-# Convertemos as datas para o formato datetime do pandas para permitir:
-# - Cálculos temporais (períodos, durações)
-# - Agrupamentos por período
-# - Análises de tendências
-df_trans['data'] = pd.to_datetime(df_trans['data'], format='%d/%m/%Y')
-df_massa['data_captura'] = pd.to_datetime(df_massa['data_captura'], format='%d/%m/%Y')
-
 # ==================== KPI CARDS FINANCEIROS ====================
 def create_financial_kpi(title, value, subtitle, icon, color):
     """Card KPI financeiro"""
@@ -66,114 +70,187 @@ def create_financial_kpi(title, value, subtitle, icon, color):
         'border-left': f'5px solid {color}',
     })
 
+# Meta de receita de cada mês (R$)
+META_MENSAL = 1_000_000
+
+MESES = ("janeiro", "fevereiro", "março", "abril", "maio", "junho", "julho",
+         "agosto", "setembro", "outubro", "novembro", "dezembro")
+
+def obter_receita_diaria():
+    """Rollup diário de receita por loja (utils.receita_diaria) da versão atual dos dados"""
+    return registro.derivado("receita_diaria", lambda: ReceitaDiaria.de_tabelas(
+        registro.get("trans_agregados").fatos, registro.get("massa")))
+
 # Calcular KPIs iniciais
-receita_total = df_trans['valor_cupom'].sum()
-receita_liquida = df_trans['valor_cupom'].sum() - df_trans['repasse_picmoney'].sum()
-margem_operacional = (receita_liquida / receita_total) * 100 if receita_total > 0 else 0
-ticket_medio = df_trans['valor_cupom'].mean()
-cupom_medio = df_trans['valor_cupom'].mean()
+def calcular_kpis(totais):
+    """Calcula receita total, receita líquida, margem e ticket médio (em reais) a partir dos totais do rollup"""
+    # Contas em centavos inteiros; a conversão para reais fica para o fim
+    receita_total = totais['valor_cupom']
+    receita_liquida = receita_total - totais['repasse_picmoney']
+    margem_operacional = (receita_liquida / receita_total) * 100 if receita_total > 0 else 0
+    ticket_medio = reais(receita_total) / totais['valor_cupom_n'] if totais['valor_cupom_n'] else float('nan')
+    return reais(receita_total), reais(receita_liquida), margem_operacional, ticket_medio
+
+def calcular_meta(pontos=None, fim=None):
+    """
+    Progresso da meta do mês: receita do primeiro dia do mês de 'fim' (ou do
+    último dia com dados) até esse dia, nos pontos (loja, segmento) do filtro.
+
+    Returns:
+        Tupla (percentual da meta, texto do card)
+    """
+    receita = obter_receita_diaria()
+    dia = pd.Timestamp(fim) if fim else receita.ultimo_dia
+    if dia is None:
+        return 0, "Sem dados para a meta mensal"
+    percentual_meta = reais(receita.mes_ate(dia, pontos)['valor_cupom']) / META_MENSAL * 100
+    meta_text = (f"Atingido {percentual_meta:.1f}% da meta de R$ 1M de "
+                 f"{MESES[dia.month - 1]}/{dia.year} (até {dia:%d/%m})")
+    return percentual_meta, meta_text
+
+def kpis_e_meta(filtros):
+    """KPIs e meta do mês de um estado dos filtros, a partir do rollup diário"""
+    filtros = dict(normalizar_filtros(filtros))
+    pontos = obter_dimensao_lojas().resolver(filtros['segmento'], filtros['loja'])
+    totais = obter_receita_diaria().totais(pontos, filtros['inicio'], filtros['fim'])
+    return calcular_kpis(totais), calcular_meta(pontos, filtros['fim'])
 
 # KPIs iniciais
-kpi_cards = dbc.Row([
-    dbc.Col(create_financial_kpi(
-        "Receita Total",
-        f"R$ {receita_total:,.2f}",
-        "Todos os dados",
-        "chart-line",
-        COLORS['success']
-    ), xs=12, sm=6, md=3, className="mb-3 g-3"),
-
-    dbc.Col(create_financial_kpi(
-        "Receita Líquida",
-        f"R$ {receita_liquida:,.2f}",
-        "Todos os dados",
-        "chart-line",
-        COLORS['success']
-    ), xs=12, sm=6, md=3, className="mb-3 g-3"),
-
-    dbc.Col(create_financial_kpi(
-        "Margem Operacional",
-        f"{margem_operacional:,.2f}%",
-        "Todos os dados",
-        "percent",
-        COLORS['info']
-    ), xs=12, sm=6, md=3, className="mb-3 g-3"),
+def criar_kpis_iniciais(receita_total, receita_liquida, margem_operacional, ticket_medio):
+    return dbc.Row([
+        dbc.Col(create_financial_kpi(
+            "Receita Total",
+            f"R$ {receita_total:,.2f}",
+            "Todos os dados",
+            "chart-line",
+            COLORS['success']
+        ), xs=12, sm=6, md=3, className="mb-3 g-3"),
+
+        dbc.Col(create_financial_kpi(
+            "Receita Líquida",
+            f"R$ {receita_liquida:,.2f}",
+            "Todos os dados",
+            "chart-line",
+            COLORS['success']
+        ), xs=12, sm=6, md=3, className="mb-3 g-3"),
+
+        dbc.Col(create_financial_kpi(
+            "Margem Operacional",
+            f"{margem_operacional:,.2f}%",
+            "Todos os dados",
+            "percent",
+            COLORS['info']
+        ), xs=12, sm=6, md=3, className="mb-3 g-3"),
     
-    dbc.Col(create_financial_kpi(
-        "Ticket Médio",
-        f"R$ {ticket_medio:.2f}",
-        "Por transação",
-        "receipt",
-        COLORS['info']
-    ), xs=12, sm=6, md=3, className="mb-3 g-3"),
-], className="mb-4")
+        dbc.Col(create_financial_kpi(
+            "Ticket Médio",
+            f"R$ {ticket_medio:.2f}",
+            "Por transação",
+            "receipt",
+            COLORS['info']
+        ), xs=12, sm=6, md=3, className="mb-3 g-3"),
+    ], className="mb-4")
 
 # ==================== FILTROS FINANCEIROS ====================
-# Extrair segmentos e lojas para filtros
-segmentos = sorted(df_trans['categoria_estabelecimento'].dropna().unique())
-lojas = sorted(df_trans['nome_estabelecimento'].dropna().unique())
+def obter_dimensao_lojas():
+    """Dimensão conformada de lojas e segmentos (transações e lojas_valores) da versão atual dos dados"""
+    return registro.derivado("dimensao_lojas", lambda: DimensaoLojas.de_tabelas(
+        registro.get("trans_agregados").fatos, registro.get("massa")))
 
-filtros_financeiros = dbc.Card([
-    dbc.CardHeader([
-        html.Div([
-            html.H5("💰 Filtros Financeiros", className="mb-0 d-inline"),
-        ])
-    ]),
-    dbc.CardBody([
-        dbc.Row([
-            dbc.Col([
-                html.Label("Segmento de Loja", className="font-weight-bold"),
-                dbc.Select(
-                    id='filtro-segmento',
-                    options=[{'label': 'Todos os Segmentos', 'value': 'all'}] + 
-                            [{'label': s, 'value': s} for s in segmentos],
-                    value='all'
-                )
-            ], xs=12, sm=6, md=3, className="mb-3"),
+def obter_indice_lojas():
+    """Índice de busca das lojas da dimensão conformada"""
+    return registro.derivado("indice_lojas", lambda: IndiceLojas.de_dimensao(obter_dimensao_lojas()))
+
+def opcoes_lojas(busca=None, selecionada='all'):
+    """
+    Opções do filtro de loja para o texto digitado: só as lojas encontradas
+    (ver utils.busca_lojas), mais a loja já selecionada.
+    """
+    lojas = obter_indice_lojas().buscar(busca)
+    if selecionada not in (None, 'all') and selecionada not in lojas:
+        lojas = [selecionada] + lojas
+    # 'search' sem acentos: o Dropdown também filtra as opções no navegador
+    return [{'label': 'Todas as Lojas', 'value': 'all'}] + [
+        {'label': l, 'value': l, 'search': f"{l} {normalizar_nome(l)}"} for l in lojas]
+
+def criar_filtros(agregados):
+    # Segmentos da dimensão conformada (as lojas são buscadas sob demanda)
+    segmentos = obter_dimensao_lojas().nomes_segmentos()
+
+    return dbc.Card([
+        dbc.CardHeader([
+            html.Div([
+                html.H5("💰 Filtros Financeiros", className="mb-0 d-inline"),
+            ])
+        ]),
+        dbc.CardBody([
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Segmento de Loja", className="font-weight-bold"),
+                    dbc.Select(
+                        id='filtro-segmento',
+                        options=[{'label': 'Todos os Segmentos', 'value': 'all'}] + 
+                                [{'label': s, 'value': s} for s in segmentos],
+                        value='all'
+                    )
+                ], xs=12, sm=6, md=3, className="mb-3"),
             
-            dbc.Col([
-                html.Label("Loja Específica", className="font-weight-bold"),
-                dbc.Select(
-                    id='filtro-loja',
-                    options=[{'label': 'Todas as Lojas', 'value': 'all'}] + 
-                            [{'label': l, 'value': l} for l in lojas[:50]],
-                    value='all'
-                )
-            ], xs=12, sm=6, md=3, className="mb-3"),
+                dbc.Col([
+                    html.Label("Loja Específica", className="font-weight-bold"),
+                    dcc.Dropdown(
+                        id='filtro-loja',
+                        options=opcoes_lojas(),
+                        value='all',
+                        clearable=False,
+                        placeholder="Digite para buscar uma loja..."
+                    )
+                ], xs=12, sm=6, md=3, className="mb-3"),
             
-            dbc.Col([
-                html.Label("Período de Análise", className="font-weight-bold"),
-                dcc.DatePickerRange(
-                    id='filtro-data-cfo',
-                    start_date=df_trans['data'].min(),
-                    end_date=df_trans['data'].max(),
-                    display_format='DD/MM/YYYY',
-                    style={'width': '100%'}
-                )
-            ], xs=12, sm=6, md=4, className="mb-3"),
+                dbc.Col([
+                    html.Label("Período de Análise", className="font-weight-bold"),
+                    dcc.DatePickerRange(
+                        id='filtro-data-cfo',
+                        start_date=agregados.data_min,
+                        end_date=agregados.data_max,
+                        display_format='DD/MM/YYYY',
+                        style={'width': '100%'}
+                    )
+                ], xs=12, sm=6, md=4, className="mb-3"),
             
-            dbc.Col([
-                html.Label("\u00A0", className="font-weight-bold"),
-                dbc.Button(
-                    [html.I(className="fas fa-filter mr-2"), "Aplicar Filtros"],
-                    id='botao-aplicar-cfo',
-                    color="primary",
-                    className="w-100"
-                )
-            ], xs=12, sm=6, md=2, className="mb-3"),
-        ], className="align-items-end"),
-    ])
-], className="mb-4 shadow-sm")
+                dbc.Col([
+                    html.Label("\u00A0", className="font-weight-bold"),
+                    dbc.Button(
+                        [html.I(className="fas fa-filter mr-2"), "Aplicar Filtros"],
+                        id='botao-aplicar-cfo',
+                        color="primary",
+                        className="w-100"
+                    )
+                ], xs=12, sm=6, md=2, className="mb-3"),
+            ], className="align-items-end"),
+        ])
+    ], className="mb-4 shadow-sm")
 
-# ==================== GRÁFICOS INICIAIS ====================
-# Criar gráficos iniciais
-fig_receita_segmento = criar_grafico_receita_segmento(df_trans)
-fig_scatter = criar_grafico_scatter(df_massa)
-fig_ticket_loja = criar_grafico_ticket_medio(df_massa)
-fig_distribuicao = criar_grafico_distribuicao(df_trans)
+# ==================== GRÁFICOS ====================
+# Filtros da página; todas as saídas dependem de todos eles
+FILTROS = ('segmento', 'loja', 'inicio', 'fim')
+
+# Gráficos atualizados pelos filtros: nome -> id do dcc.Graph (cada um com seu callback)
+GRAFICOS = {
+    'receita_segmento': 'graph-receita-segmento',
+    'scatter': 'graph-scatter',
+    'ticket_loja': 'graph-ticket-loja',
+    'distribuicao': 'graph-distribuicao',
+}
+
+# Cor dos traços de cada gráfico (o scatter mantém as cores próprias)
+CORES_GRAFICOS = {
+    'receita_segmento': COLORS['success'],
+    'ticket_loja': COLORS['info'],
+    'distribuicao': COLORS['warning'],
+}
 
-# Estilizar gráficos iniciais
-for fig in [fig_receita_segmento, fig_scatter, fig_ticket_loja, fig_distribuicao]:
+def estilizar(nome, fig):
+    """Aplica o estilo da página a um gráfico financeiro"""
     fig.update_layout(
         template='plotly_white',
         font=dict(family="Arial, sans-serif", size=12),
@@ -184,204 +261,309 @@ for fig in [fig_receita_segmento, fig_scatter, fig_ticket_loja, fig_distribuicao
         hovermode='x unified',
         margin=dict(l=60, r=40, t=60, b=60)
     )
+    if nome in CORES_GRAFICOS:
+        fig.update_traces(marker_color=CORES_GRAFICOS[nome])
+    return fig
+
+def obter_indice_pontos_massa():
+    """Listas invertidas de id_ponto de lojas_valores"""
+    return registro.derivado("indice_pontos_massa", lambda: IndiceChaves(
+        registro.get("massa")['id_ponto'].to_numpy()))
+
+def filtrar_massa(segmento='all', loja='all', inicio=None, fim=None):
+    """Linhas de lojas_valores no período, segmento e loja selecionados"""
+    df_massa = registro.get("massa")
+    # Período: intervalo contíguo por busca binária em df_massa (ordenado por data)
+    a, b = intervalo_periodo(df_massa, 'data_captura', inicio, fim)
+    # Segmento e loja viram um conjunto de pontos (loja, segmento) da dimensão
+    # conformada; cada linha vale pelo seu próprio tipo de loja
+    pontos = obter_dimensao_lojas().resolver(segmento, loja)
+    if pontos is None:
+        return df_massa.iloc[a:b]
+    return df_massa.take(obter_indice_pontos_massa().selecionar(pontos, a, b))
+
+@lru_cache(maxsize=16)
+def _trans_filtradas(versao, filtros):
+    filtros = dict(filtros)
+    # O mesmo conjunto de pontos filtra as transações e lojas_valores
+    pontos = obter_dimensao_lojas().resolver(filtros['segmento'], filtros['loja'])
+    return registro.get("trans_agregados").filtrar(pontos=pontos, inicio=filtros['inicio'], fim=filtros['fim'])
+
+@lru_cache(maxsize=16)
+def _massa_filtrada(versao, filtros):
+    return filtrar_massa(**dict(filtros))
+
+def trans_filtradas(filtros):
+    """Agregados das transações de um estado dos filtros, compartilhados pelos callbacks"""
+    return _trans_filtradas(registro.versao, normalizar_filtros(filtros))
+
+def massa_filtrada(filtros):
+    """lojas_valores de um estado dos filtros, compartilhado pelos callbacks"""
+    return _massa_filtrada(registro.versao, normalizar_filtros(filtros))
+
+@lru_cache(maxsize=16)
+def _ranking_lojas(versao, filtros):
+    filtros = dict(filtros)
+    dimensao = obter_dimensao_lojas()
+    pontos = dimensao.resolver(filtros['segmento'], filtros['loja'])
+    # Soma e número de compras de cada loja (somando os seus pontos), direto do rollup diário
+    somas = obter_receita_diaria().por_ponto(pontos, filtros['inicio'], filtros['fim'])
+    lojas = dimensao.lojas_dos_pontos(somas.index)
+    somas = somas[lojas >= 0].groupby(lojas[lojas >= 0]).sum()
+    return ranking_ticket_medio(somas.assign(nome_loja=dimensao.lojas['loja'].reindex(somas.index)))
 
-fig_receita_segmento.update_traces(marker_color=COLORS['success'])
-fig_ticket_loja.update_traces(marker_color=COLORS['info'])
-fig_distribuicao.update_traces(marker_color=COLORS['warning'])
-
-# Stats iniciais da distribuição
-stats_distribuicao = html.Div([
-    html.Small([
-        html.Strong("Média: "),
-        f"R$ {cupom_medio:.2f}"
-    ], className="text-muted d-block"),
-    html.Small([
-        html.Strong("Mediana: "),
-        f"R$ {df_trans['valor_cupom'].median():.2f}"
-    ], className="text-muted d-block"),
-])
-
-# Meta mensal inicial
-percentual_meta = (receita_total/1000000)*100
-meta_text = f"Atingido {percentual_meta:.1f}% da meta de R$ 1M"
+def ranking_lojas(filtros):
+    """Lojas ordenadas pelo ticket médio em um estado dos filtros (todas as páginas do gráfico)"""
+    return _ranking_lojas(registro.versao, normalizar_filtros(filtros))
+
+def construir_grafico(nome, filtros, pagina=1):
+    """Monta um gráfico da página (chaves de GRAFICOS) para um estado dos filtros"""
+    if nome == 'receita_segmento':
+        fig = criar_grafico_receita_segmento(trans_filtradas(filtros).fatos)
+    elif nome == 'scatter':
+        fig = criar_grafico_scatter(massa_filtrada(filtros))
+    elif nome == 'ticket_loja':
+        fig = criar_grafico_ticket_medio(ranking_lojas(filtros), pagina)
+    elif nome == 'distribuicao':
+        fig = criar_grafico_distribuicao(*trans_filtradas(filtros).histograma_valor_cupom())
+    else:
+        raise KeyError(nome)
+    return estilizar(nome, fig)
+
+def obter_graficos(segmento='all', loja='all', inicio=None, fim=None):
+    """
+    Figuras da página para um estado dos filtros, reaproveitadas do cache de
+    figuras enquanto a versão dos dados não mudar.
+
+    Returns:
+        Dicionário nome -> figura em dict
+    """
+    filtros = {'segmento': segmento, 'loja': loja, 'inicio': inicio, 'fim': fim}
+    return {
+        nome: cache_figuras.obter("cfo-" + nome, filtros, registro.versao,
+                                  lambda nome=nome: construir_grafico(nome, filtros))
+        for nome in GRAFICOS
+    }
 
 # ==================== LAYOUT FINAL ====================
-layout = html.Div([
-    # Cabeçalho
-    dbc.Row([
-        dbc.Col([
-            html.H1([
-                html.I(className="fas fa-chart-pie mr-3"),
-                "Dashboard CFO - Análise Financeira"
-            ], className="mb-2", style={'color': COLORS['primary']}),
-            html.P("Visão consolidada de receitas, ticket médio e performance de cupons",
-                   className="text-muted lead")
-        ]),
-    ], className="mb-4"),
+def layout():
+    """Monta o layout da página, carregando os dados no primeiro acesso."""
+    agregados = registro.get("trans_agregados")
+
+    (receita_total, receita_liquida, margem_operacional, ticket_medio), (percentual_meta, meta_text) = \
+        kpis_e_meta({'segmento': 'all', 'loja': 'all', 'inicio': None, 'fim': None})
+    cupom_medio = ticket_medio
+
+    # ==================== GRÁFICOS INICIAIS ====================
+    figuras = obter_graficos()
+
+    # Stats iniciais da distribuição
+    stats_distribuicao = html.Div([
+        html.Small([
+            html.Strong("Média: "),
+            f"R$ {cupom_medio:.2f}"
+        ], className="text-muted d-block"),
+        html.Small([
+            html.Strong("Mediana: "),
+            f"R$ {agregados.mediana_valor_cupom:.2f}"
+        ], className="text-muted d-block"),
+    ])
+
+    return html.Div([
+        # Cabeçalho
+        dbc.Row([
+            dbc.Col([
+                html.H1([
+                    html.I(className="fas fa-chart-pie mr-3"),
+                    "Dashboard CFO - Análise Financeira"
+                ], className="mb-2", style={'color': COLORS['primary']}),
+                html.P("Visão consolidada de receitas, ticket médio e performance de cupons",
+                       className="text-muted lead")
+            ]),
+        ], className="mb-4"),
     
-    html.Hr(),
+        html.Hr(),
     
-    # KPIs Dinâmicos
-    html.Div(id='kpi-cards-cfo', children=kpi_cards),
+        # Último estado dos filtros aplicado (para os callbacks enviarem só o que mudou)
+        dcc.Store(id='filtros-aplicados-cfo', data=estado_filtros({f: None for f in FILTROS})),
+
+        # KPIs Dinâmicos
+        html.Div(id='kpi-cards-cfo', children=criar_kpis_iniciais(
+            receita_total, receita_liquida, margem_operacional, ticket_medio)),
     
-    # Filtros
-    filtros_financeiros,
+        # Filtros
+        criar_filtros(agregados),
 
-    html.Div([
-        # Botão de Gerar Relatório
-        gerar_layout_botao_cfo(),
-    ], className="mb-4"),
+        html.Div([
+            # Botão de Gerar Relatório
+            gerar_layout_botao_cfo(),
+        ], className="mb-4"),
     
-    # Gráficos
-    dbc.Container([
-        # LINHA 1: Gráfico principal + Scatter
-        dbc.Row([
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardHeader([
-                        html.I(className="fas fa-chart-bar mr-2"),
-                        html.Strong("Receita por Segmento de Negócio")
-                    ], style={'backgroundColor': '#f8f9fa'}),
-                    dbc.CardBody([
-                        dcc.Graph(id="graph-receita-segmento", figure=fig_receita_segmento,
-                                 config={'displayModeBar': False})
-                    ])
-                ], className="shadow-sm")
-            ], xs=12, sm=6, md=7, className="mb-3"),
+        # Gráficos
+        dbc.Container([
+            # LINHA 1: Gráfico principal + Scatter
+            dbc.Row([
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardHeader([
+                            html.I(className="fas fa-chart-bar mr-2"),
+                            html.Strong("Receita por Segmento de Negócio")
+                        ], style={'backgroundColor': '#f8f9fa'}),
+                        dbc.CardBody([
+                            dcc.Graph(id="graph-receita-segmento", figure=figuras['receita_segmento'],
+                                     config={'displayModeBar': False})
+                        ])
+                    ], className="shadow-sm")
+                ], xs=12, sm=6, md=7, className="mb-3"),
             
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardHeader([
-                        html.I(className="fas fa-chart-scatter mr-2"),
-                        html.Strong("Análise: Valor Cupom × Valor Compra"),
-                    ], style={'backgroundColor': '#f8f9fa'}),
-                    dbc.CardBody([
-                        dcc.Graph(id="graph-scatter", figure=fig_scatter,
-                                 config={'displayModeBar': False}),
-                        html.Small([
-                            html.I(className="fas fa-info-circle mr-1"),
-                            "Linha de tendência indica correlação entre cupom e compra final"
-                        ], className="text-muted d-block mt-2")
-                    ])
-                ], className="shadow-sm")
-            ], xs=12, sm=6, md=5, className="mb-3"),
-        ], className="mb-4"),
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardHeader([
+                            html.I(className="fas fa-chart-scatter mr-2"),
+                            html.Strong("Análise: Valor Cupom × Valor Compra"),
+                        ], style={'backgroundColor': '#f8f9fa'}),
+                        dbc.CardBody([
+                            dcc.Graph(id="graph-scatter", figure=figuras['scatter'],
+                                     config={'displayModeBar': False}),
+                            html.Small([
+                                html.I(className="fas fa-info-circle mr-1"),
+                                "Linha de tendência indica correlação entre cupom e compra final"
+                            ], className="text-muted d-block mt-2")
+                        ])
+                    ], className="shadow-sm")
+                ], xs=12, sm=6, md=5, className="mb-3"),
+            ], className="mb-4"),
         
-        # LINHA 2: Análise por loja + Distribuição
-        dbc.Row([
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardHeader([
-                        html.I(className="fas fa-store mr-2"),
-                        html.Strong("Ticket Médio por Estabelecimento"),
-                    ], style={'backgroundColor': '#f8f9fa'}),
-                    dbc.CardBody([
-                        dcc.Graph(id="graph-ticket-loja", figure=fig_ticket_loja,
-                                 config={'displayModeBar': False})
-                    ])
-                ], className="shadow-sm")
-            ], xs=12, sm=6, md=8, className="mb-3"),
+            # LINHA 2: Análise por loja + Distribuição
+            dbc.Row([
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardHeader([
+                            html.I(className="fas fa-store mr-2"),
+                            html.Strong("Ticket Médio por Estabelecimento"),
+                        ], style={'backgroundColor': '#f8f9fa'}),
+                        dbc.CardBody([
+                            dcc.Graph(id="graph-ticket-loja", figure=figuras['ticket_loja'],
+                                     config={'displayModeBar': False}),
+                            # Demais lojas do ranking, pedidas ao servidor página a página
+                            dbc.Pagination(id="paginas-ticket-loja", active_page=1,
+                                           max_value=paginas_ticket_medio(ranking_lojas(
+                                               {f: None for f in FILTROS})),
+                                           fully_expanded=False, size="sm",
+                                           className="justify-content-center mb-0"),
+                            # Filtros e página da figura exibida (ver responder_ticket_loja)
+                            dcc.Store(id='ticket-loja-exibido',
+                                      data={'filtros': estado_filtros({f: None for f in FILTROS}),
+                                            'pagina': 1})
+                        ])
+                    ], className="shadow-sm")
+                ], xs=12, sm=6, md=8, className="mb-3"),
             
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardHeader([
-                        html.I(className="fas fa-chart-histogram mr-2"),
-                        html.Strong("Distribuição de Cupons")
-                    ], style={'backgroundColor': '#f8f9fa'}),
-                    dbc.CardBody([
-                        dcc.Graph(id="graph-distribuicao", figure=fig_distribuicao,
-                                 config={'displayModeBar': False}),
-                        html.Div(id="stats-distribuicao", children=stats_distribuicao, 
-                                className="mt-2 pt-2", style={'borderTop': '1px solid #dee2e6'})
-                    ])
-                ], className="shadow-sm")
-            ], xs=12, sm=6, md=4, className="mb-3"),
-        ], className="mb-4"),
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardHeader([
+                            html.I(className="fas fa-chart-histogram mr-2"),
+                            html.Strong("Distribuição de Cupons")
+                        ], style={'backgroundColor': '#f8f9fa'}),
+                        dbc.CardBody([
+                            dcc.Graph(id="graph-distribuicao", figure=figuras['distribuicao'],
+                                     config={'displayModeBar': False}),
+                            html.Div(id="stats-distribuicao", children=stats_distribuicao, 
+                                    className="mt-2 pt-2", style={'borderTop': '1px solid #dee2e6'})
+                        ])
+                    ], className="shadow-sm")
+                ], xs=12, sm=6, md=4, className="mb-3"),
+            ], className="mb-4"),
         
-        # LINHA 3: Insights e Alertas
-        dbc.Row([     
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardHeader([
-                        html.I(className="fas fa-bell mr-2", style={'color': COLORS['danger']}),
-                        html.Strong("Alertas Financeiros")
-                    ], style={'backgroundColor': '#f8d7da'}),
-                    dbc.CardBody([
-                        dbc.Alert([
-                            html.H6([html.I(className="fas fa-chart-line mr-2"), "Meta Mensal"], 
-                                   className="alert-heading"),
-                            html.P(id="meta-mensal-text", children=meta_text, className="mb-0"),
-                            dbc.Progress(id="progress-meta", value=percentual_meta, className="mt-2")
-                        ], color="info", className="mb-0"),
-                    ])
-                ], className="shadow-sm")
-            ]),
-        ], className="mb-4 g-3"),
+            # LINHA 3: Insights e Alertas
+            dbc.Row([     
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardHeader([
+                            html.I(className="fas fa-bell mr-2", style={'color': COLORS['danger']}),
+                            html.Strong("Alertas Financeiros")
+                        ], style={'backgroundColor': '#f8d7da'}),
+                        dbc.CardBody([
+                            dbc.Alert([
+                                html.H6([html.I(className="fas fa-chart-line mr-2"), "Meta Mensal"], 
+                                       className="alert-heading"),
+                                html.P(id="meta-mensal-text", children=meta_text, className="mb-0"),
+                                dbc.Progress(id="progress-meta", value=percentual_meta, className="mt-2")
+                            ], color="info", className="mb-0"),
+                        ])
+                    ], className="shadow-sm")
+                ]),
+            ], className="mb-4 g-3"),
         
-    ], fluid=True, id='graph-content-cfo'),
+        ], fluid=True, id='graph-content-cfo'),
     
-    # Footer com timestamp
-    html.Footer([
-        html.Hr(),
-        html.Small([
-            html.I(className="fas fa-clock mr-2"),
-            f"Última atualização: {pd.Timestamp.now().strftime('%d/%m/%Y %H:%M')}"
-        ], className="text-muted")
-    ], className="mt-4")
-])
+        # Footer com timestamp
+        html.Footer([
+            html.Hr(),
+            html.Small([
+                html.I(className="fas fa-clock mr-2"),
+                f"Última atualização: {pd.Timestamp.now().strftime('%d/%m/%Y %H:%M')}"
+            ], className="text-muted")
+        ], className="mt-4")
+    ])
+
+# ==================== CALLBACKS ====================
+# Um callback para os KPIs e textos (rápido, chega primeiro) e um por gráfico:
+# o Dash dispara todos no mesmo clique e o servidor os atende em paralelo, com
+# as transações e lojas_valores filtradas compartilhadas entre eles.
+ESTADOS_FILTROS = [
+    State('filtro-segmento', 'value'),
+    State('filtro-loja', 'value'),
+    State('filtro-data-cfo', 'start_date'),
+    State('filtro-data-cfo', 'end_date'),
+    State('filtros-aplicados-cfo', 'data'),
+]
 
-# ==================== CALLBACK ÚNICO ====================
 @app.callback(
+    Output('filtro-loja', 'options'),
+    Input('filtro-loja', 'search_value'),
+    State('filtro-loja', 'value'),
+    prevent_initial_call=True
+)
+def buscar_lojas(busca, loja):
+    # Cada tecla traz só as lojas encontradas (até LIMITE_RESULTADOS)
+    return opcoes_lojas(busca, loja)
+
+def filtros_do_clique(segmento, loja, start_date, end_date):
+    """Filtros da página a partir dos valores dos componentes"""
+    periodo = (start_date, end_date) if start_date and end_date else (None, None)
+    return {'segmento': segmento, 'loja': loja, 'inicio': periodo[0], 'fim': periodo[1]}
+
+@callback_tarefa(
+    app,
     [Output('kpi-cards-cfo', 'children'),
-     Output('graph-receita-segmento', 'figure'),
-     Output('graph-scatter', 'figure'),
-     Output('graph-ticket-loja', 'figure'),
-     Output('graph-distribuicao', 'figure'),
      Output('stats-distribuicao', 'children'),
      Output('meta-mensal-text', 'children'),
-     Output('progress-meta', 'value')],
+     Output('progress-meta', 'value'),
+     Output('filtros-aplicados-cfo', 'data')],
     [Input('botao-aplicar-cfo', 'n_clicks')],
-    [State('filtro-segmento', 'value'),
-     State('filtro-loja', 'value'),
-     State('filtro-data-cfo', 'start_date'),
-     State('filtro-data-cfo', 'end_date')]
+    ESTADOS_FILTROS,
+    chave="cfo-kpis",
+    segundo_plano=FILTROS_EM_SEGUNDO_PLANO
 )
-def atualizar_dashboard_cfo(n_clicks, segmento, loja, start_date, end_date):
+def atualizar_kpis_cfo(n_clicks, segmento, loja, start_date, end_date, anterior):
     if n_clicks is None or n_clicks == 0:
         # Não fazer nada se nenhum clique foi feito
-        from dash import no_update
-        return no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update
-    
-    # Aplicar filtros ao df_trans
-    df_filtrado_trans = df_trans.copy()
-    df_filtrado_massa = df_massa.copy()
-    
-    if segmento != 'all':
-        df_filtrado_trans = df_filtrado_trans[df_filtrado_trans['categoria_estabelecimento'] == segmento]
-        # Para df_massa, usar tipo_loja como equivalente
-        if 'tipo_loja' in df_filtrado_massa.columns:
-            df_filtrado_massa = df_filtrado_massa[df_filtrado_massa['tipo_loja'] == segmento]
-    
-    if loja != 'all':
-        df_filtrado_trans = df_filtrado_trans[df_filtrado_trans['nome_estabelecimento'] == loja]
-        df_filtrado_massa = df_filtrado_massa[df_filtrado_massa['nome_loja'] == loja]
+        return no_update, no_update, no_update, no_update, no_update
+
+    filtros = filtros_do_clique(segmento, loja, start_date, end_date)
+    atual = estado_filtros(filtros)
+    if anterior == atual:
+        # Mesmo estado do último clique: nada a reenviar
+        return no_update, no_update, no_update, no_update, no_update
+
+    # Agregados das transações filtrados (compartilhados com os gráficos)
+    filtrado_trans = trans_filtradas(filtros)
     
-    if start_date and end_date:
-        df_filtrado_trans = df_filtrado_trans[
-            (df_filtrado_trans['data'] >= pd.to_datetime(start_date)) & 
-            (df_filtrado_trans['data'] <= pd.to_datetime(end_date))
-        ]
-        df_filtrado_massa = df_filtrado_massa[
-            (df_filtrado_massa['data_captura'] >= pd.to_datetime(start_date)) & 
-            (df_filtrado_massa['data_captura'] <= pd.to_datetime(end_date))
-        ]
-    
-    # Calcular KPIs com dados filtrados
-    receita_total = df_filtrado_trans['valor_cupom'].sum()
-    receita_liquida = df_filtrado_trans['valor_cupom'].sum() - df_filtrado_trans['repasse_picmoney'].sum()
-    margem_operacional = (receita_liquida / receita_total) * 100 if receita_total > 0 else 0
-    ticket_medio = df_filtrado_trans['valor_cupom'].mean()
-    cupom_medio = df_filtrado_trans['valor_cupom'].mean()
+    # KPIs e meta do mês a partir do rollup diário de receita
+    (receita_total, receita_liquida, margem_operacional, ticket_medio), (percentual_meta, meta_text) = \
+        kpis_e_meta(filtros)
+    cupom_medio = ticket_medio
     
     # Criar KPIs
     kpi_cards = dbc.Row([
@@ -418,29 +600,6 @@ def atualizar_dashboard_cfo(n_clicks, segmento, loja, start_date, end_date):
         ), xs=12, sm=6, md=3, className="mb-3 g-3"),
     ], className="mb-4")
     
-    # Criar gráficos com dados filtrados
-    fig_receita_segmento = criar_grafico_receita_segmento(df_filtrado_trans)
-    fig_scatter = criar_grafico_scatter(df_filtrado_massa)
-    fig_ticket_loja = criar_grafico_ticket_medio(df_filtrado_massa)
-    fig_distribuicao = criar_grafico_distribuicao(df_filtrado_trans)
-    
-    # Estilizar gráficos
-    for fig in [fig_receita_segmento, fig_scatter, fig_ticket_loja, fig_distribuicao]:
-        fig.update_layout(
-            template='plotly_white',
-            font=dict(family="Arial, sans-serif", size=12),
-            plot_bgcolor='rgba(248,249,250,0.5)',
-            paper_bgcolor='white',
-            title_font_size=16,
-            title_font_color=COLORS['primary'],
-            hovermode='x unified',
-            margin=dict(l=60, r=40, t=60, b=60)
-        )
-    
-    fig_receita_segmento.update_traces(marker_color=COLORS['success'])
-    fig_ticket_loja.update_traces(marker_color=COLORS['info'])
-    fig_distribuicao.update_traces(marker_color=COLORS['warning'])
-    
     # Stats da distribuição
     stats_distribuicao = html.Div([
         html.Small([
@@ -449,12 +608,91 @@ def atualizar_dashboard_cfo(n_clicks, segmento, loja, start_date, end_date):
         ], className="text-muted d-block"),
         html.Small([
             html.Strong("Mediana: "),
-            f"R$ {df_filtrado_trans['valor_cupom'].median():.2f}"
+            f"R$ {filtrado_trans.mediana_valor_cupom:.2f}"
         ], className="text-muted d-block"),
     ])
     
-    # Meta mensal
-    percentual_meta = (receita_total/1000000)*100
-    meta_text = f"Atingido {percentual_meta:.1f}% da meta de R$ 1M"
-    
-    return kpi_cards, fig_receita_segmento, fig_scatter, fig_ticket_loja, fig_distribuicao, stats_distribuicao, meta_text, percentual_meta
\ No newline at end of file
+    return kpi_cards, stats_distribuicao, meta_text, percentual_meta, atual
+
+def registrar_callback_grafico(nome, id_grafico):
+    """Callback de um gráfico: envia só o que mudou na figura (Patch) ou no_update"""
+    @callback_tarefa(
+        app,
+        Output(id_grafico, 'figure'),
+        [Input('botao-aplicar-cfo', 'n_clicks')],
+        ESTADOS_FILTROS,
+        chave="cfo-" + nome,
+        segundo_plano=FILTROS_EM_SEGUNDO_PLANO
+    )
+    def atualizar_grafico(n_clicks, segmento, loja, start_date, end_date, anterior):
+        if n_clicks is None or n_clicks == 0:
+            return no_update
+        filtros = filtros_do_clique(segmento, loja, start_date, end_date)
+        return atualizar_figura("cfo-" + nome, FILTROS, anterior, estado_filtros(filtros),
+                                registro.versao, lambda: construir_grafico(nome, filtros))
+    return atualizar_grafico
+
+# Callbacks dos gráficos, por nome (o ticket médio por loja tem o seu, com paginação)
+atualizar_graficos_cfo = {nome: registrar_callback_grafico(nome, id_grafico)
+                          for nome, id_grafico in GRAFICOS.items() if nome != 'ticket_loja'}
+
+@callback_tarefa(
+    app,
+    [Output('graph-ticket-loja', 'figure'),
+     Output('paginas-ticket-loja', 'max_value'),
+     Output('paginas-ticket-loja', 'active_page'),
+     Output('ticket-loja-exibido', 'data')],
+    [Input('botao-aplicar-cfo', 'n_clicks'),
+     Input('paginas-ticket-loja', 'active_page')],
+    ESTADOS_FILTROS[:-1] + [State('ticket-loja-exibido', 'data')],
+    chave="cfo-ticket_loja",
+    segundo_plano=FILTROS_EM_SEGUNDO_PLANO
+)
+def atualizar_ticket_loja(n_clicks, pagina, segmento, loja, start_date, end_date, exibido):
+    """
+    Gráfico de ticket médio por loja: os filtros voltam à primeira página e o
+    paginador troca só a página, com os filtros já aplicados.
+    """
+    return responder_ticket_loja(ctx.triggered_id, n_clicks, pagina,
+                                 filtros_do_clique(segmento, loja, start_date, end_date), exibido)
+
+def responder_ticket_loja(gatilho, n_clicks, pagina, filtros, exibido):
+    """
+    Saídas do gráfico de ticket médio por loja: figura, número de páginas,
+    página ativa e o estado exibido.
+
+    O estado exibido ({'filtros', 'pagina'}) só é gravado por este callback,
+    então o paginador monta as páginas com os filtros da figura na tela, e não
+    com filtros-aplicados-cfo, que o callback dos KPIs grava em paralelo. A
+    volta à primeira página depois de "Aplicar" dispara o callback de novo
+    pelo paginador; como essa página já é a exibida, nada é reenviado.
+
+    Args:
+        gatilho: Id do componente que disparou o callback
+        filtros: Filtros dos componentes (ver filtros_do_clique)
+        exibido: Estado exibido gravado pela última resposta
+    """
+    sem_mudanca = (no_update, no_update, no_update, no_update)
+    if gatilho == 'paginas-ticket-loja':
+        if not pagina or not exibido or pagina == exibido['pagina']:
+            return sem_mudanca
+        # Filtros da figura exibida, não os valores ainda não aplicados
+        filtros = exibido['filtros']
+        figura = cache_figuras.obter("cfo-ticket_loja-pagina", dict(filtros, pagina=pagina),
+                                     registro.versao,
+                                     lambda: construir_grafico('ticket_loja', filtros, pagina))
+        return figura, no_update, no_update, dict(exibido, pagina=pagina)
+
+    if n_clicks is None or n_clicks == 0:
+        return sem_mudanca
+    atual = estado_filtros(filtros)
+    anterior = exibido['filtros'] if exibido else None
+    if anterior == atual:
+        return sem_mudanca
+    paginas = paginas_ticket_medio(ranking_lojas(filtros))
+    if not exibido or exibido['pagina'] != 1:
+        # O navegador mostra outra página: a diferença para a primeira não serve
+        anterior = None
+    figura = atualizar_figura("cfo-ticket_loja", FILTROS, anterior, atual, registro.versao,
+                              lambda: construir_grafico('ticket_loja', filtros))
+    return figura, paginas, 1, {'filtros': atual, 'pagina': 1}
@@ -1,7 +1,7 @@
 from dash import dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
 from app import app
-from utils.db_utils import df_trans, df_massa, df_players
+from utils.db_utils import registro
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
@@ -17,38 +17,40 @@ COLORS = {
     'info': '#17a2b8'
 }
 
-# Garantir que as datas estão no formato correto
-df_trans['data'] = pd.to_datetime(df_trans['data'], format='%d/%m/%Y')
-df_massa['data_captura'] = pd.to_datetime(df_massa['data_captura'], format='%d/%m/%Y')
-
 # ==================== CÁLCULOS BASE (HISTÓRICO) ====================
 def calcular_metricas_historicas():
     """Calcula métricas históricas para usar como base das projeções"""
+    agregados = registro.get("trans_agregados")
+
     # Período histórico: últimos 30 dias
-    data_limite = df_trans['data'].max()
+    data_limite = agregados.data_max
     data_inicio = data_limite - pd.Timedelta(days=30)
     
-    df_recente = df_trans[df_trans['data'] >= data_inicio]
+    recente = agregados.filtrar(inicio=data_inicio)
     
     # Métricas diárias médias
-    dias_hist = (df_recente['data'].max() - df_recente['data'].min()).days + 1
+    dias_hist = (recente.data_max - recente.data_min).days + 1
     if dias_hist == 0:
         dias_hist = 1
     
+    transacoes = recente.total_transacoes
+    usuarios_unicos = agregados.contar_usuarios(inicio=data_inicio)
     metricas = {
-        'usuarios_unicos': df_recente['celular'].nunique(),
-        'transacoes_dia': len(df_recente) / dias_hist,
-        'receita_dia': df_recente['valor_cupom'].sum() / dias_hist,
-        'receita_liquida_dia': (df_recente['valor_cupom'].sum() - df_recente['repasse_picmoney'].sum()) / dias_hist,
-        'ticket_medio': df_recente['valor_cupom'].mean(),
-        'transacoes_por_usuario': len(df_recente) / df_recente['celular'].nunique() if df_recente['celular'].nunique() > 0 else 0,
+        'usuarios_unicos': usuarios_unicos,
+        'transacoes_dia': transacoes / dias_hist,
+        'receita_dia': recente.receita / dias_hist,
+        'receita_liquida_dia': (recente.receita - recente.repasse) / dias_hist,
+        'ticket_medio': recente.ticket_medio,
+        'transacoes_por_usuario': transacoes / usuarios_unicos if usuarios_unicos > 0 else 0,
         'crescimento_mensal_usuarios': 0.05,  # 5% padrão (pode ser calculado)
         'crescimento_mensal_transacoes': 0.03,  # 3% padrão
     }
     
     return metricas
 
-metricas_base = calcular_metricas_historicas()
+def obter_metricas_base():
+    """Métricas históricas calculadas uma vez por versão dos dados"""
+    return registro.derivado("metricas_historicas", calcular_metricas_historicas)
 
 # ==================== FUNÇÕES DE PROJEÇÃO ====================
 def calcular_projecoes(horizonte_meses, crescimento_usuarios, crescimento_transacoes, 
@@ -56,8 +58,10 @@ def calcular_projecoes(horizonte_meses, crescimento_usuarios, crescimento_transa
                        margem_operacional_base):
     """Calcula projeções financeiras e operacionais"""
     
+    metricas_base = obter_metricas_base()
+
     # Criar série temporal
-    data_inicio = df_trans['data'].max()
+    data_inicio = registro.get("trans_agregados").data_max
     datas = pd.date_range(start=data_inicio, periods=horizonte_meses * 30, freq='D')
     
     # Inicializar valores base
@@ -0,0 +1,96 @@
+"""
+Configuração comum dos testes (rodar de src/: python -m pytest -q).
+
+Os testes usam tabelas pequenas montadas em cada caso e comparam as
+estruturas de consulta com o resultado direto do pandas; nenhum lê os CSVs
+da pasta data/.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Os módulos da aplicação são importados a partir de src/ (como em app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.agregados import AcumuladorTransacoes, AgregadosTransacoes  # noqa: E402
+from utils.db_utils import preparar_trans  # noqa: E402
+from utils.dicionario import compactar_categorias  # noqa: E402
+from utils.dimensoes import conformar_lojas  # noqa: E402
+from utils.leitura import ler_csv_tipado  # noqa: E402
+from utils.schemas import ESQUEMAS  # noqa: E402
+
+# Loja -> (categoria, bairro) das transações de teste
+LOJAS_TESTE = {
+    "Droga Raia": ("Farmácias e Drogarias", "Pinheiros"),
+    "Outback": ("Restaurantes", "Moema"),
+    "Renner": ("Moda", "Pinheiros"),
+    "Habib's": ("Restaurantes", "Centro"),
+}
+
+# Textos de valor inválidos (viram ausentes na carga)
+VALORES_INVALIDOS = ["abc", "1.2.3", "848.205", ""]
+
+
+def _texto_valor(centavos, estilo):
+    reais, resto = divmod(int(centavos), 100)
+    if estilo == 0:
+        return f"{reais}.{resto:02d}"
+    # Padrão brasileiro, com separador de milhar
+    return f"{reais:,}".replace(",", ".") + f",{resto:02d}"
+
+
+def escrever_transacoes(path, n=600, semente=7):
+    """
+    Grava um transacoes_cupons.csv sintético, no formato do original, com
+    valores em formatos variados, alguns valores inválidos e linhas sem data.
+    """
+    rng = np.random.default_rng(semente)
+    lojas = rng.choice(list(LOJAS_TESTE), n)
+    dias = pd.Timestamp("2025-07-01") + pd.to_timedelta(rng.integers(0, 10, n), unit="D")
+    datas = dias.strftime("%d/%m/%Y").to_numpy(dtype=object)
+    datas[rng.random(n) < 0.02] = ""
+    centavos = rng.integers(100, 250_000, n)
+    valores = [_texto_valor(c, e) for c, e in zip(centavos, rng.integers(0, 2, n))]
+    for posicao, texto in zip(rng.choice(n, len(VALORES_INVALIDOS), replace=False), VALORES_INVALIDOS):
+        valores[posicao] = texto
+    pd.DataFrame({
+        "celular": [f"(11) 9{c:04d}-0000" for c in rng.integers(0, 150, n)],
+        "data": datas,
+        "hora": [f"{h:02d}:{m:02d}:00" for h, m in zip(rng.integers(0, 24, n), rng.integers(0, 60, n))],
+        "nome_estabelecimento": lojas,
+        "bairro_estabelecimento": [LOJAS_TESTE[l][1] for l in lojas],
+        "categoria_estabelecimento": [LOJAS_TESTE[l][0] for l in lojas],
+        "id_campanha": "CAM1",
+        "id_cupom": [f"CUP{i}" for i in range(n)],
+        "tipo_cupom": rng.choice(["Cashback", "Desconto", "Produto"], n),
+        "produto": "",
+        "valor_cupom": valores,
+        "repasse_picmoney": [_texto_valor(c, 0) for c in centavos // 20],
+    }).to_csv(path, sep=";", index=False)
+    return path
+
+
+@pytest.fixture(scope="session")
+def transacoes(tmp_path_factory):
+    """Transações de teste lidas e pré-processadas como na carga da aplicação."""
+    path = escrever_transacoes(tmp_path_factory.mktemp("dados") / "transacoes_cupons.csv")
+    df, _ = ler_csv_tipado(ESQUEMAS["trans"], str(path))
+    return conformar_lojas(compactar_categorias(preparar_trans(df)))
+
+
+@pytest.fixture(scope="session")
+def agregados(transacoes):
+    """Agregados das transações de teste, dobrados em blocos como na carga em blocos."""
+    acumulador = AcumuladorTransacoes(exato=False, compactar_a_cada=2)
+    for inicio in range(0, len(transacoes), 100):
+        acumulador.adicionar(transacoes.iloc[inicio:inicio + 100])
+    tabelas = acumulador.finalizar()
+    for tabela in tabelas.values():
+        conformar_lojas(tabela)
+    resultado = AgregadosTransacoes(**tabelas)
+    resultado.indexar()
+    return resultado
@@ -0,0 +1,86 @@
+"""Tabelas agregadas das transações (utils.agregados) contra o pandas sobre as linhas."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.agregados import CHAVES_FATOS, LARGURA_FAIXA_VALOR, mediana_faixas
+
+from test_indice import PERIODOS, _mascara_periodo
+
+# Filtros de categoria, tipo e bairro testados (inclusive valores desconhecidos)
+FILTROS = [
+    {},
+    {"categoria": "Restaurantes"},
+    {"categoria": "Restaurantes", "bairro": "Moema"},
+    {"tipo_cupom": "Desconto", "bairro": "Pinheiros"},
+    {"categoria": "Academias"},
+    {"tipo_cupom": "Inexistente"},
+    {"categoria": "all", "tipo_cupom": None, "bairro": "all"},
+]
+
+_COLUNAS = {"categoria": "categoria_estabelecimento", "tipo_cupom": "tipo_cupom",
+            "bairro": "bairro_estabelecimento"}
+
+
+def _linhas(transacoes, filtros, inicio=None, fim=None):
+    """Transações que atendem aos filtros, selecionadas direto no pandas."""
+    mascara = _mascara_periodo(transacoes["data"], inicio, fim)
+    for nome, valor in filtros.items():
+        if valor not in (None, "all"):
+            mascara &= (transacoes[_COLUNAS[nome]] == valor).to_numpy()
+    return transacoes[mascara]
+
+
+def test_fatos_iguais_ao_groupby(transacoes, agregados):
+    esperado = (transacoes.groupby(CHAVES_FATOS, observed=True, dropna=False)
+                .agg(transacoes=("id_cupom", "size"), valor_cupom=("valor_cupom", "sum"),
+                     valor_cupom_n=("valor_cupom", "count"))
+                .reset_index())
+    obtido = agregados.fatos[esperado.columns]
+    ordem = ["data", "nome_estabelecimento", "tipo_cupom"]
+    pd.testing.assert_frame_equal(
+        obtido.sort_values(ordem).reset_index(drop=True).astype({"valor_cupom": "int64"}),
+        esperado.sort_values(ordem).reset_index(drop=True).astype({"valor_cupom": "int64"}),
+        check_categorical=False, check_dtype=False)
+    # Sem a hora: bem menos linhas que transações
+    assert len(agregados.fatos) < len(transacoes)
+
+
+def test_valores_em_centavos_int64(transacoes, agregados):
+    for coluna in ("valor_cupom", "repasse_picmoney", "valor_cupom_n"):
+        assert agregados.fatos[coluna].dtype == np.int64
+    assert int(agregados.fatos["valor_cupom"].sum()) == int(transacoes["valor_cupom"].sum())
+    assert agregados.receita == int(transacoes["valor_cupom"].sum()) / 100
+
+
+@pytest.mark.parametrize("inicio, fim", PERIODOS)
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_filtrar_igual_ao_pandas(transacoes, agregados, filtros, inicio, fim):
+    filtrado = agregados.filtrar(**filtros, inicio=inicio, fim=fim)
+    linhas = _linhas(transacoes, filtros, inicio, fim)
+    assert filtrado.total_transacoes == len(linhas)
+    assert int(filtrado.fatos["valor_cupom"].sum()) == int(linhas["valor_cupom"].sum())
+    assert filtrado.estabelecimentos == linhas["nome_estabelecimento"].nunique()
+    # A tabela de valores não tem tipo de cupom nem bairro (fica None com esses filtros)
+    if filtrado.valores is not None:
+        _, contagens = filtrado.histograma_valor_cupom()
+        assert contagens.sum() == linhas["valor_cupom"].notna().sum()
+
+
+def test_filtro_desconhecido_devolve_tabelas_vazias(agregados):
+    filtrado = agregados.filtrar(categoria="Academias", inicio="2025-07-01")
+    assert filtrado.total_transacoes == 0
+    assert len(filtrado.valores) == 0
+    assert np.isnan(filtrado.ticket_medio)
+
+
+def test_periodo_fora_dos_dados(agregados):
+    assert agregados.filtrar(inicio="2030-01-01").total_transacoes == 0
+    assert agregados.filtrar(fim="2020-01-01", inicio="2019-01-01").total_transacoes == 0
+
+
+def test_mediana_dentro_da_faixa(transacoes, agregados):
+    valores = transacoes["valor_cupom"].dropna().to_numpy(np.int64)
+    mediana = mediana_faixas(agregados.valores["faixa_valor"], agregados.valores["transacoes"])
+    assert abs(mediana - np.median(valores)) <= LARGURA_FAIXA_VALOR
@@ -0,0 +1,67 @@
+"""Paginação do gráfico de ticket médio por loja (pages.cfo.responder_ticket_loja)."""
+
+import pytest
+from dash import no_update
+
+import pages.cfo as cfo
+from utils.saidas import estado_filtros
+
+APLICAR = 'botao-aplicar-cfo'
+PAGINADOR = 'paginas-ticket-loja'
+
+
+@pytest.fixture
+def paginas(monkeypatch):
+    """Figuras falsas que registram os filtros e a página com que foram montadas."""
+    montadas = []
+
+    def construir(nome, filtros, pagina=1):
+        montadas.append((dict(filtros), pagina))
+        return {"data": [{"x": [filtros["segmento"]], "y": [pagina]}], "layout": {}}
+
+    monkeypatch.setattr(cfo, "construir_grafico", construir)
+    monkeypatch.setattr(cfo, "ranking_lojas", lambda filtros: None)
+    monkeypatch.setattr(cfo, "paginas_ticket_medio", lambda ranking: 3)
+    cfo.cache_figuras.limpar()
+    return montadas
+
+
+def _filtros(segmento):
+    return {'segmento': segmento, 'loja': 'all', 'inicio': None, 'fim': None}
+
+
+def _inicial():
+    return {'filtros': estado_filtros(_filtros(None)), 'pagina': 1}
+
+
+def test_pagina_dois_depois_troca_de_filtro(paginas):
+    # Segunda página com os filtros iniciais
+    figura, _, _, exibido = cfo.responder_ticket_loja(PAGINADOR, None, 2, _filtros(None), _inicial())
+    assert figura["data"][0]["y"] == [2]
+    assert exibido["pagina"] == 2
+
+    # "Aplicar" com outro segmento: primeira página do filtro novo
+    figura, n_paginas, pagina, exibido = cfo.responder_ticket_loja(
+        APLICAR, 1, 2, _filtros("farmácia"), exibido)
+    assert figura["data"][0]["x"] == ["farmácia"] and figura["data"][0]["y"] == [1]
+    assert (n_paginas, pagina) == (3, 1)
+    assert exibido == {'filtros': estado_filtros(_filtros("farmácia")), 'pagina': 1}
+
+    # A volta para a página 1 dispara o callback de novo: nada é reenviado,
+    # mesmo que os filtros dos componentes já sejam outros
+    montadas = len(paginas)
+    saidas = cfo.responder_ticket_loja(PAGINADOR, 1, 1, _filtros("mercado"), exibido)
+    assert all(saida is no_update for saida in saidas)
+    assert len(paginas) == montadas
+
+    # As páginas seguintes usam os filtros exibidos
+    figura, _, _, exibido = cfo.responder_ticket_loja(PAGINADOR, 1, 3, _filtros("mercado"), exibido)
+    assert figura["data"][0]["x"] == ["farmácia"] and figura["data"][0]["y"] == [3]
+    assert paginas[-1] == (estado_filtros(_filtros("farmácia")), 3)
+
+
+def test_aplicar_os_mesmos_filtros_nao_reenvia(paginas):
+    exibido = {'filtros': estado_filtros(_filtros("farmácia")), 'pagina': 1}
+    saidas = cfo.responder_ticket_loja(APLICAR, 2, 1, _filtros("farmácia"), exibido)
+    assert all(saida is no_update for saida in saidas)
+    assert not paginas
@@ -0,0 +1,99 @@
+"""Cubo e tensor de atividade do CEO (utils.cubo) contra o pandas sobre as linhas."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.cubo import Cubo, TensorAtividade
+
+from test_agregados import FILTROS, _linhas
+from test_indice import PERIODOS
+
+CATEGORIAS = ["Farmácias e Drogarias", "Moda", "Restaurantes"]
+
+
+@pytest.fixture(scope="module")
+def cubo(agregados):
+    return Cubo.de_fatos(agregados.fatos, agregados.horarios)
+
+
+def _hora_categoria(linhas):
+    """Resgates por hora (linhas) e categoria (colunas), como o heatmap do CEO."""
+    return (pd.crosstab(linhas["hour"].astype("float64"), linhas["categoria_estabelecimento"])
+            .reindex(index=range(24), columns=CATEGORIAS, fill_value=0).to_numpy())
+
+
+def _colunas_categorias(contagens, rotulos):
+    return contagens[:, [list(rotulos).index(c) for c in CATEGORIAS]]
+
+
+def test_totais(transacoes, cubo):
+    assert cubo.total("resgates") == len(transacoes)
+    assert cubo.total("valor_cupom") == int(transacoes["valor_cupom"].sum())
+    assert cubo.lojas_distintas() == transacoes["nome_estabelecimento"].nunique()
+    assert cubo.horas.sum() == transacoes["hour"].notna().sum()
+
+
+def test_rollup_igual_ao_groupby(transacoes, cubo):
+    dimensoes = ["categoria_estabelecimento", "tipo_cupom"]
+    esperado = (transacoes.groupby(dimensoes, observed=True).size()
+                .rename("resgates").reset_index())
+    obtido = cubo.rollup(dimensoes)
+    pd.testing.assert_frame_equal(
+        obtido.astype({d: str for d in dimensoes}).sort_values(dimensoes, ignore_index=True),
+        esperado.astype({d: str for d in dimensoes}).sort_values(dimensoes, ignore_index=True),
+        check_dtype=False)
+
+
+def test_tensor_dia_da_semana(transacoes, cubo):
+    contagens, (dias,) = cubo.tensor(["weekday"])
+    esperado = transacoes["weekday"].astype(str).value_counts()
+    assert dict(zip(dias, contagens)) == {d: esperado.get(d, 0) for d in dias}
+
+
+def test_tensor_hora_categoria(transacoes, cubo):
+    contagens, (_, categorias) = cubo.tensor(["hour", "categoria_estabelecimento"])
+    np.testing.assert_array_equal(_colunas_categorias(contagens, categorias),
+                                  _hora_categoria(transacoes))
+    with pytest.raises(ValueError):
+        cubo.tensor(["hour"], medida="valor_cupom")
+
+
+@pytest.mark.parametrize("inicio, fim", PERIODOS)
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_fatiar_igual_ao_pandas(transacoes, cubo, filtros, inicio, fim):
+    fatia = cubo.fatiar(**filtros, inicio=inicio, fim=fim)
+    linhas = _linhas(transacoes, filtros, inicio, fim)
+    assert fatia.total("resgates") == len(linhas)
+    assert fatia.total("valor_cupom") == int(linhas["valor_cupom"].sum())
+    assert fatia.lojas_distintas() == linhas["nome_estabelecimento"].nunique()
+    contagens, (_, categorias) = fatia.tensor(["hour", "categoria_estabelecimento"])
+    np.testing.assert_array_equal(_colunas_categorias(contagens, categorias), _hora_categoria(linhas))
+
+
+@pytest.mark.parametrize("inicio, fim", PERIODOS)
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_tensor_atividade_igual_ao_pandas(transacoes, cubo, filtros, inicio, fim):
+    tensor = TensorAtividade.de_cubo(cubo)
+    colunas = {"categoria": "categoria_estabelecimento", "tipo_cupom": "tipo_cupom",
+               "bairro": "bairro_estabelecimento"}
+    somas = tensor.somar(["hour", "categoria_estabelecimento"],
+                         {colunas[k]: v for k, v in filtros.items()}, inicio, fim)
+    linhas = _linhas(transacoes, filtros, inicio, fim)
+    # O tensor não tem o eixo das linhas sem data
+    linhas = linhas[linhas["data"].notna()]
+    categorias = tensor.rotulos["categoria_estabelecimento"]
+    np.testing.assert_array_equal(_colunas_categorias(somas, categorias), _hora_categoria(linhas))
+
+
+def test_tensor_atividade_limitado_por_bytes(cubo):
+    completo = TensorAtividade.de_cubo(cubo)
+    assert completo.contagens.dtype == np.uint32
+    assert completo.responde({"tipo_cupom": "Cashback"})
+    # Sem espaço para os cinco eixos: só dia, hora e categoria
+    reduzido = TensorAtividade.de_cubo(cubo, limite=completo.nbytes - 1)
+    assert reduzido.dimensoes == ["data", "hour", "categoria_estabelecimento"]
+    assert not reduzido.responde({"tipo_cupom": "Cashback"})
+    assert reduzido.responde({"categoria_estabelecimento": "Moda", "tipo_cupom": "all"})
+    np.testing.assert_array_equal(reduzido.somar(["hour"]), completo.somar(["hour"]))
+    assert TensorAtividade.de_cubo(cubo, limite=0) is None
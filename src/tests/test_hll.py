@@ -0,0 +1,43 @@
+"""Contagem de usuários únicos por HyperLogLog (utils.hll) contra o nunique do pandas."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.hll import ERRO_PADRAO, SketchesUsuarios, contar_distintos
+
+from test_agregados import FILTROS, _linhas
+from test_indice import PERIODOS
+
+
+def _dentro_do_erro(estimativa, real):
+    # Três erros padrão (99,7% das estimativas), e ao menos um usuário
+    return abs(estimativa - real) <= max(3 * ERRO_PADRAO * real, 1)
+
+
+@pytest.mark.parametrize("n", [0, 1, 100, 5_000, 200_000])
+def test_contar_distintos_dentro_do_erro(n):
+    rng = np.random.default_rng(n)
+    valores = pd.Series(rng.permutation(np.repeat(np.arange(n, dtype=np.int64) * 7919, 3)))
+    assert contar_distintos(valores, exato=True) == n
+    assert _dentro_do_erro(contar_distintos(valores, exato=False), n)
+
+
+def test_ausentes_ignorados():
+    valores = pd.Series([1, 2, None, 2, None], dtype="Int64")
+    assert contar_distintos(valores, exato=False) == 2
+
+
+@pytest.mark.parametrize("inicio, fim", PERIODOS)
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_sketches_dentro_do_erro(transacoes, agregados, filtros, inicio, fim):
+    real = _linhas(transacoes, filtros, inicio, fim)["cliente_id"].nunique()
+    estimativa = agregados.contar_usuarios(**filtros, inicio=inicio, fim=fim, exato=False)
+    assert _dentro_do_erro(estimativa, real)
+
+
+def test_sketches_de_usuarios_igual_aos_registros(transacoes, agregados):
+    # Montar direto das linhas ou pelos registros dobrados em blocos dá a mesma estimativa
+    direto = SketchesUsuarios.de_usuarios(transacoes)
+    assert direto.contar() == agregados.sketches().contar()
+    assert direto.contar(categoria="Moda") == agregados.sketches().contar(categoria="Moda")
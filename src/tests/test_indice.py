@@ -0,0 +1,74 @@
+"""Bitmaps de filtros e listas invertidas de chaves (utils.indice) contra máscaras do pandas."""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.indice import IndiceBitmap, IndiceChaves, intervalo_periodo
+
+# Períodos testados: sem datas, dentro dos dados, fora deles e invertido
+PERIODOS = [
+    (None, None),
+    ("2025-07-03", None),
+    (None, "2025-07-04"),
+    ("2025-07-02", "2025-07-06"),
+    ("2025-08-01", "2025-08-31"),
+    ("2025-06-01", "2025-06-30"),
+    ("2025-07-06", "2025-07-02"),
+]
+
+
+def _mascara_periodo(datas, inicio, fim):
+    # Linhas sem data ficam antes de qualquer dia: só entram em períodos sem início
+    mascara = np.ones(len(datas), dtype=bool)
+    if inicio:
+        mascara &= (datas >= pd.Timestamp(inicio)).to_numpy()
+    if fim:
+        mascara &= ((datas <= pd.Timestamp(fim)) | datas.isna()).to_numpy()
+    return mascara
+
+
+def _esperado(df, filtros, inicio, fim):
+    mascara = _mascara_periodo(df["data"], inicio, fim)
+    for coluna, valor in filtros.items():
+        if valor not in (None, "all"):
+            mascara &= (df[coluna] == valor).to_numpy()
+    return np.flatnonzero(mascara)
+
+
+@pytest.mark.parametrize("inicio, fim", PERIODOS)
+@pytest.mark.parametrize("categoria, tipo", list(itertools.product(
+    ["all", "Restaurantes", "Academias"], ["all", "Cashback", "Inexistente"])))
+def test_bitmap_igual_ao_pandas(agregados, categoria, tipo, inicio, fim):
+    fatos = agregados.fatos
+    filtros = {"categoria_estabelecimento": categoria, "tipo_cupom": tipo}
+    obtido = IndiceBitmap.de_tabela(fatos).selecionar(filtros, inicio, fim)
+    np.testing.assert_array_equal(obtido, _esperado(fatos, filtros, inicio, fim))
+
+
+def test_bitmap_sem_filtros_devolve_todas_as_linhas(agregados):
+    indice = IndiceBitmap.de_tabela(agregados.fatos)
+    np.testing.assert_array_equal(indice.selecionar({}), np.arange(len(agregados.fatos)))
+    np.testing.assert_array_equal(indice.selecionar({"tipo_cupom": None}),
+                                  np.arange(len(agregados.fatos)))
+
+
+@pytest.mark.parametrize("inicio, fim", PERIODOS)
+def test_intervalo_periodo_igual_ao_pandas(transacoes, inicio, fim):
+    # As transações estão ordenadas por data e hora, com as sem data no fim
+    com_data = transacoes[transacoes["data"].notna()]
+    a, b = intervalo_periodo(com_data, "data", inicio, fim)
+    esperado = np.flatnonzero(_mascara_periodo(com_data["data"], inicio, fim))
+    np.testing.assert_array_equal(np.arange(a, b), esperado)
+
+
+@pytest.mark.parametrize("chaves", [[], [0], [2, 0], [1, 99], [-1], [3, 3]])
+@pytest.mark.parametrize("a, b", [(0, None), (50, 400), (300, 300)])
+def test_indice_chaves_igual_ao_isin(transacoes, chaves, a, b):
+    lojas = transacoes["id_loja"].to_numpy()
+    limite = len(lojas) if b is None else b
+    esperado = np.flatnonzero(np.isin(lojas, chaves))
+    esperado = esperado[(esperado >= a) & (esperado < limite)]
+    np.testing.assert_array_equal(IndiceChaves(lojas).selecionar(chaves, a, b), esperado)
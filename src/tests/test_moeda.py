@@ -0,0 +1,47 @@
+"""Conversão dos textos de dinheiro para centavos inteiros (utils.moeda)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.leitura import ler_csv_tipado
+from utils.moeda import _EXEMPLOS, para_centavos, reais
+from utils.schemas import ESQUEMAS
+
+from conftest import VALORES_INVALIDOS, escrever_transacoes
+
+
+@pytest.mark.parametrize("texto, esperado", list(_EXEMPLOS.items()))
+def test_exemplos(texto, esperado):
+    obtido = para_centavos(pd.Series([texto], dtype=object))[0]
+    assert (None if pd.isna(obtido) else int(obtido)) == esperado
+
+
+def test_textos_repetidos_e_ausentes():
+    valores = pd.Series(["1.234,56", None, "abc", "1.234,56", "0.1"], index=[5, 6, 7, 8, 9])
+    centavos = para_centavos(valores)
+    assert str(centavos.dtype) == "Int64"
+    assert list(centavos.index) == [5, 6, 7, 8, 9]
+    assert centavos.tolist() == [123456, pd.NA, pd.NA, 123456, 10]
+
+
+def test_numeros_arredondados_para_o_centavo():
+    centavos = para_centavos(pd.Series([0.1 + 0.2, 848.2, np.nan]))
+    assert centavos.tolist() == [30, 84820, pd.NA]
+    assert reais(centavos).tolist()[:2] == [0.3, 848.2]
+
+
+def test_soma_exata_em_int64():
+    # Em float, somar 0,10 um milhão de vezes não dá exatamente 100.000,00
+    valores = pd.Series(["0.10"] * 1_000_000, dtype=object)
+    assert pd.to_numeric(valores).sum() != 100_000
+    assert int(para_centavos(valores).sum()) == 10_000_000
+
+
+def test_texto_invalido_conta_como_falha_na_carga(tmp_path):
+    path = escrever_transacoes(tmp_path / "transacoes_cupons.csv")
+    df, relatorio = ler_csv_tipado(ESQUEMAS["trans"], str(path))
+    # O texto vazio é só um ausente; os demais são falhas de conversão
+    assert relatorio.falhas_coercao == {"valor_cupom": len(VALORES_INVALIDOS) - 1}
+    assert df["valor_cupom"].isna().sum() == len(VALORES_INVALIDOS)
+    assert str(df["valor_cupom"].dtype) == "Int64"
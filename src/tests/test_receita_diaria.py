@@ -0,0 +1,141 @@
+"""Filtro de lojas e segmentos (utils.dimensoes) e rollup de receita diária (utils.receita_diaria)."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dicionario import compactar_categorias
+from utils.dimensoes import SEGMENTOS_EQUIVALENTES, DimensaoLojas, conformar_lojas
+from utils.indice import IndiceChaves
+from utils.receita_diaria import MEDIDAS_RECEITA, ReceitaDiaria
+
+from test_indice import PERIODOS, _mascara_periodo
+
+# Filtros (segmento, loja) testados, nos dois vocabulários de segmento
+FILTROS_LOJAS = [
+    ("Restaurantes", "all"),
+    ("restaurante", "all"),
+    ("Farmácias e Drogarias", "all"),
+    ("all", "Droga Raia"),
+    ("all", "  droga   RAIA "),
+    ("Restaurantes", "Droga Raia"),
+    ("all", "Subway"),
+    ("Academias", "all"),
+    ("all", "Loja Inexistente"),
+]
+
+
+@pytest.fixture(scope="module")
+def massa():
+    """lojas_valores de teste: a mesma loja aparece com vários tipos de loja."""
+    rng = np.random.default_rng(3)
+    n = 300
+    lojas = rng.choice(["Droga Raia", "droga raia ", "Outback", "Subway"], n)
+    datas = pd.Series(pd.Timestamp("2025-07-01") + pd.to_timedelta(rng.integers(0, 10, n), unit="D"))
+    datas[rng.random(n) < 0.03] = pd.NaT
+    df = pd.DataFrame({
+        "data_captura": datas,
+        "nome_loja": lojas,
+        "tipo_loja": rng.choice(["farmácia", "restaurante", "outros"], n),
+        "valor_compra": pd.array(rng.integers(1_000, 90_000, n), dtype="Int64"),
+    })
+    df.loc[rng.choice(n, 5, replace=False), "valor_compra"] = pd.NA
+    return conformar_lojas(compactar_categorias(df))
+
+
+@pytest.fixture(scope="module")
+def dimensao(agregados, massa):
+    return DimensaoLojas.de_tabelas(agregados.fatos, massa)
+
+
+def _normalizado(serie):
+    return serie.astype(str).str.lower().str.strip().str.replace(r"\s+", " ", regex=True)
+
+
+def _mascara_lojas(segmentos, lojas, segmento, loja):
+    """Linhas de um filtro (segmento, loja), comparando os nomes normalizados."""
+    mascara = np.ones(len(segmentos), dtype=bool)
+    if segmento != "all":
+        alvo = SEGMENTOS_EQUIVALENTES.get(segmento.lower(), segmento.lower())
+        mascara &= (_normalizado(segmentos).replace(SEGMENTOS_EQUIVALENTES) == alvo).to_numpy()
+    if loja != "all":
+        mascara &= (_normalizado(lojas) == " ".join(loja.lower().split())).to_numpy()
+    return mascara
+
+
+def _linhas_trans(transacoes, segmento, loja, inicio=None, fim=None):
+    mascara = _mascara_lojas(transacoes["categoria_estabelecimento"],
+                             transacoes["nome_estabelecimento"], segmento, loja)
+    return transacoes[mascara & _mascara_periodo(transacoes["data"], inicio, fim)]
+
+
+def _linhas_massa(massa, segmento, loja, inicio=None, fim=None):
+    mascara = _mascara_lojas(massa["tipo_loja"], massa["nome_loja"], segmento, loja)
+    return massa[mascara & _mascara_periodo(massa["data_captura"], inicio, fim)]
+
+
+@pytest.mark.parametrize("segmento, loja", FILTROS_LOJAS)
+def test_cada_linha_de_massa_mantem_o_seu_segmento(massa, dimensao, segmento, loja):
+    pontos = dimensao.resolver(segmento, loja)
+    obtido = IndiceChaves(massa["id_ponto"].to_numpy()).selecionar(pontos)
+    np.testing.assert_array_equal(obtido, np.flatnonzero(
+        _mascara_lojas(massa["tipo_loja"], massa["nome_loja"], segmento, loja)))
+
+
+@pytest.mark.parametrize("segmento, loja", FILTROS_LOJAS)
+def test_filtro_de_pontos_nas_transacoes(transacoes, agregados, dimensao, segmento, loja):
+    filtrado = agregados.filtrar(pontos=dimensao.resolver(segmento, loja))
+    assert filtrado.total_transacoes == len(_linhas_trans(transacoes, segmento, loja))
+
+
+def test_resolver_sem_filtro_e_em_cache(dimensao):
+    assert dimensao.resolver("all", "all") is None
+    assert dimensao.resolver(None, "all") is None
+    assert dimensao.resolver("Moda", "all") is dimensao.resolver("Moda", "all")
+    assert len(dimensao.resolver("Academias", "all")) == 0
+
+
+@pytest.mark.parametrize("inicio, fim", PERIODOS)
+@pytest.mark.parametrize("segmento, loja", FILTROS_LOJAS + [("all", "all")])
+def test_totais_iguais_ao_pandas(transacoes, agregados, massa, dimensao, segmento, loja, inicio, fim):
+    receita = ReceitaDiaria.de_tabelas(agregados.fatos, massa)
+    totais = receita.totais(dimensao.resolver(segmento, loja), inicio, fim)
+    trans = _linhas_trans(transacoes, segmento, loja, inicio, fim)
+    compras = _linhas_massa(massa, segmento, loja, inicio, fim)["valor_compra"]
+    assert totais == {
+        "valor_cupom": int(trans["valor_cupom"].sum()),
+        "repasse_picmoney": int(trans["repasse_picmoney"].sum()),
+        "valor_cupom_n": int(trans["valor_cupom"].count()),
+        "valor_compra": int(compras.sum()),
+        "compras": int(compras.count()),
+    }
+
+
+def test_por_ponto_somado_por_loja(agregados, massa, dimensao):
+    receita = ReceitaDiaria.de_tabelas(agregados.fatos, massa)
+    somas = receita.por_ponto(dimensao.resolver("restaurante", "all"))
+    por_loja = somas.groupby(dimensao.lojas_dos_pontos(somas.index)).sum()
+    linhas = _linhas_massa(massa, "restaurante", "all")
+    esperado = linhas.groupby("id_loja")["valor_compra"].sum()
+    assert por_loja["valor_compra"][por_loja["compras"] > 0].to_dict() == esperado[esperado > 0].to_dict()
+
+
+def test_mes_ate(transacoes, agregados, massa):
+    receita = ReceitaDiaria.de_tabelas(agregados.fatos, massa)
+    dia = pd.Timestamp("2025-07-05 15:00")
+    trans = transacoes[(transacoes["data"] >= "2025-07-01") & (transacoes["data"] <= "2025-07-05")]
+    assert receita.mes_ate(dia)["valor_cupom"] == int(trans["valor_cupom"].sum())
+    assert receita.ultimo_dia == transacoes["data"].max()
+
+
+def test_adicionar_em_partes_igual_ao_todo(agregados, massa):
+    inteiro = ReceitaDiaria.de_tabelas(agregados.fatos, massa)
+    partes = ReceitaDiaria()
+    fatos = agregados.fatos
+    for parte in (fatos.iloc[::2], fatos.iloc[1::2]):
+        partes.adicionar(parte["data"], parte["id_ponto"], parte[MEDIDAS_RECEITA[:3]])
+    partes.adicionar(massa["data_captura"], massa["id_ponto"],
+                     massa[["valor_compra"]].assign(compras=massa["valor_compra"].notna()))
+    assert len(partes) == len(inteiro)
+    for inicio, fim in PERIODOS:
+        assert partes.totais(None, inicio, fim) == inteiro.totais(None, inicio, fim)
@@ -0,0 +1,119 @@
+"""Invalidação dos snapshots Feather (utils.snapshot) quando o CSV ou o pipeline mudam."""
+
+import os
+
+import pandas as pd
+import pytest
+
+from utils import snapshot
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def origem(tmp_path):
+    path = tmp_path / "dados.csv"
+    path.write_text("a;b\n1;x\n2;y\n", encoding="utf-8")
+    return str(path)
+
+
+class Preparar:
+    """Função 'preparar' que lê o CSV e conta quantas vezes foi chamada."""
+
+    def __init__(self, path):
+        self.path = path
+        self.chamadas = 0
+
+    def __call__(self):
+        self.chamadas += 1
+        df = pd.read_csv(self.path, sep=";")
+        return df, {"linhas": len(df)}
+
+
+def _snapshots(path, nome="dados"):
+    pasta = os.path.join(os.path.dirname(path), snapshot.PASTA_SNAPSHOTS)
+    return sorted(a for a in os.listdir(pasta) if a.startswith(f"{nome}-"))
+
+
+def test_segunda_carga_usa_o_snapshot(origem):
+    preparar = Preparar(origem)
+    df, metadados, de_onde = snapshot.carregar_com_snapshot("dados", origem, preparar)
+    assert de_onde == "csv"
+    df2, metadados2, de_onde2 = snapshot.carregar_com_snapshot("dados", origem, preparar)
+    assert (de_onde2, preparar.chamadas) == ("snapshot", 1)
+    pd.testing.assert_frame_equal(df2, df)
+    assert metadados2 == metadados == {"linhas": 2}
+
+
+def test_nova_versao_do_pipeline_invalida(origem, monkeypatch):
+    preparar = Preparar(origem)
+    snapshot.carregar_com_snapshot("dados", origem, preparar)
+    monkeypatch.setattr(snapshot, "VERSAO_PIPELINE", snapshot.VERSAO_PIPELINE + 1)
+    _, _, de_onde = snapshot.carregar_com_snapshot("dados", origem, preparar)
+    assert (de_onde, preparar.chamadas) == ("csv", 2)
+    # O snapshot da versão anterior é apagado
+    assert len(_snapshots(origem)) == 1
+
+
+def test_csv_alterado_invalida(origem):
+    preparar = Preparar(origem)
+    snapshot.carregar_com_snapshot("dados", origem, preparar)
+    with open(origem, "a", encoding="utf-8") as f:
+        f.write("3;z\n")
+    df, _, de_onde = snapshot.carregar_com_snapshot("dados", origem, preparar)
+    assert (de_onde, len(df)) == ("csv", 3)
+    assert len(_snapshots(origem)) == 1
+
+
+def test_mesmo_tamanho_e_data_nao_le_o_csv(origem, monkeypatch):
+    snapshot.carregar_com_snapshot("dados", origem, Preparar(origem))
+
+    def proibido(path):
+        raise AssertionError("o hash guardado deveria ter sido reaproveitado")
+
+    monkeypatch.setattr(snapshot, "hash_conteudo", proibido)
+    _, _, de_onde = snapshot.carregar_com_snapshot("dados", origem, Preparar(origem))
+    assert de_onde == "snapshot"
+
+
+def test_arquivo_tocado_com_o_mesmo_conteudo(origem, monkeypatch):
+    snapshot.carregar_com_snapshot("dados", origem, Preparar(origem))
+    info = os.stat(origem)
+    os.utime(origem, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+    calculados = []
+    original = snapshot.hash_conteudo
+    monkeypatch.setattr(snapshot, "hash_conteudo", lambda path: calculados.append(path) or original(path))
+    _, _, de_onde = snapshot.carregar_com_snapshot("dados", origem, Preparar(origem))
+    # A data mudou, então o conteúdo é relido; como é o mesmo, o snapshot continua valendo
+    assert (de_onde, len(calculados)) == ("snapshot", 1)
+
+
+def test_snapshot_corrompido_recarrega_o_csv(origem):
+    snapshot.carregar_com_snapshot("dados", origem, Preparar(origem))
+    pasta = os.path.join(os.path.dirname(origem), snapshot.PASTA_SNAPSHOTS)
+    with open(os.path.join(pasta, _snapshots(origem)[0]), "wb") as f:
+        f.write(b"lixo")
+    preparar = Preparar(origem)
+    df, _, de_onde = snapshot.carregar_com_snapshot("dados", origem, preparar)
+    assert (de_onde, preparar.chamadas, len(df)) == ("csv", 1, 2)
+
+
+def test_tabelas_invalidadas_pela_dependencia(origem, tmp_path):
+    dependencia = tmp_path / "players.csv"
+    dependencia.write_text("c\n1\n", encoding="utf-8")
+    chamadas = []
+
+    def preparar():
+        chamadas.append(1)
+        return {"t1": pd.DataFrame({"a": [1, 2]}), "t2": pd.DataFrame({"b": ["x"]})}, {"n": 2}
+
+    argumentos = ("agregados", origem, preparar, [str(dependencia)])
+    _, _, de_onde = snapshot.carregar_tabelas_com_snapshot(*argumentos)
+    tabelas, metadados, de_onde2 = snapshot.carregar_tabelas_com_snapshot(*argumentos)
+    assert (de_onde, de_onde2, len(chamadas)) == ("csv", "snapshot", 1)
+    assert list(tabelas) == ["t1", "t2"] and metadados == {"n": 2}
+    pd.testing.assert_frame_equal(tabelas["t1"], pd.DataFrame({"a": [1, 2]}))
+
+    dependencia.write_text("c\n1\n2\n", encoding="utf-8")
+    _, _, de_onde3 = snapshot.carregar_tabelas_com_snapshot(*argumentos)
+    assert (de_onde3, len(chamadas)) == ("csv", 2)
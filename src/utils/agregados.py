@@ -0,0 +1,463 @@
+# =============================================================================
+# AGREGADOS INCREMENTAIS DAS TRANSAÇÕES
+# =============================================================================
+
+"""
+Agregados das transações de cupons usados pelos dashboards CEO e CFO.
+
+Em vez de manter cada linha de transacoes_cupons.csv em memória, cada bloco
+lido do arquivo é dobrado em tabelas cujo tamanho depende apenas da
+cardinalidade das dimensões de filtro (dias, horas, categorias, tipos de
+cupom, bairros, lojas, faixas etárias e faixas de valor), e não do número de
+transações nem do número de usuários:
+
+- fatos: contagens e somas por dia, categoria, tipo de cupom, bairro e
+  estabelecimento (KPIs, resgates por segmento/dia, receita); é a única
+  tabela com o detalhe por loja usado pelo filtro de loja do CFO;
+- horarios: resgates por dia, hora, categoria, tipo, bairro e faixa etária
+  do cliente (a faixa vem da base de players na própria carga), que alimentam
+  o cross-filter e os resgates por hora do CEO;
+- usuarios: o mesmo sem a hora, para o gráfico de faixa etária;
+- valores: número de cupons por dia, categoria, estabelecimento e faixa de
+  valor de LARGURA_FAIXA_VALOR centavos, para o histograma e a mediana;
+- registros: o maior posto HyperLogLog por célula (dia, categoria, tipo,
+  bairro) e registrador, de onde saem os sketches de usuários únicos
+  (utils.hll).
+
+Com PICMONEY_CONTAGEM_EXATA=1 (auditoria) há também a tabela clientes, com os
+clientes distintos de cada célula, para contagens exatas.
+
+Os blocos são reduzidos parcialmente e as parciais são recompactadas de tempos
+em tempos, então a memória usada não cresce com o número de linhas do arquivo.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np   # Faixas de valor e mediana
+import pandas as pd  # Agrupamentos e concatenação das parciais
+
+from utils.dicionario import alinhar_categorias, dicionario
+from utils.hll import CHAVES_SKETCH, CONTAGEM_EXATA, SketchesUsuarios, registros_de_usuarios
+from utils.indice import IndiceBitmap, IndiceChaves
+from utils.moeda import reais
+
+# Granularidade de cada tabela agregada
+CHAVES_FATOS = [
+    "data", "categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento",
+    "nome_estabelecimento",
+]
+CHAVES_USUARIOS = [
+    "data", "categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento", "faixa_etaria",
+]
+CHAVES_HORARIOS = CHAVES_USUARIOS[:1] + ["hour"] + CHAVES_USUARIOS[1:]
+CHAVES_VALORES = ["data", "categoria_estabelecimento", "nome_estabelecimento", "faixa_valor"]
+CHAVES_REGISTROS = CHAVES_SKETCH + ["registrador"]
+CHAVES_CLIENTES = CHAVES_SKETCH + ["cliente_id"]
+
+# Colunas de medida de cada tabela (todas somáveis)
+MEDIDAS_FATOS = ["transacoes", "resgates", "valor_cupom", "valor_cupom_n", "repasse_picmoney"]
+MEDIDAS_USUARIOS = ["transacoes", "resgates"]
+MEDIDAS_VALORES = ["transacoes"]
+
+# Largura (em centavos) das faixas de valor da tabela 'valores'. Deve ser uma
+# potência de 10, para que as faixas do histograma (1, 2 ou 5 x 10^k) sejam
+# formadas por faixas inteiras
+LARGURA_FAIXA_VALOR = 1000
+
+# Número aproximado de faixas do histograma de valor dos cupons
+FAIXAS_HISTOGRAMA = 20
+
+# Colunas de filtro aceitas por AgregadosTransacoes.filtrar
+_COLUNAS_FILTRO = {
+    "categoria": "categoria_estabelecimento",
+    "tipo_cupom": "tipo_cupom",
+    "bairro": "bairro_estabelecimento",
+}
+
+# Tabelas filtradas por AgregadosTransacoes.filtrar
+_TABELAS_FILTRO = ("fatos", "usuarios", "valores", "clientes")
+
+
+def _reduzir(partes, chaves, reducao="sum"):
+    """Combina as medidas de várias parciais com a mesma granularidade (soma ou máximo)."""
+    df = pd.concat(alinhar_categorias(partes), ignore_index=True) if len(partes) > 1 else partes[0]
+    return df.groupby(chaves, observed=True, dropna=False, sort=False).agg(reducao).reset_index()
+
+
+def _parcial_fatos(bloco):
+    return (bloco
+            .groupby(CHAVES_FATOS, observed=True, dropna=False, sort=False)
+            .agg(transacoes=("id_cupom", "size"),
+                 resgates=("id_cupom", "count"),
+                 valor_cupom=("valor_cupom", "sum"),
+                 valor_cupom_n=("valor_cupom", "count"),
+                 repasse_picmoney=("repasse_picmoney", "sum"))
+            # Somas em centavos, sem ausentes: inteiros numpy (somados em int64 no cubo)
+            .astype({"valor_cupom": "int64", "valor_cupom_n": "int64", "repasse_picmoney": "int64"})
+            .reset_index())
+
+
+def _parcial_horarios(bloco):
+    return (bloco
+            .groupby(CHAVES_HORARIOS, observed=True, dropna=False, sort=False)
+            .agg(transacoes=("id_cupom", "size"), resgates=("id_cupom", "count"))
+            .reset_index())
+
+
+def _parcial_valores(bloco):
+    # Faixa de LARGURA_FAIXA_VALOR centavos de cada cupom (ausentes ficam de fora)
+    return (bloco
+            .assign(faixa_valor=bloco["valor_cupom"] // LARGURA_FAIXA_VALOR)
+            .dropna(subset=["faixa_valor"])
+            .astype({"faixa_valor": "int64"})
+            .groupby(CHAVES_VALORES, observed=True, dropna=False, sort=False)
+            .agg(transacoes=("id_cupom", "size"))
+            .reset_index())
+
+
+def _parcial_clientes(bloco):
+    return (bloco[bloco["cliente_id"].notna().to_numpy()]
+            .groupby(CHAVES_CLIENTES, observed=True, dropna=False, sort=False)
+            .agg(transacoes=("id_cupom", "size"))
+            .reset_index())
+
+
+# Tabela -> (chaves, função que gera a parcial de um bloco, redução das parciais)
+_TABELAS = {
+    "fatos": (CHAVES_FATOS, _parcial_fatos, "sum"),
+    "horarios": (CHAVES_HORARIOS, _parcial_horarios, "sum"),
+    "valores": (CHAVES_VALORES, _parcial_valores, "sum"),
+    "registros": (CHAVES_REGISTROS, registros_de_usuarios, "max"),
+}
+_TABELA_CLIENTES = {"clientes": (CHAVES_CLIENTES, _parcial_clientes, "sum")}
+
+
+class AcumuladorTransacoes:
+    """
+    Dobra blocos de transações (já pré-processados) nas tabelas agregadas.
+
+    Args:
+        players: Base de players pré-processada (cliente_id e faixa_etaria);
+            sem ela, a faixa etária fica ausente
+        exato: Mantém também a tabela clientes (contagens exatas); None usa
+            CONTAGEM_EXATA
+        compactar_a_cada: Número de parciais acumuladas antes de reduzi-las a uma só
+    """
+
+    def __init__(self, players=None, exato=None, compactar_a_cada=8):
+        self.compactar_a_cada = compactar_a_cada
+        self._tabelas = dict(_TABELAS)
+        if CONTAGEM_EXATA if exato is None else exato:
+            self._tabelas.update(_TABELA_CLIENTES)
+        self._partes = {nome: [] for nome in self._tabelas}
+        # Faixa etária de cada cliente (um cliente repetido na base conta uma vez)
+        self._faixas = None
+        if players is not None:
+            self._faixas = (players.dropna(subset=["cliente_id"])
+                            .drop_duplicates("cliente_id")
+                            .set_index("cliente_id")["faixa_etaria"])
+
+    def _com_faixa_etaria(self, bloco):
+        dtype = dicionario.dtype("faixa_etaria")
+        if self._faixas is None:
+            faixa = pd.Categorical.from_codes(np.full(len(bloco), -1), dtype=dtype)
+        else:
+            posicoes = self._faixas.index.get_indexer(bloco["cliente_id"])
+            codigos = self._faixas.astype(dtype).cat.codes.to_numpy()
+            faixa = pd.Categorical.from_codes(np.where(posicoes >= 0, codigos[posicoes], -1), dtype=dtype)
+        return bloco.assign(faixa_etaria=faixa)
+
+    def adicionar(self, bloco):
+        """Incorpora um bloco de linhas aos agregados."""
+        bloco = self._com_faixa_etaria(bloco)
+        for nome, (chaves, parcial, reducao) in self._tabelas.items():
+            partes = self._partes[nome]
+            partes.append(parcial(bloco))
+            if len(partes) >= self.compactar_a_cada:
+                self._partes[nome] = [_reduzir(partes, chaves, reducao)]
+
+    def finalizar(self):
+        """
+        Reduz as parciais restantes.
+
+        Returns:
+            Dicionário nome da tabela -> DataFrame, ordenado por data, com as
+            chaves de texto como category
+        """
+        tabelas = {}
+        for nome, (chaves, _, reducao) in self._tabelas.items():
+            partes = self._partes[nome]
+            if partes:
+                df = _reduzir(partes, chaves, reducao)
+            else:
+                df = pd.DataFrame(columns=chaves)
+            for coluna in chaves:
+                if df[coluna].dtype == object:
+                    df[coluna] = df[coluna].astype("category")
+            # Ordenadas por dia (ausentes primeiro), como exige o IndiceBitmap
+            tabelas[nome] = df.sort_values("data", kind="stable", na_position="first",
+                                           ignore_index=True)
+        # A tabela de usuários é a de horários somada nas horas
+        tabelas["usuarios"] = (_reduzir([tabelas["horarios"].drop(columns="hour")], CHAVES_USUARIOS)
+                               .sort_values("data", kind="stable", na_position="first",
+                                            ignore_index=True))
+        # Dia da semana em inglês, como em db_utils.derivar_dia_semana
+        tabelas["fatos"]["weekday"] = dicionario.codificar(
+            tabelas["fatos"]["data"].dt.day_name(), "weekday")
+        return tabelas
+
+
+def mediana_faixas(faixas, pesos, largura=LARGURA_FAIXA_VALOR):
+    """
+    Mediana de uma amostra agrupada em faixas de mesma largura.
+
+    Interpola linearmente dentro da faixa em que a frequência acumulada chega
+    à metade do total, então o erro é menor que a largura de uma faixa.
+
+    Args:
+        faixas: Número da faixa de cada linha (limite inferior = faixa * largura)
+        pesos: Frequência de cada linha
+        largura: Largura das faixas
+
+    Returns:
+        Mediana na unidade de 'largura', ou NaN sem observações
+    """
+    faixas = np.asarray(faixas, dtype=np.int64)
+    pesos = np.asarray(pesos, dtype=np.int64)
+    validos = pesos > 0
+    if not validos.any():
+        return np.nan
+    distintas, inversa = np.unique(faixas[validos], return_inverse=True)
+    frequencias = np.zeros(len(distintas), dtype=np.int64)
+    np.add.at(frequencias, inversa, pesos[validos])
+    acumulado = np.cumsum(frequencias)
+    metade = acumulado[-1] / 2
+    i = int(np.searchsorted(acumulado, metade))
+    anteriores = acumulado[i - 1] if i else 0
+    return (distintas[i] + (metade - anteriores) / frequencias[i]) * largura
+
+
+def faixas_histograma(valores, n=FAIXAS_HISTOGRAMA, passo_minimo=0.0):
+    """
+    Bordas das faixas de um histograma com cerca de n faixas.
+
+    O passo é arredondado para 1, 2 ou 5 x 10^k (como os histogramas
+    automáticos do Plotly), nunca menor que passo_minimo, e a primeira borda
+    é múltipla do passo.
+
+    Returns:
+        Vetor crescente com as bordas (número de faixas + 1)
+    """
+    valores = np.asarray(valores, dtype="float64")
+    valores = valores[np.isfinite(valores)]
+    if not len(valores):
+        return np.array([0.0, 1.0])
+    menor, maior = valores.min(), valores.max()
+    bruto = max((maior - menor) / n if maior > menor else 1.0, passo_minimo)
+    escala = 10.0 ** np.floor(np.log10(bruto))
+    passo = next(m * escala for m in (1, 2, 5, 10) if m * escala >= bruto)
+    inicio = np.floor(menor / passo) * passo
+    n_faixas = int(np.floor((maior - inicio) / passo)) + 1
+    return inicio + passo * np.arange(n_faixas + 1)
+
+
+def classificar_faixas(valores, bordas):
+    """Número da faixa de cada valor (-1 para ausentes ou fora das bordas)."""
+    valores = np.asarray(valores, dtype="float64")
+    faixa = np.searchsorted(bordas, valores, side="right") - 1
+    # O valor igual à última borda fica na última faixa
+    faixa[valores == bordas[-1]] = len(bordas) - 2
+    fora = ~np.isfinite(valores) | (faixa < 0) | (faixa > len(bordas) - 2)
+    return np.where(fora, -1, faixa).astype(np.int16)
+
+
+def _limites_faixas(valores):
+    """Limite inferior (em reais) de cada faixa de valor da tabela 'valores'."""
+    return reais(valores["faixa_valor"].to_numpy(np.int64) * LARGURA_FAIXA_VALOR)
+
+
+@dataclass
+class AgregadosTransacoes:
+    """Tabelas agregadas das transações e os indicadores derivados delas."""
+    fatos: pd.DataFrame
+    usuarios: pd.DataFrame = None
+    valores: pd.DataFrame = None
+    horarios: pd.DataFrame = None
+    registros: pd.DataFrame = None
+    clientes: pd.DataFrame = None
+    _indices: dict = field(default_factory=dict, repr=False, compare=False)
+    _sketches: SketchesUsuarios = field(default=None, repr=False, compare=False)
+    faixas_valor: np.ndarray = field(default=None, repr=False, compare=False)
+
+    def indice(self, tabela):
+        """Índice de bitmaps dos filtros da tabela, construído no primeiro uso."""
+        indice = self._indices.get(tabela)
+        if indice is None:
+            indice = self._indices[tabela] = IndiceBitmap.de_tabela(getattr(self, tabela))
+        return indice
+
+    def indice_pontos(self, tabela):
+        """Listas invertidas de id_ponto da tabela (utils.dimensoes), construídas no primeiro uso."""
+        chave = (tabela, "id_ponto")
+        indice = self._indices.get(chave)
+        if indice is None:
+            indice = self._indices[chave] = IndiceChaves(getattr(self, tabela)["id_ponto"].to_numpy())
+        return indice
+
+    def sketches(self):
+        """Sketches HyperLogLog de usuários por célula, construídos no primeiro uso."""
+        if self._sketches is None:
+            self._sketches = SketchesUsuarios.de_registros(self.registros)
+            # Os registros só servem para montar os sketches (mais compactos)
+            self.registros = None
+        return self._sketches
+
+    def indexar(self):
+        """
+        Constrói antecipadamente os índices (e os sketches) das tabelas filtráveis
+        e fixa as faixas do histograma de valores.
+        """
+        for tabela in _TABELAS_FILTRO:
+            if getattr(self, tabela) is not None:
+                self.indice(tabela)
+                if "id_ponto" in getattr(self, tabela).columns:
+                    self.indice_pontos(tabela)
+        if self.valores is not None and self.faixas_valor is None:
+            # As faixas do histograma são formadas por faixas de valor inteiras
+            limites = _limites_faixas(self.valores)
+            self.faixas_valor = faixas_histograma(limites, passo_minimo=reais(LARGURA_FAIXA_VALOR))
+            self.valores["faixa_histograma"] = classificar_faixas(limites, self.faixas_valor)
+        if self.registros is not None and not CONTAGEM_EXATA:
+            self.sketches()
+
+    def filtrar(self, categoria="all", tipo_cupom="all", bairro="all",
+                inicio=None, fim=None, tabelas=_TABELAS_FILTRO, pontos=None):
+        """
+        Aplica os filtros dos dashboards às tabelas agregadas.
+
+        Filtros com valor 'all' (ou None) são ignorados. Tabelas que não têm a
+        coluna de algum filtro ativo (ex.: usuarios com filtro de lojas), ou que
+        não estão em 'tabelas', ficam como None no resultado.
+
+        Args:
+            pontos: Conjunto de id_ponto, pares (loja, segmento) de um filtro de
+                lojas (ver utils.dimensoes.DimensaoLojas.resolver); None = sem
+                filtro de lojas
+
+        Returns:
+            Novo AgregadosTransacoes com as tabelas filtradas
+        """
+        filtros = {
+            _COLUNAS_FILTRO[nome]: valor
+            for nome, valor in (("categoria", categoria), ("tipo_cupom", tipo_cupom),
+                                ("bairro", bairro))
+            if valor not in (None, "all")
+        }
+
+        def aplicar(nome):
+            df = getattr(self, nome)
+            if df is None or any(coluna not in df.columns for coluna in filtros):
+                return None
+            if pontos is not None and "id_ponto" not in df.columns:
+                return None
+            if not filtros and not inicio and not fim and pontos is None:
+                return df
+            indice = self.indice(nome)
+            if pontos is None:
+                return df.take(indice.selecionar(filtros, inicio, fim))
+            posicoes = self.indice_pontos(nome).selecionar(pontos, *indice.intervalo(inicio, fim))
+            if filtros:
+                posicoes = np.intersect1d(posicoes, indice.selecionar(filtros, inicio, fim),
+                                          assume_unique=True)
+            return df.take(posicoes)
+
+        return AgregadosTransacoes(**{
+            nome: aplicar(nome) if nome in tabelas else None
+            for nome in _TABELAS_FILTRO
+        }, faixas_valor=self.faixas_valor)
+
+    # ---------------------- Indicadores ----------------------
+
+    @property
+    def total_transacoes(self):
+        return int(self.fatos["transacoes"].sum())
+
+    @property
+    def usuarios_unicos(self):
+        """Contagem exata de usuários (ver contar_usuarios para a aproximada)."""
+        if self.clientes is None:
+            raise ValueError("contagem exata indisponível: carregue as transações com "
+                             "PICMONEY_CONTAGEM_EXATA=1")
+        return self.clientes["cliente_id"].nunique()
+
+    def contar_usuarios(self, categoria="all", tipo_cupom="all", bairro="all",
+                        inicio=None, fim=None, exato=None):
+        """
+        Usuários únicos com os filtros dos dashboards.
+
+        Por padrão a contagem vem da união dos sketches HyperLogLog das células
+        selecionadas (erro relativo típico de utils.hll.ERRO_PADRAO). Com
+        exato=True (ou PICMONEY_CONTAGEM_EXATA=1) filtra a tabela de clientes,
+        mantida só quando a carga é feita com PICMONEY_CONTAGEM_EXATA=1, e
+        conta os clientes distintos.
+        """
+        if CONTAGEM_EXATA if exato is None else exato:
+            return self.filtrar(categoria=categoria, tipo_cupom=tipo_cupom, bairro=bairro,
+                                inicio=inicio, fim=fim, tabelas=("clientes",)).usuarios_unicos
+        return self.sketches().contar(categoria=categoria, tipo_cupom=tipo_cupom, bairro=bairro,
+                                      inicio=inicio, fim=fim)
+
+    @property
+    def estabelecimentos(self):
+        return self.fatos.loc[self.fatos["transacoes"] > 0, "nome_estabelecimento"].nunique()
+
+    # Somas em centavos (exatas); os indicadores abaixo são em reais
+
+    @property
+    def receita(self):
+        return reais(self.fatos["valor_cupom"].sum())
+
+    @property
+    def repasse(self):
+        return reais(self.fatos["repasse_picmoney"].sum())
+
+    @property
+    def ticket_medio(self):
+        n = self.fatos["valor_cupom_n"].sum()
+        return self.receita / n if n else np.nan
+
+    @property
+    def mediana_valor_cupom(self):
+        """Mediana interpolada nas faixas de LARGURA_FAIXA_VALOR centavos (em reais)."""
+        return reais(mediana_faixas(self.valores["faixa_valor"], self.valores["transacoes"]))
+
+    def histograma_valor_cupom(self):
+        """
+        Histograma do valor dos cupons, com as mesmas faixas para qualquer filtro.
+
+        Returns:
+            (bordas das faixas em reais, número de transações em cada faixa)
+        """
+        valores = self.valores
+        if self.faixas_valor is None or "faixa_histograma" not in valores.columns:
+            limites = _limites_faixas(valores)
+            bordas = faixas_histograma(limites, passo_minimo=reais(LARGURA_FAIXA_VALOR))
+            faixa = classificar_faixas(limites, bordas)
+        else:
+            bordas, faixa = self.faixas_valor, valores["faixa_histograma"].to_numpy()
+        validas = faixa >= 0
+        contagens = np.zeros(len(bordas) - 1, dtype=np.int64)
+        np.add.at(contagens, faixa[validas], valores["transacoes"].to_numpy(np.int64)[validas])
+        return bordas, contagens
+
+    @property
+    def data_min(self):
+        return self.fatos["data"].min()
+
+    @property
+    def data_max(self):
+        return self.fatos["data"].max()
+
+    def distintos(self, coluna):
+        """Valores distintos (ordenados) de uma coluna de chave das transações."""
+        return sorted(self.fatos[coluna].dropna().unique())
@@ -0,0 +1,133 @@
+# =============================================================================
+# BUSCA DE LOJAS (FILTRO "LOJA ESPECÍFICA" DO CFO)
+# =============================================================================
+
+"""
+Busca incremental (typeahead) sobre os nomes de todas as lojas.
+
+O filtro de loja do CFO não recebe a lista inteira: a cada tecla o navegador
+envia o texto digitado e o servidor devolve só as primeiras lojas
+encontradas, das com mais resgates para as com menos. As lojas são as da
+dimensão conformada (utils.dimensoes), que junta nome_estabelecimento
+(transações) e nome_loja (lojas_valores).
+
+O IndiceLojas guarda, em ordem alfabética, o nome normalizado (minúsculas e
+sem acentos) a partir do início de cada palavra, então as lojas com alguma
+palavra começando pelo texto digitado saem de uma busca binária. Para textos
+com TAMANHO_NGRAMA ou mais caracteres, um índice invertido de n-gramas acha
+também as lojas que contêm o texto no meio de uma palavra, sem percorrer
+todos os nomes.
+"""
+
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np   # Listas de lojas por n-grama e ranking
+
+# Número máximo de lojas devolvidas por busca
+LIMITE_RESULTADOS = 20
+
+# Tamanho dos n-gramas do índice de substrings
+TAMANHO_NGRAMA = 3
+
+
+def normalizar_nome(nome):
+    """Forma usada nas buscas: minúsculas, sem acentos e com espaços simples."""
+    sem_acento = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(sem_acento.lower().split())
+
+
+class IndiceLojas:
+    """
+    Índice de prefixos de palavras e de n-gramas dos nomes das lojas.
+
+    Atributos:
+        nomes: Nome de cada loja (a posição é o id da loja no índice)
+        volumes: Resgates de cada loja (ordem dos resultados)
+    """
+
+    def __init__(self, nomes, volumes):
+        self.nomes = np.asarray(nomes, dtype=object)
+        self.volumes = np.asarray(volumes, dtype=np.int64)
+        self._normalizados = [normalizar_nome(n) for n in self.nomes]
+
+        # Trechos do nome a partir do início de cada palavra, em ordem alfabética
+        trechos = []
+        for loja, nome in enumerate(self._normalizados):
+            inicio = 0
+            for palavra in nome.split(" "):
+                trechos.append((nome[inicio:], loja))
+                inicio += len(palavra) + 1
+        trechos.sort()
+        self._trechos = [t for t, _ in trechos]
+        self._lojas_trechos = np.array([loja for _, loja in trechos], dtype=np.int64)
+
+        # n-grama -> lojas (ordenadas) que o contêm
+        ngramas = {}
+        for loja, nome in enumerate(self._normalizados):
+            for i in range(len(nome) - TAMANHO_NGRAMA + 1):
+                ngramas.setdefault(nome[i:i + TAMANHO_NGRAMA], set()).add(loja)
+        self._ngramas = {g: np.array(sorted(lojas), dtype=np.int64) for g, lojas in ngramas.items()}
+
+        # Lojas da com mais resgates para a com menos (empate: ordem alfabética)
+        self._ranking = np.lexsort((self.nomes.astype(str), -self.volumes))
+        self._posicao_ranking = np.empty(len(self._ranking), dtype=np.int64)
+        self._posicao_ranking[self._ranking] = np.arange(len(self._ranking))
+
+    @classmethod
+    def de_dimensao(cls, dimensao):
+        """
+        Monta o índice com as lojas da dimensão conformada.
+
+        Args:
+            dimensao: utils.dimensoes.DimensaoLojas; lojas só de lojas_valores
+                ficam com 0 resgates
+        """
+        return cls(dimensao.lojas["loja"].to_numpy(), dimensao.lojas["resgates"].to_numpy())
+
+    def _com_ngramas(self, texto):
+        """Lojas cujo nome normalizado contém o texto (com TAMANHO_NGRAMA+ caracteres)."""
+        listas = []
+        for i in range(len(texto) - TAMANHO_NGRAMA + 1):
+            lojas = self._ngramas.get(texto[i:i + TAMANHO_NGRAMA])
+            if lojas is None:
+                return np.empty(0, dtype=np.int64)
+            listas.append(lojas)
+        # Interseção começando pela lista mais curta
+        listas.sort(key=len)
+        candidatas = listas[0]
+        for lojas in listas[1:]:
+            candidatas = np.intersect1d(candidatas, lojas, assume_unique=True)
+        # Os n-gramas podem estar em posições diferentes: confirma a substring
+        return np.array([loja for loja in candidatas if texto in self._normalizados[loja]],
+                        dtype=np.int64)
+
+    def buscar(self, texto, limite=LIMITE_RESULTADOS):
+        """
+        Lojas encontradas para o texto digitado.
+
+        Vêm primeiro as lojas com uma palavra começando pelo texto e depois as
+        que o contêm no meio de uma palavra; em cada grupo, das com mais
+        resgates para as com menos. Sem texto, as lojas com mais resgates.
+
+        Returns:
+            Lista com os nomes das lojas (no máximo 'limite')
+        """
+        texto = normalizar_nome(texto or "")
+        if not texto:
+            return list(self.nomes[self._ranking[:limite]])
+
+        a = bisect_left(self._trechos, texto)
+        b = bisect_left(self._trechos, texto + "\uffff")
+        inicio_palavra = np.unique(self._lojas_trechos[a:b])
+        meio_palavra = np.empty(0, dtype=np.int64)
+        if len(texto) >= TAMANHO_NGRAMA:
+            meio_palavra = np.setdiff1d(self._com_ngramas(texto), inicio_palavra, assume_unique=True)
+
+        resultado = []
+        for lojas in (inicio_palavra, meio_palavra):
+            if len(resultado) >= limite:
+                break
+            lojas = lojas[np.argsort(self._posicao_ranking[lojas], kind="stable")]
+            resultado.extend(self.nomes[lojas[:limite - len(resultado)]])
+        return resultado
@@ -0,0 +1,647 @@
+# =============================================================================
+# CUBO OLAP DAS TRANSAÇÕES (DASHBOARD CEO)
+# =============================================================================
+
+"""
+Cubo pré-agregado usado pelo callback do dashboard CEO.
+
+As células do cubo são as combinações não vazias de (dia, categoria, tipo de
+cupom, bairro), com as contagens e somas de valor das transações e um
+histograma de 24 posições com os resgates por hora (da tabela 'horarios' dos
+agregados, já que a de fatos não separa as horas). Cada dimensão é guardada como um vetor de códigos inteiros e as células ficam
+ordenadas por dia, de modo que:
+
+- o filtro de período é uma busca binária (fatia contígua);
+- os filtros de categoria/tipo/bairro são comparações de inteiros;
+- cada gráfico é um rollup (somas inteiras por grupo) sobre os códigos combinados.
+
+O custo de cada interação depende do número de células, e não do número de
+transações. Para o KPI de estabelecimentos, o cubo guarda também os pares
+distintos (célula, id_loja) com transações, ordenados por célula: uma tabela
+esparsa que cresce com os pares existentes, e não com células x lojas.
+
+Para os mapas de calor há também o TensorAtividade: os resgates em um array
+denso [dia, hora, categoria, tipo de cupom, bairro], em que qualquer filtro é
+uma seleção de índices nos eixos seguida de uma soma. O array é limitado a
+LIMITE_BYTES_TENSOR; acima disso os filtros voltam para o cubo esparso.
+
+Para o cross-filter entre os gráficos, o CuboCruzado (dia, hora, categoria,
+tipo, bairro e faixa etária dos usuários) gera, por estado dos filtros, um
+TensorCruzado pequeno em que cada clique é uma máscara por eixo e uma soma.
+
+Para o modo de filtros no navegador, compactar_cubo gera uma versão do cubo
+sem a hora (com um histograma de horas por célula) em vetores binários
+compactos, re-agregada por callbacks clientside (assets/filtros_cliente.js).
+Ela cobre os resgates, o ticket médio e os gráficos do cubo. Usuários ativos
+(sketches HyperLogLog de 16 KB por célula), estabelecimentos (lojas por
+célula) e o gráfico de faixa etária não vão ao navegador: nesse modo cada
+"Aplicar" ainda faz um pedido ao servidor para eles.
+"""
+
+import base64        # Vetores do cubo compacto enviado ao navegador
+
+import numpy as np   # Códigos, rollups e listas de lojas
+import pandas as pd  # Rótulos e DataFrames de saída
+
+from utils.agregados import MEDIDAS_FATOS
+from utils.moeda import reais
+from utils.indice import DIA_AUSENTE, IndiceBitmap, dias_desde_epoca, posicoes_das_listas
+
+# Dimensões do cubo, na ordem usada para ordenar as células
+DIMENSOES_CUBO = ["data", "categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento"]
+
+# Hora dos resgates, vinda do histograma de horas de cada célula
+DIMENSAO_HORA = "hour"
+
+# Dimensão derivada do dia, disponível nos rollups
+DIMENSOES_DERIVADAS = ["weekday"]
+
+# Eixos do TensorAtividade
+DIMENSOES_TENSOR = ["data", DIMENSAO_HORA, "categoria_estabelecimento", "tipo_cupom",
+                    "bairro_estabelecimento"]
+
+# Memória máxima (bytes) do TensorAtividade; acima disso ele guarda apenas
+# [dia, hora, categoria] e, se nem assim couber, não é montado (os filtros
+# passam a ser respondidos pelo cubo esparso)
+LIMITE_BYTES_TENSOR = 32 * 2 ** 20
+
+_NOMES_DIAS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+
+def _codigos_dias(datas, dias):
+    """Posição de cada data no eixo de dias do cubo (-1 = ausente ou fora do eixo)."""
+    datas = np.asarray(datas, dtype="datetime64[D]")
+    if not len(dias):
+        return np.full(len(datas), -1, dtype=np.int32)
+    numero = (datas - dias[0].to_datetime64().astype("datetime64[D]")).astype(np.int64)
+    validas = ~np.isnat(datas) & (numero >= 0) & (numero < len(dias))
+    return np.where(validas, numero, -1).astype(np.int32)
+
+
+def _chave_celula(codigos, rotulos):
+    """Chave inteira (ordenada pelo dia) da célula de cada linha, nas DIMENSOES_CUBO."""
+    chave = np.zeros(len(codigos["data"]), dtype=np.int64)
+    for dimensao in DIMENSOES_CUBO:
+        chave = chave * (len(rotulos[dimensao]) + 1) + (np.asarray(codigos[dimensao]) + 1)
+    return chave
+
+
+def _codificar(serie):
+    """Retorna (códigos inteiros, rótulos) de uma coluna; ausentes viram -1."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy().astype(np.int32), serie.cat.categories
+    codigos, rotulos = pd.factorize(serie, sort=True)
+    return codigos.astype(np.int32), pd.Index(rotulos)
+
+
+def _somar_por_grupo(grupos, valores, n, dtype=np.int64):
+    """
+    Soma de 'valores' em cada grupo (0 a n-1).
+
+    Medidas inteiras (centavos e contagens) são somadas em inteiros (int64,
+    ou 'dtype' quando o total cabe nele), sem passar por float; as demais,
+    por np.bincount.
+    """
+    valores = np.asarray(valores)
+    if valores.dtype.kind in "iub":
+        somas = np.zeros(n, dtype=dtype)
+        np.add.at(somas, grupos, valores)
+        return somas
+    return np.bincount(grupos, weights=valores, minlength=n)
+
+
+class Cubo:
+    """
+    Cubo esparso: uma linha por célula não vazia.
+
+    Atributos:
+        codigos: dimensão -> vetor de códigos por célula (-1 = ausente)
+        rotulos: dimensão -> Index com o valor de cada código
+        medidas: medida -> vetor de somas por célula
+        horas: matriz (células x 24) com os resgates por hora
+        lojas: id_loja (utils.dimensoes) com transações em cada célula, em
+            sequência, célula após célula
+        inicios_lojas: posição em 'lojas' onde começa cada célula (n + 1 posições)
+    """
+
+    def __init__(self, codigos, rotulos, medidas, horas, lojas, inicios_lojas):
+        self.codigos = codigos
+        self.rotulos = rotulos
+        self.medidas = medidas
+        self.horas = horas
+        self.lojas = lojas
+        self.inicios_lojas = inicios_lojas
+        self._indice = None
+
+    @classmethod
+    def de_fatos(cls, fatos, horarios):
+        """
+        Monta o cubo a partir das tabelas de fatos e de horários de utils.agregados.
+
+        Args:
+            fatos: DataFrame com as colunas de DIMENSOES_CUBO, 'id_loja'
+                (utils.dimensoes.conformar_lojas) e as medidas de MEDIDAS_FATOS
+            horarios: DataFrame com as colunas de DIMENSOES_CUBO, 'hour' e 'resgates'
+        """
+        codigos, rotulos = {}, {}
+        for dimensao in DIMENSOES_CUBO:
+            if dimensao == "data":
+                # Dias como inteiros desde o primeiro dia (ordem natural do calendário)
+                dias = fatos["data"].to_numpy("datetime64[D]")
+                valido = ~np.isnat(dias)
+                inicio = dias[valido].min() if valido.any() else np.datetime64("1970-01-01")
+                numero = np.where(valido, (dias - inicio).astype("int64"), -1)
+                n_dias = int(numero.max()) + 1 if len(numero) else 0
+                codigos["data"] = numero.astype(np.int32)
+                rotulos["data"] = pd.date_range(inicio, periods=n_dias, freq="D")
+            else:
+                codigos[dimensao], rotulos[dimensao] = _codificar(fatos[dimensao])
+
+        # Agrupa as linhas de fatos (que também separam por loja) nas células do cubo
+        celulas, inversa = np.unique(_chave_celula(codigos, rotulos), return_inverse=True)
+        n = len(celulas)
+
+        # Representante de cada célula para recuperar os códigos das dimensões
+        primeiro = np.full(n, len(fatos), dtype=np.int64)
+        np.minimum.at(primeiro, inversa, np.arange(len(fatos)))
+        codigos = {d: c[primeiro] for d, c in codigos.items()}
+
+        medidas = {}
+        for m in MEDIDAS_FATOS:
+            medidas[m] = _somar_por_grupo(inversa, fatos[m].to_numpy(), n)
+
+        # Pares distintos (célula, loja), ordenados por célula e depois por loja
+        id_loja = fatos["id_loja"].to_numpy().astype(np.int64)
+        n_lojas = int(id_loja.max(initial=0)) + 1
+        validas = (id_loja >= 0) & (fatos["transacoes"].to_numpy() > 0)
+        pares = np.unique(inversa[validas].astype(np.int64) * n_lojas + id_loja[validas])
+        celula_dos_pares, lojas = np.divmod(pares, n_lojas)
+        inicios_lojas = np.searchsorted(celula_dos_pares, np.arange(n + 1))
+
+        # Resgates por hora: cada linha de horários vai para a célula com as
+        # mesmas dimensões (horas ausentes ficam de fora, como no heatmap)
+        codigos_horarios = {"data": _codigos_dias(horarios["data"], rotulos["data"])}
+        for dimensao in DIMENSOES_CUBO[1:]:
+            codigos_horarios[dimensao] = rotulos[dimensao].get_indexer(horarios[dimensao])
+        chave = _chave_celula(codigos_horarios, rotulos)
+        celula = np.minimum(np.searchsorted(celulas, chave), max(n - 1, 0))
+        hora = horarios["hour"].to_numpy("float64", na_value=np.nan)
+        validas = (celulas[celula] == chave) & ~np.isnan(hora) if n else np.zeros(len(chave), bool)
+        horas = np.zeros((n, 24), dtype=np.int64)
+        np.add.at(horas, (celula[validas], hora[validas].astype(np.int64)),
+                  horarios["resgates"].to_numpy(np.int64)[validas])
+
+        # As chaves começam pelo dia, então as células já saem ordenadas por data
+        return cls(codigos, rotulos, medidas, horas, lojas.astype(np.int32), inicios_lojas)
+
+    def __len__(self):
+        return len(self.codigos["data"])
+
+    def _subcubo(self, selecao):
+        posicoes, tamanhos = posicoes_das_listas(self.inicios_lojas, selecao)
+        return Cubo(
+            {d: c[selecao] for d, c in self.codigos.items()},
+            self.rotulos,
+            {m: v[selecao] for m, v in self.medidas.items()},
+            self.horas[selecao],
+            self.lojas[posicoes],
+            np.concatenate([[0], np.cumsum(tamanhos)]),
+        )
+
+    def indice(self):
+        """Índice de bitmaps das células do cubo, construído no primeiro uso."""
+        if self._indice is None:
+            colunas = {d: (self.codigos[d], self.rotulos[d]) for d in DIMENSOES_CUBO[1:]}
+            dias = self.codigos["data"]
+            epoca = dias_desde_epoca(self.rotulos["data"])
+            if len(epoca):
+                dias = np.where(dias >= 0, epoca[dias], DIA_AUSENTE)
+            else:
+                dias = np.full(len(dias), DIA_AUSENTE)
+            self._indice = IndiceBitmap(colunas, dias)
+        return self._indice
+
+    def fatiar(self, categoria="all", tipo_cupom="all", bairro="all", inicio=None, fim=None):
+        """
+        Seleciona as células que atendem aos filtros do dashboard.
+
+        Filtros com valor 'all' (ou None) são ignorados.
+
+        Returns:
+            Novo Cubo apenas com as células selecionadas
+        """
+        filtros = {
+            "categoria_estabelecimento": categoria,
+            "tipo_cupom": tipo_cupom,
+            "bairro_estabelecimento": bairro,
+        }
+        return self._subcubo(self.indice().selecionar(filtros, inicio, fim))
+
+    # ---------------------- Consultas ----------------------
+
+    def total(self, medida):
+        """Soma de uma medida em todas as células."""
+        return self.medidas[medida].sum()
+
+    @property
+    def ticket_medio(self):
+        n = self.total("valor_cupom_n")
+        return reais(self.total("valor_cupom")) / n if n else np.nan
+
+    def lojas_distintas(self):
+        """Número de lojas com transações nas células do cubo."""
+        return int(len(np.unique(self.lojas)))
+
+    def _codigos_dimensao(self, dimensao):
+        if dimensao == "weekday":
+            # Dia da semana a partir do número do dia
+            dias = self.codigos["data"]
+            primeiro = self.rotulos["data"][0].dayofweek if len(self.rotulos["data"]) else 0
+            return np.where(dias >= 0, (dias + primeiro) % 7, -1), pd.Index(_NOMES_DIAS)
+        return self.codigos[dimensao], self.rotulos[dimensao]
+
+    def tensor(self, dimensoes, medida="resgates", dtype=np.int64):
+        """
+        Soma densa de uma medida por combinação das dimensões informadas.
+
+        Células com alguma dessas dimensões ausente são ignoradas, como nos
+        dropna dos gráficos. Com DIMENSAO_HORA, cada célula entra uma vez por
+        hora, com os resgates do seu histograma de horas.
+
+        Args:
+            dimensoes: Lista de dimensões (DIMENSOES_CUBO, DIMENSOES_DERIVADAS ou
+                DIMENSAO_HORA)
+            medida: Medida somada (padrão: 'resgates'; a única com DIMENSAO_HORA)
+            dtype: Tipo inteiro das somas (deve comportar o total da medida)
+
+        Returns:
+            (array com um eixo por dimensão, tupla com os rótulos de cada eixo)
+        """
+        if DIMENSAO_HORA in dimensoes:
+            if medida != "resgates":
+                raise ValueError(f"só há resgates por hora, não '{medida}'")
+            # Uma posição por (célula, hora)
+            horas = np.tile(np.arange(24, dtype=np.int32), len(self))
+            codigos, rotulos = zip(*(
+                (horas, pd.Index(range(24))) if d == DIMENSAO_HORA
+                else (lambda c, r: (np.repeat(c, 24), r))(*self._codigos_dimensao(d))
+                for d in dimensoes))
+            valores = self.horas.ravel()
+        else:
+            codigos, rotulos = zip(*(self._codigos_dimensao(d) for d in dimensoes))
+            valores = self.medidas[medida]
+        tamanhos = tuple(len(r) for r in rotulos)
+        validas = np.ones(len(valores), dtype=bool)
+        chave = np.zeros(len(valores), dtype=np.int64)
+        for c, tamanho in zip(codigos, tamanhos):
+            validas &= c >= 0
+            chave = chave * tamanho + c
+        somas = _somar_por_grupo(chave[validas], valores[validas], int(np.prod(tamanhos)), dtype)
+        return somas.reshape(tamanhos), rotulos
+
+    def rollup(self, dimensoes, medida="resgates"):
+        """
+        Soma uma medida por combinação das dimensões informadas (ver tensor).
+
+        Returns:
+            DataFrame com uma coluna por dimensão e a coluna da medida, apenas
+            com as combinações de valor diferente de zero
+        """
+        somas, rotulos = self.tensor(dimensoes, medida)
+        preenchidas = np.flatnonzero(somas)
+        saida = {}
+        for d, r, posicoes in zip(dimensoes, rotulos,
+                                  np.unravel_index(preenchidas, somas.shape)):
+            if isinstance(r, pd.CategoricalIndex) or r.dtype == object:
+                saida[d] = pd.Categorical.from_codes(posicoes, categories=r)
+            else:
+                saida[d] = r[posicoes]
+        saida[medida] = somas.ravel()[preenchidas]
+        return pd.DataFrame(saida)
+
+
+class TensorAtividade:
+    """
+    Medida do cubo em um array denso [dia, hora, categoria, tipo de cupom, bairro].
+
+    As contagens são uint32 quando o total da medida cabe nesse tipo. Se o
+    array passar de LIMITE_BYTES_TENSOR, os eixos de tipo de cupom e bairro
+    são somados e filtros sobre eles não podem ser respondidos (ver responde).
+
+    Atributos:
+        contagens: array denso com um eixo por dimensão
+        dimensoes: nomes dos eixos
+        rotulos: dimensão -> Index com o valor de cada posição do eixo
+    """
+
+    def __init__(self, contagens, dimensoes, rotulos):
+        self.contagens = contagens
+        self.dimensoes = list(dimensoes)
+        self.rotulos = rotulos
+
+    @classmethod
+    def de_cubo(cls, cubo, medida="resgates", limite=LIMITE_BYTES_TENSOR):
+        """
+        Monta o tensor a partir de um Cubo (normalmente o cubo completo).
+
+        Returns:
+            TensorAtividade, ou None se nem [dia, hora, categoria] couber em 'limite'
+        """
+        total = int(cubo.medidas[medida].sum())
+        dtype = np.dtype(np.uint32 if 0 <= total <= np.iinfo(np.uint32).max else np.int64)
+        for dimensoes in (DIMENSOES_TENSOR, DIMENSOES_TENSOR[:3]):
+            celulas = np.prod([24 if d == DIMENSAO_HORA else len(cubo.rotulos[d])
+                               for d in dimensoes], dtype=np.float64)
+            if celulas * dtype.itemsize <= limite:
+                contagens, rotulos = cubo.tensor(dimensoes, medida, dtype)
+                return cls(contagens, list(dimensoes), dict(zip(dimensoes, rotulos)))
+        return None
+
+    @property
+    def nbytes(self):
+        return self.contagens.nbytes
+
+    def responde(self, filtros):
+        """Indica se os filtros ativos (valor diferente de 'all') têm eixo no tensor."""
+        return all(d in self.dimensoes for d, v in filtros.items() if v not in (None, "all"))
+
+    def somar(self, manter, filtros=None, inicio=None, fim=None):
+        """
+        Soma o tensor nos eixos que não estão em 'manter', após os filtros.
+
+        Args:
+            manter: Dimensões mantidas no resultado, na ordem dos eixos do tensor
+            filtros: dimensão -> valor selecionado ('all' ou None = sem filtro)
+            inicio: Primeiro dia do período (opcional)
+            fim: Último dia do período (opcional)
+
+        Returns:
+            Array com um eixo por dimensão de 'manter', do tamanho dos rótulos
+            dessa dimensão (o eixo 'data', se mantido, cobre só o período)
+        """
+        dias = self.rotulos["data"]
+        a = dias.searchsorted(pd.Timestamp(inicio).normalize(), side="left") if inicio else 0
+        b = dias.searchsorted(pd.Timestamp(fim).normalize(), side="right") if fim else len(dias)
+        selecao = [slice(a, max(a, b))] + [slice(None)] * (len(self.dimensoes) - 1)
+        mantidos = {}
+        for dimensao, valor in (filtros or {}).items():
+            if valor in (None, "all"):
+                continue
+            rotulos = self.rotulos[dimensao]
+            if valor not in rotulos:
+                forma = [max(a, b) - a if d == "data" else len(self.rotulos[d]) for d in manter]
+                return np.zeros(forma, dtype=self.contagens.dtype)
+            posicao = rotulos.get_loc(valor)
+            if dimensao in manter:
+                # Eixo mantido: as demais posições são zeradas depois da soma
+                mantidos[manter.index(dimensao)] = posicao
+            else:
+                selecao[self.dimensoes.index(dimensao)] = slice(posicao, posicao + 1)
+        eixos = tuple(i for i, d in enumerate(self.dimensoes) if d not in manter)
+        soma = self.contagens[tuple(selecao)].sum(axis=eixos)
+        for eixo, posicao in mantidos.items():
+            apenas = [slice(None)] * soma.ndim
+            apenas[eixo] = slice(posicao, posicao + 1)
+            filtrada = np.zeros_like(soma)
+            filtrada[tuple(apenas)] = soma[tuple(apenas)]
+            soma = filtrada
+        return soma
+
+
+# =============================================================================
+# CROSS-FILTER ENTRE OS GRÁFICOS DO CEO
+# =============================================================================
+
+# Eixos do tensor do cross-filter (o dia e o bairro ficam nos filtros da página)
+DIMENSOES_CRUZADAS = ["weekday", "hour", "categoria_estabelecimento", "tipo_cupom", "faixa_etaria"]
+
+
+class CuboCruzado:
+    """
+    Resgates por (dia, hora, categoria, tipo de cupom, bairro, faixa etária).
+
+    Vem da tabela 'horarios' dos agregados, que já traz a faixa etária dos
+    clientes, então cobre tanto os gráficos do cubo quanto o de faixa etária.
+    Para cada estado dos filtros da página, tensor() condensa as células
+    selecionadas em um TensorCruzado denso e pequeno; cada clique nos
+    gráficos é respondido por ele, sem voltar às células.
+
+    Atributos:
+        codigos: dimensão -> vetor de códigos por célula (-1 = ausente)
+        rotulos: dimensão -> Index com o valor de cada código
+        resgates: vetor de resgates por célula
+    """
+
+    def __init__(self, codigos, rotulos, resgates, dias):
+        self.codigos = codigos
+        self.rotulos = rotulos
+        self.resgates = resgates
+        colunas = {d: (codigos[d], rotulos[d])
+                   for d in ("categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento")}
+        self._indice = IndiceBitmap(colunas, dias)
+
+    @classmethod
+    def de_horarios(cls, tabela):
+        """
+        Monta o cubo a partir da tabela 'horarios' de utils.agregados.
+
+        Args:
+            tabela: DataFrame com data, hour, categoria, tipo, bairro, faixa_etaria e resgates
+        """
+        datas = tabela["data"]
+        codigos, rotulos = {}, {}
+        codigos["weekday"] = np.where(datas.isna(), -1, datas.dt.dayofweek.fillna(0)).astype(np.int32)
+        rotulos["weekday"] = pd.Index(_NOMES_DIAS)
+        hora = tabela["hour"].astype("float64").to_numpy()
+        codigos["hour"] = np.where(np.isnan(hora), -1, hora).astype(np.int32)
+        rotulos["hour"] = pd.Index(range(24))
+        for dimensao in ("categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento", "faixa_etaria"):
+            codigos[dimensao], rotulos[dimensao] = _codificar(tabela[dimensao])
+        dias = dias_desde_epoca(datas)
+
+        # Uma célula por combinação; a chave começa pelo dia, então as células saem ordenadas
+        dimensoes = ["hour", "categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento",
+                     "faixa_etaria"]
+        validos = dias != DIA_AUSENTE
+        chave = np.where(validos, dias - (dias[validos].min() if validos.any() else 0) + 1, 0)
+        for dimensao in dimensoes:
+            chave = chave * (len(rotulos[dimensao]) + 1) + (codigos[dimensao] + 1)
+        celulas, primeiro, inversa = np.unique(chave, return_index=True, return_inverse=True)
+        resgates = _somar_por_grupo(inversa, tabela["resgates"].to_numpy(np.int64), len(celulas))
+        codigos = {d: c[primeiro] for d, c in codigos.items()}
+        return cls(codigos, rotulos, resgates, dias[primeiro])
+
+    def tensor(self, categoria="all", tipo_cupom="all", bairro="all", inicio=None, fim=None):
+        """
+        Tensor denso [dia da semana, hora, categoria, tipo, faixa] das células
+        que atendem aos filtros da página.
+
+        Returns:
+            TensorCruzado
+        """
+        filtros = {
+            "categoria_estabelecimento": categoria,
+            "tipo_cupom": tipo_cupom,
+            "bairro_estabelecimento": bairro,
+        }
+        selecao = self._indice.selecionar(filtros, inicio, fim)
+        # Uma posição extra no fim de cada eixo para os valores ausentes
+        tamanhos = tuple(len(self.rotulos[d]) + 1 for d in DIMENSOES_CRUZADAS)
+        chave = np.zeros(len(selecao), dtype=np.int64)
+        for dimensao, tamanho in zip(DIMENSOES_CRUZADAS, tamanhos):
+            codigos = self.codigos[dimensao][selecao]
+            chave = chave * tamanho + np.where(codigos >= 0, codigos, tamanho - 1)
+        contagens = _somar_por_grupo(chave, self.resgates[selecao], int(np.prod(tamanhos)))
+        return TensorCruzado(contagens.reshape(tamanhos),
+                             {d: self.rotulos[d] for d in DIMENSOES_CRUZADAS})
+
+
+class TensorCruzado:
+    """
+    Resgates em um array denso [dia da semana, hora, categoria, tipo, faixa]
+    (DIMENSOES_CRUZADAS), com uma posição extra por eixo para ausentes.
+    """
+
+    def __init__(self, contagens, rotulos):
+        self.contagens = contagens
+        self.rotulos = rotulos
+
+    def somar(self, manter, selecoes=None):
+        """
+        Soma os resgates nos eixos que não estão em 'manter', após as seleções.
+
+        Args:
+            manter: Dimensões mantidas no resultado, na ordem de DIMENSOES_CRUZADAS
+            selecoes: dimensão -> valores selecionados nos gráficos
+
+        Returns:
+            Array com um eixo por dimensão de 'manter', do tamanho dos rótulos
+            dessa dimensão (sem a posição dos ausentes, como nos dropna dos gráficos)
+        """
+        soma = self.contagens
+        for eixo, dimensao in enumerate(DIMENSOES_CRUZADAS):
+            valores = (selecoes or {}).get(dimensao)
+            if valores is None:
+                continue
+            rotulos = self.rotulos[dimensao]
+            mascara = np.zeros(soma.shape[eixo], dtype=bool)
+            mascara[[rotulos.get_loc(v) for v in valores if v in rotulos]] = True
+            forma = [1] * soma.ndim
+            forma[eixo] = -1
+            soma = soma * mascara.reshape(forma)
+        eixos = tuple(i for i, d in enumerate(DIMENSOES_CRUZADAS) if d not in manter)
+        soma = soma.sum(axis=eixos)
+        return soma[tuple(slice(0, -1) for _ in manter)]
+
+    def rollup(self, dimensoes, selecoes=None):
+        """
+        Resgates por combinação das dimensões, no formato de Cubo.rollup.
+
+        Returns:
+            DataFrame com uma coluna por dimensão e 'resgates', apenas com as
+            combinações de valor diferente de zero
+        """
+        somas = self.somar(dimensoes, selecoes)
+        preenchidas = np.flatnonzero(somas)
+        saida = {}
+        for d, posicoes in zip(dimensoes, np.unravel_index(preenchidas, somas.shape)):
+            r = self.rotulos[d]
+            if isinstance(r, pd.CategoricalIndex) or r.dtype == object:
+                saida[d] = pd.Categorical.from_codes(posicoes, categories=r)
+            else:
+                saida[d] = r[posicoes]
+        saida["resgates"] = somas.ravel()[preenchidas]
+        return pd.DataFrame(saida)
+
+
+# =============================================================================
+# CUBO COMPACTO PARA FILTRAGEM NO NAVEGADOR
+# =============================================================================
+
+# Dimensões das células enviadas ao navegador (a hora vira um histograma por célula)
+DIMENSOES_CLIENTE = ["data", "categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento"]
+
+# Medidas enviadas por célula
+MEDIDAS_CLIENTE = ["transacoes", "resgates", "valor_cupom", "valor_cupom_n"]
+
+# Tipos numéricos e o TypedArray correspondente no JavaScript
+_TIPOS_JS = [
+    (np.int8, "Int8Array"), (np.int16, "Int16Array"), (np.int32, "Int32Array"),
+]
+_TIPOS_JS_SEM_SINAL = [
+    (np.uint8, "Uint8Array"), (np.uint16, "Uint16Array"), (np.uint32, "Uint32Array"),
+]
+
+
+def _vetor_compacto(valores):
+    """
+    Codifica um vetor no menor TypedArray que comporta seus valores.
+
+    Inteiros usam o menor tipo (com sinal apenas se houver negativos); os demais
+    valores vão como Float64Array. Os bytes (little-endian) seguem em base64.
+
+    Returns:
+        {'tipo': nome do TypedArray, 'dados': bytes em base64}
+    """
+    valores = np.asarray(valores)
+    tipo_js = "Float64Array"
+    tipo = np.dtype("<f8")
+    if valores.dtype.kind in "iub":
+        minimo = int(valores.min()) if valores.size else 0
+        maximo = int(valores.max()) if valores.size else 0
+        for candidato, nome in _TIPOS_JS if minimo < 0 else _TIPOS_JS_SEM_SINAL:
+            info = np.iinfo(candidato)
+            if info.min <= minimo and maximo <= info.max:
+                tipo, tipo_js = np.dtype(candidato).newbyteorder("<"), nome
+                break
+    return {"tipo": tipo_js, "dados": base64.b64encode(valores.astype(tipo).tobytes()).decode("ascii")}
+
+
+def compactar_cubo(cubo):
+    """
+    Versão compacta do cubo para re-agregação no navegador (JSON de um dcc.Store).
+
+    As células são as combinações (dia, categoria, tipo de cupom, bairro); a hora
+    fica em um histograma denso de 24 posições por célula, com os resgates. Cada
+    coluna é um vetor de códigos ou somas no menor tipo numérico possível.
+
+    As lojas ficam de fora: o KPI de estabelecimentos é calculado no servidor,
+    então o tamanho do cubo enviado não depende do número de lojas.
+
+    Returns:
+        Dicionário com 'dias' (ISO), 'primeiro_dia_semana', 'rotulos' por
+        dimensão, 'colunas', 'medidas' e 'horas'
+    """
+    tamanhos = [len(cubo.rotulos[d]) + 1 for d in DIMENSOES_CLIENTE]
+    chave = np.zeros(len(cubo), dtype=np.int64)
+    for dimensao, tamanho in zip(DIMENSOES_CLIENTE, tamanhos):
+        chave = chave * tamanho + (cubo.codigos[dimensao] + 1)
+    # As chaves começam pelo dia, então as células continuam ordenadas por data
+    celulas, inversa = np.unique(chave, return_inverse=True)
+    n = len(celulas)
+
+    colunas = {
+        dimensao: _vetor_compacto(codigos.astype(np.int64) - 1)
+        for dimensao, codigos in zip(DIMENSOES_CLIENTE, np.unravel_index(celulas, tamanhos))
+    }
+
+    medidas = {}
+    for m in MEDIDAS_CLIENTE:
+        medidas[m] = _vetor_compacto(_somar_por_grupo(inversa, cubo.medidas[m], n))
+
+    # Histograma [célula, hora] dos resgates (horas ausentes ficam de fora, como no heatmap)
+    histograma = np.zeros((n, 24), dtype=np.int64)
+    np.add.at(histograma, inversa, cubo.horas)
+
+    dias = cubo.rotulos["data"]
+    return {
+        "n": int(n),
+        "dias": [d.date().isoformat() for d in dias],
+        "primeiro_dia_semana": int(dias[0].dayofweek) if len(dias) else 0,
+        "nomes_dias": _NOMES_DIAS,
+        "rotulos": {d: [str(r) for r in cubo.rotulos[d]] for d in DIMENSOES_CLIENTE[1:]},
+        "colunas": colunas,
+        "medidas": medidas,
+        "horas": _vetor_compacto(histograma.ravel()),
+    }
@@ -3,124 +3,398 @@
 # =============================================================================
 
 # Importação das bibliotecas necessárias
+import os            # Variáveis de ambiente de configuração
+import threading     # Travas do registro de datasets (callbacks rodam em threads)
+import time          # Medição do tempo de carga
 import pandas as pd  # Para manipulação de dados tabulares
-import numpy as np   # Para operações numéricas e valores ausentes
+
+# Cache colunar dos dados já pré-processados
+from utils.snapshot import carregar_com_snapshot, carregar_tabelas_com_snapshot
+# Esquemas declarados e leitura tipada dos CSVs
+from utils.schemas import ESQUEMAS
+from utils.leitura import (
+    RelatorioCarga, emitir_relatorio, ler_csv_tipado, ler_csv_tipado_em_blocos,
+)
+# Agregados incrementais das transações
+from utils.agregados import AcumuladorTransacoes, AgregadosTransacoes
+from utils.hll import CONTAGEM_EXATA
+# Dicionário compartilhado das colunas categóricas
+from utils.dicionario import compactar_categorias
+from utils.dimensoes import conformar_lojas
 
 # Definição dos caminhos dos arquivos CSV
 # Cada arquivo contém um conjunto específico de dados do sistema
-path_massa = "data/lojas_valores.csv"        # Dados das lojas e valores
-path_pedestres = "data/pedestres_paulista.csv"  # Dados de fluxo de pedestres
-path_trans = "data/transacoes_cupons.csv"    # Dados de transações de cupons
-path_players = "data/base_players.csv"       # Dados dos usuários do sistema
-
-# Carregamento dos arquivos CSV
-# Utilizamos parâmetros flexíveis para garantir a leitura correta:
-# - sep=None: Detecta automaticamente o separador
-# - engine="python": Usa o engine mais flexível do pandas
-# - encoding="utf-8": Garante suporte a caracteres especiais
-# - on_bad_lines='skip': Ignora linhas com problemas de formatação
-df_massa = pd.read_csv(path_massa, sep=None, engine="python", encoding="utf-8", on_bad_lines='skip')
-df_pedestres = pd.read_csv(path_pedestres, sep=None, engine="python", encoding="utf-8", on_bad_lines='skip')
-df_trans = pd.read_csv(path_trans, sep=None, engine="python", encoding="utf-8", on_bad_lines='skip')
-df_players = pd.read_csv(path_players, sep=None, engine="python", encoding="utf-8", on_bad_lines='skip')
+path_massa = ESQUEMAS["massa"].arquivo          # Dados das lojas e valores
+path_pedestres = ESQUEMAS["pedestres"].arquivo  # Dados de fluxo de pedestres
+path_trans = ESQUEMAS["trans"].arquivo          # Dados de transações de cupons
+path_players = ESQUEMAS["players"].arquivo      # Dados dos usuários do sistema
+
+# Último relatório de carga de cada dataset (nome -> RelatorioCarga)
+RELATORIOS_CARGA = {}
+
+# Número de linhas lidas por bloco na ingestão das transações
+TAMANHO_BLOCO_TRANS = 250_000
+
+# Com PICMONEY_MANTER_TRANSACOES=1, as transações também ficam em memória linha
+# a linha; caso contrário os dashboards usam apenas os agregados
+MANTER_TRANSACOES = os.environ.get("PICMONEY_MANTER_TRANSACOES", "") not in ("", "0")
 
 # =============================================================================
 # FUNÇÕES DE NORMALIZAÇÃO DE DADOS
 # =============================================================================
 
-def norm_cel(s):
+def chave_cliente(digitos):
     """
-    Normaliza números de celular removendo caracteres não numéricos.
-    
+    Gera a chave inteira do cliente a partir dos dígitos do celular.
+
+    O próprio número (até 18 dígitos) é usado como int64, então a mesma pessoa
+    recebe a mesma chave em todos os datasets sem precisar de um dicionário
+    compartilhado. Merges, contagens distintas e agrupamentos passam a usar
+    inteiros em vez de strings.
+
     Args:
-        s: String contendo o número de celular
-        
+        digitos: Series de strings contendo apenas dígitos
+
     Returns:
-        String contendo apenas os dígitos do número
+        Series do tipo Int64 (valores ausentes para números vazios ou inválidos)
     """
-    if pd.isna(s): return s  # Retorna como está se for valor ausente
-    return ''.join(ch for ch in str(s) if ch.isdigit())
-
-# Padronização dos números de celular em todos os datasets
-# Isso é necessário para permitir o cruzamento correto dos dados entre as tabelas
-for df in [df_massa, df_pedestres, df_trans, df_players]:
-    # Alguns datasets usam 'numero_celular', outros usam 'celular'
-    # Padronizamos para usar sempre 'celular'
-    if "numero_celular" in df.columns:
-        df["celular"] = df["numero_celular"].astype(str).apply(norm_cel)
-    if "celular" in df.columns:
-        df["celular"] = df["celular"].astype(str).apply(norm_cel)
-
-# Padronização dos campos de data
-# Convertemos todas as datas para o formato datetime do pandas
-# - dayfirst=True: Assume formato brasileiro (dia/mês/ano)
-# - errors="coerce": Converte valores inválidos para NaT (Not a Time)
-if "data_captura" in df_massa.columns:
-    df_massa["data_captura"] = pd.to_datetime(df_massa["data_captura"], dayfirst=True, errors="coerce")
-if "data" in df_pedestres.columns:
-    df_pedestres["data"] = pd.to_datetime(df_pedestres["data"], dayfirst=True, errors="coerce")
-if "data" in df_trans.columns:
-    df_trans["data"] = pd.to_datetime(df_trans["data"], dayfirst=True, errors="coerce")
-if "data_nascimento" in df_players.columns:
-    df_players["data_nascimento"] = pd.to_datetime(df_players["data_nascimento"], dayfirst=True, errors="coerce")
-
-# Hora: criar coluna datetime quando possível
-for df, date_col, time_col in [
-    (df_trans, "data", "hora"),
-    (df_pedestres, "data", "horario"),
-]:
+    validos = digitos.str.len().between(1, 18)
+    return pd.to_numeric(digitos.where(validos), errors="coerce").astype("Int64")
+
+
+def normalizar_celulares(df):
+    """
+    Padroniza os números de celular do DataFrame na coluna 'celular'.
+
+    Isso é necessário para permitir o cruzamento correto dos dados entre as tabelas.
+    Alguns datasets usam 'numero_celular', outros usam 'celular'; padronizamos
+    para usar sempre 'celular' (apenas dígitos) e 'cliente_id' (chave inteira).
+    A limpeza é vetorizada com uma única expressão regular sobre a coluna inteira.
+    """
+    origem = "numero_celular" if "numero_celular" in df.columns else "celular"
+    if origem not in df.columns:
+        return
+    digitos = df[origem].astype(str).str.replace(r"\D", "", regex=True)
+    df["celular"] = digitos
+    df["cliente_id"] = chave_cliente(digitos)
+
+
+def combinar_data_hora(df, date_col, time_col):
+    """Cria a coluna 'datetime' somando a data ao horário (já convertido em timedelta)."""
     if date_col in df.columns and time_col in df.columns:
-        df[time_col] = df[time_col].astype(str).str.zfill(4)  # tentativa
-        df["datetime"] = pd.to_datetime(df[date_col].dt.date.astype(str) + " " + df[time_col].astype(str), errors="coerce")
-
-# Converter colunas de valor para numérico (trocar vírgula por ponto se houver)
-# def money_to_float(s):
-#     if pd.isna(s): return np.nan
-#     t = str(s).replace(".", "").replace(",", ".")
-#     # remover símbolos não numéricos exceto ponto e minus
-#     t = ''.join(ch for ch in t if ch.isdigit() or ch == "." or ch == "-")
-#     try:
-#         return float(t)
-#     except:
-#         return np.nan
-#
-# # colunas possíveis
-# for col in ["valor_compra", "valor_cupom", "ultimo_valor_capturado", "repasse_picmoney"]:
-#     for df in [df_massa, df_trans, df_pedestres]:
-#         if col in df.columns:
-#             df[col] = df[col].apply(money_to_float)
-
-# idade: se houver em players ou pedestres, garantir numérico
-for df in [df_players, df_pedestres]:
-    if "idade" in df.columns:
-        df["idade"] = pd.to_numeric(df["idade"], errors="coerce")
+        df["datetime"] = df[date_col] + df[time_col]
 
-# faixa etária (bins)
-bins = [0, 17, 24, 34, 44, 54, 64, 200]
-labels = ["<=17","18-24","25-34","35-44","45-54","55-64","65+"]
-if "idade" in df_players.columns:
-    df_players["faixa_etaria"] = pd.cut(df_players["idade"], bins=bins, labels=labels, right=True)
 
-# weekday / hour helpers
-for df, date_col in [(df_trans, "data"), (df_massa, "data_captura"), (df_pedestres, "data")]:
+def derivar_dia_semana(df, date_col):
+    """
+    Cria a coluna 'weekday' com o nome do dia da semana.
+
+    No dicionário compartilhado o domínio 'weekday' é fixo (Monday..Sunday),
+    então os códigos da categórica são os números 0-6 do dia da semana.
+    """
     if date_col in df.columns:
         df["weekday"] = df[date_col].dt.day_name()
-for df, time_col in [(df_trans, "hora"), (df_pedestres, "horario")]:
+
+
+# Respostas consideradas "sim" em colunas textuais de sim/não
+VALORES_VERDADEIROS = ["true", "1", "1.0", "sim", "yes"]
+
+
+def derivar_possui_app(df, col="possui_app_picmoney"):
+    """Cria a coluna booleana 'possui_app' a partir da resposta textual sobre o app."""
+    if col in df.columns:
+        df["possui_app"] = (df[col].astype(str).str.lower().str.strip()
+                            .isin(VALORES_VERDADEIROS).to_numpy())
+
+
+def derivar_hora(df, time_col):
+    """Cria a coluna 'hour' (0-23) a partir do horário convertido em timedelta."""
     if time_col in df.columns:
-        # extrair hora (se formato HHMM ou HH:MM)
-        def extract_hour(x):
-            try:
-                s = str(x)
-                if ":" in s:
-                    return int(s.split(":")[0])
-                s = s.zfill(4)
-                return int(s[:2])
-            except:
-                return np.nan
-        df["hour"] = df[time_col].apply(extract_hour)
-
-# ready: df_massa, df_pedestres, df_trans, df_players
-#print("Pré-processamento concluído.")
-#print("Registros: massa={}, pedestres={}, trans={}, players={}".format(
-#    len(df_massa), len(df_pedestres), len(df_trans), len(df_players)
-#))
+        df["hour"] = (df[time_col] // pd.Timedelta(hours=1)).astype("Int64")
+
+
+def ordenar_por_tempo(df, coluna):
+    """
+    Ordena as linhas pela coluna de data/hora (ausentes no fim).
+
+    Com os datasets ordenados, filtros de período usam busca binária
+    (utils.indice.intervalo_periodo) em vez de comparar a coluna inteira.
+    """
+    if coluna not in df.columns:
+        return df
+    return df.sort_values(coluna, kind="stable", ignore_index=True)
+
+
+# faixa etária (bins)
+bins = [0, 17, 24, 34, 44, 54, 64, 200]
+labels = ["<=17","18-24","25-34","35-44","45-54","55-64","65+"]
+
+# =============================================================================
+# PRÉ-PROCESSAMENTO POR DATASET
+# =============================================================================
+# Todas as colunas derivadas usadas pelos gráficos (weekday, hour, possui_app,
+# faixa_etaria) são criadas aqui, uma única vez por carga. Depois disso os
+# DataFrames do registro são compartilhados entre callbacks (em threads) e
+# tratados como somente leitura: os gráficos não criam nem alteram colunas.
+
+def preparar_massa(df):
+    """Pré-processa os dados de lojas e valores (lojas_valores.csv)."""
+    normalizar_celulares(df)
+    derivar_dia_semana(df, "data_captura")
+    return ordenar_por_tempo(df, "data_captura")
+
+
+def preparar_pedestres(df):
+    """Pré-processa os dados de fluxo de pedestres (pedestres_paulista.csv)."""
+    normalizar_celulares(df)
+    combinar_data_hora(df, "data", "horario")
+    derivar_dia_semana(df, "data")
+    derivar_hora(df, "horario")
+    derivar_possui_app(df)
+    return ordenar_por_tempo(df, "datetime")
+
+
+def preparar_trans(df):
+    """Pré-processa as transações de cupons (transacoes_cupons.csv)."""
+    normalizar_celulares(df)
+    combinar_data_hora(df, "data", "hora")
+    derivar_dia_semana(df, "data")
+    derivar_hora(df, "hora")
+    return ordenar_por_tempo(df, "datetime")
+
+
+def preparar_players(df):
+    """Pré-processa a base de usuários (base_players.csv)."""
+    normalizar_celulares(df)
+    if "idade" in df.columns:
+        df["faixa_etaria"] = pd.cut(df["idade"], bins=bins, labels=labels, right=True)
+    return df
+
+
+# Pré-processamento específico de cada dataset do registro de esquemas
+PREPARADORES = {
+    "massa": preparar_massa,
+    "pedestres": preparar_pedestres,
+    "trans": preparar_trans,
+    "players": preparar_players,
+}
+
+
+def carregar_dataset(nome):
+    """
+    Lê e pré-processa um dataset, reaproveitando o snapshot colunar quando existir.
+
+    A leitura segue o esquema declarado em utils.schemas e gera um relatório
+    de carga, que fica disponível em RELATORIOS_CARGA[nome].
+
+    Args:
+        nome: Nome do dataset no registro de esquemas (ex.: "trans")
+
+    Returns:
+        DataFrame pronto para uso nos dashboards
+    """
+    esquema = ESQUEMAS[nome]
+
+    def preparar():
+        df, relatorio = ler_csv_tipado(esquema)
+        return compactar_categorias(PREPARADORES[nome](df)), relatorio.como_dict()
+
+    inicio = time.perf_counter()
+    df, metadados, origem = carregar_com_snapshot(nome, esquema.arquivo, preparar)
+    # Traz os códigos das categóricas para o dicionário deste processo e
+    # acrescenta as chaves conformadas de loja e segmento (não vão ao snapshot)
+    conformar_lojas(compactar_categorias(df))
+    relatorio = RelatorioCarga.de_dict(metadados)
+    if origem == "snapshot":
+        # Mantém as contagens da leitura original do CSV, com o tempo da carga atual
+        relatorio.origem = origem
+        relatorio.tempo_parse_s = time.perf_counter() - inicio
+    RELATORIOS_CARGA[nome] = relatorio
+    emitir_relatorio(relatorio)
+    return df
+
+
+def carregar_agregados_trans():
+    """
+    Monta os agregados das transações usados pelos dashboards.
+
+    Por padrão o CSV é lido em blocos de TAMANHO_BLOCO_TRANS linhas, e cada
+    bloco é pré-processado e dobrado nos agregados, sem manter as linhas em
+    memória. Se as transações já estiverem carregadas (ou MANTER_TRANSACOES
+    estiver ativo), os agregados são calculados a partir delas. A faixa etária
+    de cada cliente vem da base de players já na dobra dos blocos.
+
+    Returns:
+        AgregadosTransacoes
+    """
+    players = registro.get("players")
+    if MANTER_TRANSACOES or registro.carregado("trans"):
+        acumulador = AcumuladorTransacoes(players)
+        acumulador.adicionar(registro.get("trans"))
+        tabelas = acumulador.finalizar()
+        for tabela in tabelas.values():
+            conformar_lojas(tabela)
+        agregados = AgregadosTransacoes(**tabelas)
+        agregados.indexar()
+        return agregados
+
+    esquema = ESQUEMAS["trans"]
+
+    def preparar():
+        blocos, relatorio = ler_csv_tipado_em_blocos(esquema, TAMANHO_BLOCO_TRANS)
+        acumulador = AcumuladorTransacoes(players)
+        for bloco in blocos:
+            acumulador.adicionar(compactar_categorias(preparar_trans(bloco)))
+        return acumulador.finalizar(), relatorio.como_dict()
+
+    inicio = time.perf_counter()
+    # A tabela de clientes (contagem exata) só existe no snapshot de auditoria
+    nome = "trans_agregados_exatos" if CONTAGEM_EXATA else "trans_agregados"
+    tabelas, metadados, origem = carregar_tabelas_com_snapshot(
+        nome, esquema.arquivo, preparar, dependencias=[ESQUEMAS["players"].arquivo])
+    for tabela in tabelas.values():
+        conformar_lojas(compactar_categorias(tabela))
+    relatorio = RelatorioCarga.de_dict(metadados)
+    if origem == "snapshot":
+        relatorio.origem = origem
+        relatorio.tempo_parse_s = time.perf_counter() - inicio
+    RELATORIOS_CARGA["trans"] = relatorio
+    emitir_relatorio(relatorio)
+    agregados = AgregadosTransacoes(**tabelas)
+    # Índices de filtro prontos antes do primeiro clique
+    agregados.indexar()
+    return agregados
+
+
+# =============================================================================
+# REGISTRO DE DATASETS (CARGA SOB DEMANDA)
+# =============================================================================
+
+class RegistroDatasets:
+    """
+    Registro dos datasets carregados sob demanda.
+
+    Nada é lido na importação do módulo: cada dataset é carregado no primeiro
+    acesso e mantido em memória a partir daí. Um worker que só atende a página
+    de projeções, por exemplo, nunca lê o arquivo de pedestres.
+
+    Também guarda estruturas derivadas (agregados, índices, métricas) ligadas
+    à versão atual dos dados; ao recarregar, a versão muda e os derivados são
+    reconstruídos no próximo acesso.
+    """
+
+    def __init__(self, carregar=None):
+        self._carregar = carregar or carregar_dataset
+        self._carregadores = {}
+        self._dependentes = {}
+        self._dados = {}
+        self._derivados = {}
+        self._travas = {}
+        self._trava = threading.Lock()
+        self.versao = 0
+
+    def _trava_de(self, chave):
+        with self._trava:
+            return self._travas.setdefault(chave, threading.Lock())
+
+    def registrar(self, nome, carregar, dependencias=()):
+        """
+        Registra um dataset com carregador próprio (ex.: agregados).
+
+        Args:
+            nome: Nome usado em get()
+            carregar: Função sem argumentos que monta o dataset
+            dependencias: Datasets lidos por 'carregar'; recarregar qualquer um
+                deles descarta também este
+        """
+        self._carregadores[nome] = carregar
+        for dependencia in dependencias:
+            self._dependentes.setdefault(dependencia, set()).add(nome)
+
+    def get(self, nome):
+        """Retorna o dataset, carregando-o no primeiro acesso."""
+        df = self._dados.get(nome)
+        if df is None:
+            with self._trava_de(nome):
+                df = self._dados.get(nome)
+                if df is None:
+                    carregar = self._carregadores.get(nome)
+                    df = carregar() if carregar else self._carregar(nome)
+                    self._dados[nome] = df
+        return df
+
+    def carregado(self, nome):
+        """Indica se o dataset já está em memória."""
+        return nome in self._dados
+
+    def derivado(self, nome, construir):
+        """
+        Retorna uma estrutura derivada dos datasets, construída uma única vez
+        por versão dos dados.
+
+        Args:
+            nome: Identificador da estrutura (ex.: "metricas_historicas")
+            construir: Função sem argumentos que monta a estrutura
+        """
+        chave = (nome, self.versao)
+        if chave not in self._derivados:
+            with self._trava_de(chave):
+                if chave not in self._derivados:
+                    self._derivados[chave] = construir()
+        return self._derivados[chave]
+
+    def aquecer(self, nomes=None):
+        """
+        Pré-carrega os datasets informados (por padrão, todos os esquemas e
+        os datasets registrados).
+
+        Útil no processo mestre do servidor (ex.: gunicorn --preload), para
+        que os workers herdem os dados já carregados.
+        """
+        for nome in nomes or [*ESQUEMAS, *self._carregadores]:
+            self.get(nome)
+
+    def recarregar(self, nomes=None):
+        """
+        Descarta os datasets informados (por padrão, todos), e os registrados
+        como dependentes deles, e invalida os derivados.
+        """
+        with self._trava:
+            pendentes = list(nomes or self._dados)
+            while pendentes:
+                nome = pendentes.pop()
+                if self._dados.pop(nome, None) is not None:
+                    pendentes.extend(self._dependentes.get(nome, ()))
+            self._derivados.clear()
+            self.versao += 1
+
+
+# Registro global usado pelas páginas e gráficos
+registro = RegistroDatasets()
+registro.registrar("trans_agregados", carregar_agregados_trans, dependencias=("trans", "players"))
+
+# Datasets usados pelos dashboards (as transações linha a linha só quando mantidas)
+DATASETS_DASHBOARDS = ["massa", "pedestres", "players", "trans_agregados"]
+if MANTER_TRANSACOES:
+    DATASETS_DASHBOARDS.insert(0, "trans")
+
+
+def aquecer_datasets(nomes=None):
+    """Gancho de pré-carga dos datasets (ver RegistroDatasets.aquecer)."""
+    registro.aquecer(nomes or DATASETS_DASHBOARDS)
+
+
+# Compatibilidade: df_massa, df_pedestres, df_trans e df_players continuam
+# disponíveis como atributos do módulo, mas só são carregados quando acessados.
+_NOMES_LEGADOS = {
+    "df_massa": "massa",
+    "df_pedestres": "pedestres",
+    "df_trans": "trans",
+    "df_players": "players",
+}
+
+
+def __getattr__(nome):
+    if nome in _NOMES_LEGADOS:
+        return registro.get(_NOMES_LEGADOS[nome])
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
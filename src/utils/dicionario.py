@@ -0,0 +1,141 @@
+# =============================================================================
+# DICIONÁRIO COMPARTILHADO DE CATEGORIAS
+# =============================================================================
+
+"""
+Codificação das colunas de texto de baixa cardinalidade como categóricas com
+um dicionário único para todos os datasets.
+
+Colunas que representam o mesmo conceito em arquivos diferentes (ex.: o tipo de
+cupom em transações e em lojas_valores, o nome da loja e o nome do
+estabelecimento) pertencem ao mesmo domínio e recebem os mesmos códigos
+inteiros. O dicionário só cresce: valores novos entram no fim do domínio e
+códigos já atribuídos nunca mudam, então agrupamentos e concatenações
+trabalham sobre os códigos em vez de comparar strings.
+"""
+
+import threading  # Proteção do dicionário (callbacks rodam em threads)
+
+import pandas as pd  # Tipos categóricos
+
+# Coluna -> domínio de valores
+DOMINIOS = {
+    "tipo_cupom": "tipo_cupom",
+    "ultimo_tipo_cupom": "tipo_cupom",
+    "categoria_estabelecimento": "segmento",
+    "tipo_loja": "segmento",
+    "ultimo_tipo_loja": "segmento",
+    "nome_estabelecimento": "loja",
+    "nome_loja": "loja",
+    "bairro_estabelecimento": "bairro",
+    "bairro_residencial": "bairro",
+    "bairro_trabalho": "bairro",
+    "bairro_escola": "bairro",
+    "cidade_residencial": "cidade",
+    "cidade_trabalho": "cidade",
+    "cidade_escola": "cidade",
+    "local_captura": "local",
+    "local": "local",
+    "categoria_frequentada": "categoria_frequentada",
+    "tipo_celular": "tipo_celular",
+    "modelo_celular": "modelo_celular",
+    "possui_app_picmoney": "possui_app_picmoney",
+    "sexo": "sexo",
+    "weekday": "weekday",
+    "faixa_etaria": "faixa_etaria",
+}
+
+# Domínios com valores conhecidos de antemão (e ordem significativa)
+DOMINIOS_FIXOS = {
+    "weekday": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"],
+    "faixa_etaria": ["<=17", "18-24", "25-34", "35-44", "45-54", "55-64", "65+"],
+}
+
+
+class DicionarioCategorias:
+    """Dicionário de valores por domínio, com códigos estáveis (somente acréscimo)."""
+
+    def __init__(self):
+        self._valores = {}
+        self._trava = threading.Lock()
+        for dominio, valores in DOMINIOS_FIXOS.items():
+            self._valores[dominio] = list(valores)
+
+    def dtype(self, dominio):
+        """CategoricalDtype com todos os valores conhecidos do domínio."""
+        return pd.CategoricalDtype(self._valores.get(dominio, []),
+                                   ordered=dominio in DOMINIOS_FIXOS)
+
+    def registrar(self, dominio, valores):
+        """Acrescenta ao domínio os valores ainda não conhecidos."""
+        with self._trava:
+            conhecidos = self._valores.setdefault(dominio, [])
+            vistos = set(conhecidos)
+            for valor in valores:
+                if valor not in vistos:
+                    conhecidos.append(valor)
+                    vistos.add(valor)
+
+    def codificar(self, serie, dominio):
+        """
+        Converte a Series para a categórica do domínio.
+
+        Args:
+            serie: Series de texto ou categórica
+            dominio: Nome do domínio (ver DOMINIOS)
+
+        Returns:
+            Series categórica cujos códigos são os do dicionário compartilhado
+        """
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            valores = serie.cat.categories
+        else:
+            valores = serie.dropna().unique()
+        self.registrar(dominio, sorted(str(v) for v in valores))
+        if not isinstance(serie.dtype, pd.CategoricalDtype) or valores.dtype != object:
+            serie = serie.astype(str).where(serie.notna())
+        return serie.astype(self.dtype(dominio))
+
+
+# Dicionário global usado por todos os datasets do processo
+dicionario = DicionarioCategorias()
+
+
+def compactar_categorias(df):
+    """
+    Converte, no próprio DataFrame, as colunas de domínio conhecido para as
+    categóricas do dicionário compartilhado.
+
+    Returns:
+        O mesmo DataFrame
+    """
+    for coluna, dominio in DOMINIOS.items():
+        if coluna in df.columns:
+            df[coluna] = dicionario.codificar(df[coluna], dominio)
+    return df
+
+
+def alinhar_categorias(partes):
+    """
+    Iguala as categorias das colunas categóricas de vários DataFrames antes de
+    concatená-los (evitando a conversão para object).
+
+    Como o dicionário só cresce, a lista mais longa de categorias contém as
+    demais como prefixo e os códigos já existentes não mudam.
+    """
+    if len(partes) < 2:
+        return partes
+    maiores = {}
+    for df in partes:
+        for coluna in df.columns:
+            dtype = df[coluna].dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                atual = maiores.get(coluna)
+                if atual is None or len(dtype.categories) > len(atual.categories):
+                    maiores[coluna] = dtype
+    alinhadas = []
+    for df in partes:
+        trocar = {c: d for c, d in maiores.items() if c in df.columns and df[c].dtype != d}
+        alinhadas.append(df.astype(trocar) if trocar else df)
+    return alinhadas
+
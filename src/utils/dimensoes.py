@@ -0,0 +1,231 @@
+# =============================================================================
+# DIMENSÃO CONFORMADA DE LOJAS E SEGMENTOS
+# =============================================================================
+
+"""
+Chaves inteiras de loja e de segmento comuns às transações e a lojas_valores.
+
+As transações identificam a loja por nome_estabelecimento e o segmento por
+categoria_estabelecimento; lojas_valores usa nome_loja e tipo_loja, com outro
+vocabulário ("restaurante" x "Restaurantes") e grafias que variam em
+maiúsculas e espaços. Na carga, cada tabela ganha as colunas:
+
+- id_loja: chave do nome da loja normalizado (minúsculas, sem espaços nas
+  pontas e com espaços simples, como na limpeza da entrega 2 do projeto);
+- id_segmento: chave do segmento normalizado; os tipos de loja de
+  lojas_valores passam antes por SEGMENTOS_EQUIVALENTES;
+- id_ponto: chave do par (loja, segmento) da linha. Em lojas_valores a
+  mesma loja aparece com vários tipos de loja, e cada linha mantém o seu.
+
+As chaves são os códigos dos valores normalizados no dicionário compartilhado
+(utils.dicionario), que só cresce: valem para todas as tabelas do processo,
+em qualquer ordem de carga, e não vão para os snapshots.
+
+A DimensaoLojas junta os pares (loja, segmento) das duas tabelas. Um filtro
+de segmento e loja vira um único conjunto de id_ponto (resolver), aplicado às
+duas tabelas por utils.indice.IndiceChaves, sem comparar textos; um filtro de
+segmento pega as linhas desse segmento, mesmo as de lojas que vendem em
+outros. Para exibição e busca, cada loja tem ainda um segmento principal (o
+das transações; para lojas só de lojas_valores, o tipo de loja mais
+frequente).
+"""
+
+from functools import lru_cache  # Filtros já resolvidos
+
+import numpy as np   # Chaves inteiras
+import pandas as pd  # Tabelas da dimensão
+
+from utils.dicionario import dicionario
+
+# Domínios do dicionário com os valores normalizados (a chave é o código)
+DOMINIO_CHAVE_LOJA = "chave_loja"
+DOMINIO_CHAVE_SEGMENTO = "chave_segmento"
+DOMINIO_CHAVE_PONTO = "chave_ponto"
+
+# Separador dos nomes de loja e segmento nos valores do domínio de pontos
+SEPARADOR_PONTO = " | "
+
+# Filtros (segmento, loja) resolvidos guardados por dimensão
+CAPACIDADE_RESOLVIDOS = 256
+
+# Tipo de loja de lojas_valores -> segmento das transações (já normalizados);
+# tipos sem equivalente continuam como segmentos próprios
+SEGMENTOS_EQUIVALENTES = {
+    "restaurante": "restaurantes",
+    "farmácia": "farmácias e drogarias",
+    "mercado express": "supermercados",
+    "vestuário": "moda",
+    "eletrodoméstico": "lojas de eletrônicos e games",
+}
+
+# Colunas de loja e de segmento de cada dataset, com a tradução de vocabulário
+COLUNAS_LOJA = {"nome_estabelecimento": None, "nome_loja": None}
+COLUNAS_SEGMENTO = {"categoria_estabelecimento": None, "tipo_loja": SEGMENTOS_EQUIVALENTES}
+
+
+def normalizar_chave(valores):
+    """Minúsculas, sem espaços nas pontas e com espaços internos simples."""
+    return (pd.Series(valores, dtype=object).astype(str)
+            .str.lower().str.strip().str.replace(r"\s+", " ", regex=True))
+
+
+def _chaves(serie, dominio, equivalencias=None):
+    """Chave inteira de cada linha (-1 para ausentes), calculada por categoria."""
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype("category")
+    normalizados = normalizar_chave(serie.cat.categories)
+    if equivalencias:
+        normalizados = normalizados.replace(equivalencias)
+    dicionario.registrar(dominio, sorted(set(normalizados)))
+    por_categoria = dicionario.dtype(dominio).categories.get_indexer(normalizados)
+    codigos = serie.cat.codes.to_numpy()
+    return np.where(codigos >= 0, por_categoria[codigos], -1).astype(np.int32)
+
+
+def _chaves_pontos(lojas, segmentos):
+    """Chave do par (loja, segmento) de cada linha (-1 sem loja), calculada por par distinto."""
+    n_segmentos = len(dicionario.dtype(DOMINIO_CHAVE_SEGMENTO).categories) + 1
+    pares, inversa = np.unique(lojas.astype(np.int64) * n_segmentos + (segmentos + 1),
+                               return_inverse=True)
+    pares_lojas, pares_segmentos = np.divmod(pares, n_segmentos)
+    nomes_lojas = dicionario.dtype(DOMINIO_CHAVE_LOJA).categories
+    nomes_segmentos = dicionario.dtype(DOMINIO_CHAVE_SEGMENTO).categories
+    validos = pares_lojas >= 0
+    nomes = [nomes_lojas[l] + SEPARADOR_PONTO + (nomes_segmentos[s - 1] if s > 0 else "")
+             for l, s in zip(pares_lojas[validos], pares_segmentos[validos])]
+    dicionario.registrar(DOMINIO_CHAVE_PONTO, sorted(nomes))
+    por_par = np.full(len(pares), -1, dtype=np.int32)
+    por_par[validos] = dicionario.dtype(DOMINIO_CHAVE_PONTO).categories.get_indexer(nomes)
+    return por_par[inversa]
+
+
+def conformar_lojas(df):
+    """
+    Acrescenta ao DataFrame as colunas id_loja e id_segmento (quando ele tem
+    colunas de loja e de segmento) e id_ponto (quando tem as duas).
+
+    Returns:
+        O mesmo DataFrame
+    """
+    for coluna, equivalencias in COLUNAS_LOJA.items():
+        if coluna in df.columns:
+            df["id_loja"] = _chaves(df[coluna], DOMINIO_CHAVE_LOJA, equivalencias)
+    for coluna, equivalencias in COLUNAS_SEGMENTO.items():
+        if coluna in df.columns:
+            df["id_segmento"] = _chaves(df[coluna], DOMINIO_CHAVE_SEGMENTO, equivalencias)
+    if "id_loja" in df.columns and "id_segmento" in df.columns:
+        df["id_ponto"] = _chaves_pontos(df["id_loja"].to_numpy(), df["id_segmento"].to_numpy())
+    return df
+
+
+def chave_loja(nome):
+    """id_loja de um nome de loja (None se a loja não for conhecida)."""
+    return _chave_valor(nome, DOMINIO_CHAVE_LOJA)
+
+
+def chave_segmento(nome):
+    """id_segmento de um nome de segmento, em qualquer dos vocabulários."""
+    return _chave_valor(nome, DOMINIO_CHAVE_SEGMENTO, SEGMENTOS_EQUIVALENTES)
+
+
+def _chave_valor(nome, dominio, equivalencias=None):
+    # Mesma normalização de normalizar_chave, para um único valor
+    chave = " ".join(str(nome).lower().split())
+    chave = (equivalencias or {}).get(chave, chave)
+    categorias = dicionario.dtype(dominio).categories
+    return int(categorias.get_loc(chave)) if chave in categorias else None
+
+
+class DimensaoLojas:
+    """
+    Lojas e pares (loja, segmento) das transações e de lojas_valores.
+
+    Atributos:
+        lojas: DataFrame indexado por id_loja com 'loja' (nome exibido),
+            'id_segmento' (segmento principal) e 'resgates' (nas transações)
+        pontos: DataFrame indexado por id_ponto com 'id_loja' e 'id_segmento'
+        segmentos: DataFrame indexado por id_segmento com 'segmento'
+    """
+
+    def __init__(self, lojas, pontos, segmentos):
+        self.lojas = lojas
+        self.pontos = pontos
+        self.segmentos = segmentos
+        # Vetores usados em resolver, que roda a cada clique
+        self._ids = pontos.index.to_numpy(np.int64)
+        self._lojas_dos_pontos = pontos["id_loja"].to_numpy()
+        self._segmentos_dos_pontos = pontos["id_segmento"].to_numpy()
+        # LRU com trava própria: os callbacks resolvem filtros em paralelo
+        self._resolver_em_cache = lru_cache(maxsize=CAPACIDADE_RESOLVIDOS)(self._resolver)
+
+    @classmethod
+    def de_tabelas(cls, fatos, massa):
+        """
+        Monta a dimensão a partir das tabelas já conformadas (conformar_lojas).
+
+        Args:
+            fatos: Tabela de fatos de utils.agregados
+            massa: lojas_valores
+        """
+        # Ocorrências de loja e segmento; as transações têm precedência no nome
+        # e no segmento, e o peso desempata dentro de cada tabela
+        ocorrencias = pd.concat([
+            pd.DataFrame({"id_loja": fatos["id_loja"], "loja": fatos["nome_estabelecimento"].astype(object),
+                          "id_ponto": fatos["id_ponto"], "id_segmento": fatos["id_segmento"],
+                          "segmento": fatos["categoria_estabelecimento"].astype(object),
+                          "origem": 0, "peso": fatos["resgates"]}),
+            pd.DataFrame({"id_loja": massa["id_loja"], "loja": massa["nome_loja"].astype(object),
+                          "id_ponto": massa["id_ponto"], "id_segmento": massa["id_segmento"],
+                          "segmento": massa["tipo_loja"].astype(object), "origem": 1, "peso": 1}),
+        ], ignore_index=True)
+        ocorrencias = ocorrencias[ocorrencias["id_loja"] >= 0]
+        pesos = (ocorrencias.groupby(["id_loja", "origem", "loja", "id_segmento"], sort=False)["peso"]
+                 .sum().reset_index())
+        melhor = pesos.sort_values(["id_loja", "origem", "peso"], ascending=[True, True, False])
+        lojas = melhor.drop_duplicates("id_loja").set_index("id_loja")[["loja", "id_segmento"]]
+        # Loja só de lojas_valores e sem tipo: sem segmento
+        lojas["id_segmento"] = lojas["id_segmento"].astype(np.int32)
+        resgates = pesos[pesos["origem"] == 0].groupby("id_loja")["peso"].sum()
+        lojas["resgates"] = resgates.reindex(lojas.index, fill_value=0).astype(np.int64)
+        pontos = (ocorrencias[["id_ponto", "id_loja", "id_segmento"]].drop_duplicates("id_ponto")
+                  .set_index("id_ponto").astype(np.int32))
+
+        nomes_segmentos = (ocorrencias[ocorrencias["id_segmento"] >= 0]
+                           .groupby(["id_segmento", "origem", "segmento"], sort=False)["peso"].sum()
+                           .reset_index()
+                           .sort_values(["id_segmento", "origem", "peso"], ascending=[True, True, False])
+                           .drop_duplicates("id_segmento")
+                           .set_index("id_segmento")[["segmento"]])
+        return cls(lojas.sort_index(), pontos.sort_index(), nomes_segmentos.sort_index())
+
+    def nomes_segmentos(self):
+        """Nomes dos segmentos com alguma loja, em ordem alfabética."""
+        usados = self.segmentos.index.isin(self.pontos["id_segmento"])
+        return sorted(self.segmentos.loc[usados, "segmento"])
+
+    def resolver(self, segmento="all", loja="all"):
+        """
+        Conjunto de pares (loja, segmento) de um filtro de segmento e loja.
+
+        Returns:
+            None se nenhum dos dois filtra; senão o vetor de id_ponto
+            selecionados (vazio se o nome não for conhecido). O vetor é
+            compartilhado entre as chamadas e não deve ser alterado.
+        """
+        return self._resolver_em_cache(segmento, loja)
+
+    def lojas_dos_pontos(self, pontos):
+        """id_loja de cada id_ponto do vetor (-1 para pontos desconhecidos)."""
+        return self.pontos["id_loja"].reindex(pontos, fill_value=-1).to_numpy()
+
+    def _resolver(self, segmento, loja):
+        if segmento in (None, "all") and loja in (None, "all"):
+            return None
+        selecionados = np.ones(len(self._ids), dtype=bool)
+        if segmento not in (None, "all"):
+            chave = chave_segmento(segmento)
+            selecionados &= self._segmentos_dos_pontos == (-2 if chave is None else chave)
+        if loja not in (None, "all"):
+            chave = chave_loja(loja)
+            selecionados &= self._lojas_dos_pontos == (-2 if chave is None else chave)
+        return self._ids[selecionados]
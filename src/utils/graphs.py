@@ -6,60 +6,61 @@
 Este módulo contém todas as funções necessárias para gerar visualizações 
 e gráficos para os dashboards do CFO e CEO. Utiliza principalmente a 
 biblioteca Plotly Express para criar gráficos interativos.
+
+As funções aceitam tanto as transações linha a linha quanto as tabelas
+agregadas de utils.agregados (com as colunas 'resgates' e 'transacoes').
+Os DataFrames recebidos são apenas lidos: as colunas derivadas (weekday,
+hour, possui_app, faixa_etaria) vêm prontas do pré-processamento em
+utils.db_utils, então callbacks em threads diferentes podem usar os mesmos
+DataFrames sem cópias.
+
+Figuras já montadas podem ser reaproveitadas pelo cache_figuras (LRU por
+estado dos filtros e versão dos dados) e, quando só os valores mudam,
+remontadas sem o plotly (com_valores). As funções dados_* separam o cálculo
+de cada gráfico do CEO da montagem da figura.
 """
 
-# Importação dos dados processados
-from utils.db_utils import (
-    df_massa,      # Dados de valores e lojas
-    df_pedestres,  # Dados de fluxo de pedestres
-    df_players,    # Dados dos usuários
-    df_trans       # Dados das transações
-)
+import base64                        # Vetores numéricos das figuras em dict
+import threading                     # Proteção do cache (callbacks rodam em threads)
+from collections import OrderedDict  # Ordem de uso do cache LRU
+
+import numpy as np         # Para os cálculos vetorizados
 import pandas as pd        # Para manipulação de dados
 import plotly.express as px  # Para criação de gráficos interativos
+import plotly.graph_objects as go  # Traços WebGL e linhas de tendência
+
+from utils.hll import contar_distintos  # Usuários únicos (HyperLogLog)
+from utils.moeda import reais           # Valores em centavos -> reais nos eixos
+
+
+def _contar_resgates(df, chaves):
+    """
+    Conta os resgates por combinação de chaves.
+
+    Nas transações linha a linha conta 'id_cupom'; nas tabelas agregadas
+    soma a coluna 'resgates'.
+
+    Returns:
+        DataFrame com as chaves e a coluna 'resgates'
+    """
+    if "resgates" in df.columns:
+        df_cont = (df.dropna(subset=chaves)
+                   .groupby(chaves, as_index=False, observed=True)["resgates"].sum())
+        return df_cont[df_cont["resgates"] > 0]
+    return (df.dropna(subset=chaves + ["id_cupom"])
+            .groupby(chaves, as_index=False, observed=True)["id_cupom"].count()
+            .rename(columns={"id_cupom": "resgates"}))
 
 # =============================================================================
 # GRÁFICOS DO DASHBOARD FINANCEIRO (CFO)
 # =============================================================================
 
-# Receita por segmento (tipo_loja) — Bar horizontal
-df_seg = (df_trans
-          .dropna(subset=["categoria_estabelecimento","valor_cupom"])
-          .groupby("categoria_estabelecimento", as_index=False)["valor_cupom"].sum()
-          .sort_values("valor_cupom", ascending=True))
-fig_df_seg = px.bar(df_seg, x="valor_cupom", y="categoria_estabelecimento", orientation="h",
-             title="Receita total por segmento",
-             labels={"valor_cupom":"Receita (R$)","categoria_estabelecimento":"Segmento"})
-fig_df_seg.update_layout(margin=dict(l=150))
-
-# Usando df_massa (possui valor_cupom e valor_compra)
-df_scatter = df_massa.dropna(subset=["valor_cupom","valor_compra"])
-fig_df_scatter = px.scatter(df_scatter, x="valor_cupom", y="valor_compra", trendline="ols",
-                 title="Relacionamento: valor do cupom x valor final da compra",
-                 labels={"valor_cupom":"Valor do Cupom (R$)","valor_compra":"Valor da Compra (R$)"})
-
-
-# Média de valor_compra por loja
-df_mean = (df_massa.dropna(subset=["nome_loja","valor_compra"])
-           .groupby("nome_loja", as_index=False)["valor_compra"].mean()
-           .sort_values("valor_compra", ascending=False))
-fig_df_mean = px.bar(df_mean, x="nome_loja", y="valor_compra", title="Valor médio de venda por loja")
-fig_df_mean.update_layout(xaxis_tickangle=-45)
-
-# Histograma de valor_cupom (df_trans)
-df_v = df_trans.dropna(subset=["valor_cupom"])
-fig_df_v = px.histogram(df_v, x="valor_cupom", nbins=10, title="Distribuição de valor dos cupons resgatados")
-fig_df_v.update_xaxes(title="Valor do cupom (R$)")
-fig_df_v.update_layout(
-    bargap=0.2  # controla o espaço entre as barras (0 = sem espaço, 1 = só espaço)
-)
-
 def criar_grafico_receita_segmento(df):
     """
     Cria um gráfico de barras horizontais mostrando a receita total por segmento de negócio.
     
     Args:
-        df: DataFrame contendo as colunas 'categoria_estabelecimento' e 'valor_cupom'
+        df: DataFrame contendo as colunas 'categoria_estabelecimento' e 'valor_cupom' (centavos)
     
     Returns:
         figura Plotly com o gráfico de barras horizontais
@@ -67,8 +68,10 @@ def criar_grafico_receita_segmento(df):
     # Agrupa os dados por categoria e calcula a soma dos valores
     df_seg = (df
               .dropna(subset=["categoria_estabelecimento","valor_cupom"])  # Remove linhas com valores ausentes
-              .groupby("categoria_estabelecimento", as_index=False)["valor_cupom"].sum()  # Agrupa e soma
+              .groupby("categoria_estabelecimento", as_index=False, observed=True)["valor_cupom"].sum()  # Agrupa e soma
               .sort_values("valor_cupom", ascending=True))  # Ordena por valor
+    # Somas exatas em centavos; o eixo mostra reais
+    df_seg["valor_cupom"] = reais(df_seg["valor_cupom"])
     
     # Cria o gráfico de barras horizontais
     fig = px.bar(df_seg, 
@@ -82,77 +85,212 @@ def criar_grafico_receita_segmento(df):
     fig.update_layout(margin=dict(l=150), template='plotly_white')
     return fig
 
-def criar_grafico_scatter(df_massa):
+# Acima deste número de pontos o gráfico de dispersão mostra a densidade
+LIMITE_PONTOS_SCATTER = 5000
+
+# Número de faixas por eixo na densidade do gráfico de dispersão
+FAIXAS_DENSIDADE = 60
+
+
+def tendencia_linear(x, y):
+    """
+    Reta de mínimos quadrados y = a + b*x em forma fechada.
+
+    Usa apenas as somas (n, Σx, Σy, Σxy, Σx², Σy²), que podem ser acumuladas
+    por fatia e combinadas.
+
+    Returns:
+        (a, b, r²); NaN se houver menos de dois valores distintos de x
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    n = len(x)
+    sx, sy = x.sum(), y.sum()
+    sxx, syy, sxy = (x * x).sum(), (y * y).sum(), (x * y).sum()
+    vx = n * sxx - sx * sx
+    vy = n * syy - sy * sy
+    if n < 2 or vx <= 0:
+        return np.nan, np.nan, np.nan
+    b = (n * sxy - sx * sy) / vx
+    a = (sy - b * sx) / n
+    r2 = (n * sxy - sx * sy) ** 2 / (vx * vy) if vy > 0 else 1.0
+    return a, b, r2
+
+
+def criar_grafico_scatter(df_massa, limite_pontos=LIMITE_PONTOS_SCATTER):
     """
     Cria um gráfico de dispersão relacionando o valor dos cupons com o valor final das compras.
     Inclui uma linha de tendência para análise de correlação.
+
+    Com mais de 'limite_pontos' linhas, os pontos são agregados em uma grade
+    de FAIXAS_DENSIDADE x FAIXAS_DENSIDADE no servidor e desenhados como um
+    heatmap com a cor proporcional ao número de compras de cada célula. As
+    células ocupam exatamente a largura das faixas em qualquer tamanho ou zoom
+    do gráfico (células vazias ficam transparentes), e o tamanho da figura não
+    depende do número de linhas.
     
     Args:
-        df_massa: DataFrame contendo as colunas 'valor_cupom' e 'valor_compra'
+        df_massa: DataFrame contendo as colunas 'valor_cupom' e 'valor_compra' (centavos)
+        limite_pontos: Número máximo de pontos desenhados individualmente
     
     Returns:
         figura Plotly com o gráfico de dispersão
     """
     # Remove valores ausentes para garantir a qualidade da análise
     df_scatter = df_massa.dropna(subset=["valor_cupom","valor_compra"])
-    
-    # Cria o gráfico de dispersão com linha de tendência
-    fig = px.scatter(df_scatter, 
-                    x="valor_cupom", 
-                    y="valor_compra", 
-                    trendline="ols",  # Adiciona linha de tendência linear
-                    title="Relacionamento: valor do cupom x valor final da compra",
-                    labels={"valor_cupom":"Valor do Cupom (R$)","valor_compra":"Valor da Compra (R$)"})
+    # Valores em centavos (utils.moeda): os eixos mostram reais
+    x = reais(df_scatter["valor_cupom"]).to_numpy()
+    y = reais(df_scatter["valor_compra"]).to_numpy()
+    titulo = "Relacionamento: valor do cupom x valor final da compra"
+    
+    if len(df_scatter) <= limite_pontos:
+        # Poucos pontos: cada compra é um marcador
+        fig = px.scatter(pd.DataFrame({"valor_cupom": x, "valor_compra": y}), 
+                        x="valor_cupom", 
+                        y="valor_compra", 
+                        title=titulo,
+                        labels={"valor_cupom":"Valor do Cupom (R$)","valor_compra":"Valor da Compra (R$)"})
+    else:
+        # Muitos pontos: densidade em grade, com uma célula do heatmap por faixa
+        contagens, bordas_x, bordas_y = np.histogram2d(x, y, bins=FAIXAS_DENSIDADE)
+        fig = go.Figure(go.Heatmap(
+            x=(bordas_x[:-1] + bordas_x[1:]) / 2,
+            y=(bordas_y[:-1] + bordas_y[1:]) / 2,
+            # Linhas do heatmap = eixo y; sem compras = transparente
+            z=np.where(contagens > 0, contagens, np.nan).T,
+            colorscale="Viridis", colorbar=dict(title="Compras"),
+            hoverongaps=False,
+            name="Densidade",
+            hovertemplate="Cupom ≈ R$ %{x:,.2f}<br>Compra ≈ R$ %{y:,.2f}"
+                          "<br>Compras: %{z}<extra></extra>",
+        ))
+        fig.update_layout(title=titulo)
+        fig.update_xaxes(title="Valor do Cupom (R$)")
+        fig.update_yaxes(title="Valor da Compra (R$)")
+    
+    # Linha de tendência linear (mínimos quadrados em forma fechada)
+    a, b, r2 = tendencia_linear(x, y)
+    if np.isfinite(b):
+        extremos = np.array([x.min(), x.max()])
+        fig.add_trace(go.Scatter(
+            x=extremos, y=a + b * extremos, mode="lines", name="Tendência (MQO)",
+            showlegend=False,
+            hovertemplate=(f"valor_compra = {b:.4f} * valor_cupom + {a:.2f}"
+                           f"<br>R² = {r2:.4f}<extra></extra>"),
+        ))
     
     fig.update_layout(template='plotly_white')
     return fig
 
-def criar_grafico_ticket_medio(df_massa):
+# Lojas por página no gráfico de ticket médio por loja (mais a barra das demais)
+LOJAS_POR_PAGINA = 15
+
+
+def ranking_ticket_medio(lojas):
+    """
+    Ordena as lojas pelo valor médio de compra, do maior para o menor.
+
+    Args:
+        lojas: DataFrame com 'nome_loja', a soma 'valor_compra' (centavos) e o
+            número de 'compras' de cada loja (ex.: ReceitaDiaria.por_ponto somado por loja)
+
+    Returns:
+        DataFrame com as lojas que têm compras, as colunas recebidas e
+        'ticket_medio' (reais), com índice 0..n-1 (posição no ranking)
     """
-    Cria um gráfico de barras mostrando o ticket médio (valor médio de compra) por loja.
+    ranking = lojas[lojas["compras"] > 0].assign(
+        ticket_medio=lambda df: reais(df["valor_compra"]) / df["compras"])
+    return ranking.sort_values(["ticket_medio", "nome_loja"], ascending=[False, True],
+                               kind="stable", ignore_index=True)
+
+
+def paginas_ticket_medio(ranking, por_pagina=LOJAS_POR_PAGINA):
+    """Número de páginas do ranking (pelo menos 1)."""
+    return max(-(-len(ranking) // por_pagina), 1)
+
+
+def pagina_ticket_medio(ranking, pagina=1, por_pagina=LOJAS_POR_PAGINA):
+    """
+    Barras de uma página do ranking: as lojas da página e, se houver lojas
+    depois dela, uma barra com a média de todas elas (soma / número de compras).
+    """
+    inicio = (pagina - 1) * por_pagina
+    barras = ranking.iloc[inicio:inicio + por_pagina]
+    demais = ranking.iloc[inicio + por_pagina:]
+    nomes = barras["nome_loja"].astype(str).tolist()
+    medias = barras["ticket_medio"].tolist()
+    compras = barras["compras"].tolist()
+    if len(demais):
+        nomes.append(f"Demais {len(demais)} lojas")
+        medias.append(reais(demais["valor_compra"].sum()) / demais["compras"].sum())
+        compras.append(demais["compras"].sum())
+    return pd.DataFrame({"nome_loja": nomes, "valor_compra": medias,
+                         "compras": np.asarray(compras, dtype=np.int64)})
+
+
+def criar_grafico_ticket_medio(ranking, pagina=1, por_pagina=LOJAS_POR_PAGINA):
+    """
+    Cria um gráfico de barras mostrando o ticket médio (valor médio de compra)
+    das lojas de uma página do ranking.
+
+    A figura tem no máximo por_pagina + 1 barras, qualquer que seja o número
+    de lojas; as demais páginas são pedidas ao servidor pelo paginador.
     
     Args:
-        df_massa: DataFrame contendo as colunas 'nome_loja' e 'valor_compra'
+        ranking: Lojas ordenadas por ranking_ticket_medio
+        pagina: Página do ranking (a partir de 1)
+        por_pagina: Número de lojas por página
     
     Returns:
         figura Plotly com o gráfico de barras
     """
-    # Calcula a média de valor de compra por loja
-    df_mean = (df_massa.dropna(subset=["nome_loja","valor_compra"])
-               .groupby("nome_loja", as_index=False)["valor_compra"].mean()
-               .sort_values("valor_compra", ascending=False))
+    pagina = min(max(pagina, 1), paginas_ticket_medio(ranking, por_pagina))
+    barras = pagina_ticket_medio(ranking, pagina, por_pagina)
     
     # Cria o gráfico de barras
-    fig = px.bar(df_mean, 
+    titulo = "Valor médio de venda por loja"
+    if len(ranking) > por_pagina:
+        inicio = (pagina - 1) * por_pagina
+        titulo += f" ({inicio + 1}ª a {min(inicio + por_pagina, len(ranking))}ª de {len(ranking)})"
+    fig = px.bar(barras, 
                  x="nome_loja", 
                  y="valor_compra", 
-                 title="Valor médio de venda por loja")
+                 hover_data=["compras"],
+                 title=titulo)
     
     # Rotaciona os rótulos do eixo X para melhor legibilidade
     fig.update_layout(xaxis_tickangle=-45, template='plotly_white')
     return fig
 
-def criar_grafico_distribuicao(df):
+def criar_grafico_distribuicao(bordas, contagens):
     """
     Cria um histograma mostrando a distribuição dos valores dos cupons resgatados.
+
+    As faixas já vêm contadas do servidor (ver
+    AgregadosTransacoes.histograma_valor_cupom), então a figura tem uma barra
+    por faixa, qualquer que seja o número de transações.
     
     Args:
-        df: DataFrame contendo a coluna 'valor_cupom'
+        bordas: Bordas das faixas de valor (n + 1 valores crescentes)
+        contagens: Número de cupons em cada uma das n faixas
     
     Returns:
         figura Plotly com o histograma
     """
-    # Remove valores ausentes
-    df_v = df.dropna(subset=["valor_cupom"])
+    bordas = np.asarray(bordas, dtype="float64")
     
-    # Cria o histograma
-    fig = px.histogram(df_v, 
-                      x="valor_cupom", 
-                      nbins=20,  # Define o número de intervalos
-                      title="Distribuição de valor dos cupons resgatados")
+    # Uma barra por faixa, centrada e com a largura da faixa
+    fig = px.bar(x=(bordas[:-1] + bordas[1:]) / 2,
+                 y=contagens,
+                 title="Distribuição de valor dos cupons resgatados")
+    fig.update_traces(width=np.diff(bordas),
+                      customdata=np.column_stack([bordas[:-1], bordas[1:]]),
+                      hovertemplate="R$ %{customdata[0]:,.2f} - R$ %{customdata[1]:,.2f}"
+                                    "<br>count=%{y}<extra></extra>")
     
     # Configura os eixos e o layout
     fig.update_xaxes(title="Valor do cupom (R$)")
+    fig.update_yaxes(title="count")
     fig.update_layout(template='plotly_white', bargap=0.1)  # Adiciona espaço entre as barras
     return fig
 
@@ -161,6 +299,12 @@ def criar_grafico_distribuicao(df):
 # GRÁFICOS DO DASHBOARD ESTRATÉGICO (CEO)
 # =============================================================================
 
+def dados_resgates_segmento(df):
+    """Os 10 segmentos com mais resgates, do maior para o menor."""
+    return (_contar_resgates(df, ["categoria_estabelecimento"])
+            .sort_values("resgates", ascending=False)  # Ordena do maior para o menor
+            .head(10))  # Seleciona apenas os top 10
+
 def criar_grafico_resgates_segmento(df):
     """
     Cria um gráfico de barras mostrando os 10 segmentos com mais resgates de cupons.
@@ -170,17 +314,13 @@ def criar_grafico_resgates_segmento(df):
     
     Args:
         df: DataFrame contendo as colunas 'categoria_estabelecimento' e 'id_cupom'
+            (ou 'resgates', na tabela agregada)
     
     Returns:
         figura Plotly com o gráfico de barras dos top 10 segmentos
     """
-    # Processamento dos dados
-    df_resg_seg = (df
-                   .dropna(subset=["categoria_estabelecimento","id_cupom"])  # Remove dados incompletos
-                   .groupby("categoria_estabelecimento", as_index=False)["id_cupom"].count()  # Conta resgates
-                   .rename(columns={"id_cupom":"resgates"})  # Renomeia para clareza
-                   .sort_values("resgates", ascending=False)  # Ordena do maior para o menor
-                   .head(10))  # Seleciona apenas os top 10
+    # Processamento dos dados: contagem de resgates por segmento
+    df_resg_seg = dados_resgates_segmento(df)
     
     # Criação do gráfico
     fig = px.bar(df_resg_seg, 
@@ -193,6 +333,10 @@ def criar_grafico_resgates_segmento(df):
                      template='plotly_white')  # Usa template limpo
     return fig
 
+def dados_dia_semana(df):
+    """Resgates por dia da semana, ordenados pelo número de resgates."""
+    return _contar_resgates(df, ["weekday"]).sort_values("resgates", ascending=False)
+
 def criar_grafico_dia_semana(df):
     """
     Cria um gráfico de barras mostrando a distribuição de resgates por dia da semana.
@@ -201,36 +345,14 @@ def criar_grafico_dia_semana(df):
     permitindo otimizar campanhas e recursos baseado nos dias de maior atividade.
     
     Args:
-        df: DataFrame contendo as colunas 'data' e 'id_cupom'
+        df: DataFrame contendo as colunas 'weekday' e 'id_cupom' (ou
+            'resgates', nas tabelas agregadas e nos rollups do cubo)
     
     Returns:
         figura Plotly com o gráfico de barras dos resgates por dia da semana
     """
-    # Preparação dos dados: criação da coluna de dia da semana se não existir
-    if 'weekday' not in df.columns:
-        # Converte coluna de data para datetime
-        df['data'] = pd.to_datetime(df['data'], format='%d/%m/%Y')
-        # Extrai o nome do dia da semana
-        df['weekday'] = df['data'].dt.day_name()
-        # Mapeamento para traduzir os dias para português
-        weekday_map = {
-            'Monday': 'Segunda', 
-            'Tuesday': 'Terça', 
-            'Wednesday': 'Quarta',
-            'Thursday': 'Quinta', 
-            'Friday': 'Sexta', 
-            'Saturday': 'Sábado', 
-            'Sunday': 'Domingo'
-        }
-        # Aplica a tradução
-        df['weekday'] = df['weekday'].map(weekday_map)
-    
     # Processamento dos dados: contagem de resgates por dia
-    df_week = (df.dropna(subset=["weekday","id_cupom"])  # Remove dados incompletos
-               .groupby("weekday", as_index=False)["id_cupom"].count()  # Agrupa e conta
-               .rename(columns={"id_cupom":"resgates"}))  # Renomeia para clareza
-    # Ordena por número de resgates
-    df_week = df_week.sort_values("resgates", ascending=False)
+    df_week = dados_dia_semana(df)
     
     # Criação do gráfico
     fig = px.bar(df_week, 
@@ -242,7 +364,29 @@ def criar_grafico_dia_semana(df):
     fig.update_layout(template='plotly_white')
     return fig
 
-def criar_grafico_heatmap(df):
+def dados_heatmap(contagens, categorias, top=15):
+    """
+    Matriz hora x categoria do heatmap (DataFrame), com as 'top' categorias
+    com mais resgates e apenas as horas que têm resgates.
+    """
+    contagens = np.asarray(contagens)
+    categorias = pd.Index(categorias)
+    
+    # Seleciona as categorias com mais resgates (argpartition, sem ordenar todas)
+    totais = contagens.sum(axis=0)
+    colunas = np.flatnonzero(totais)
+    if len(colunas) > top:
+        colunas = colunas[np.argpartition(-totais[colunas], top - 1)[:top]]
+    colunas = np.sort(colunas)
+    
+    # Matriz hora x categoria, apenas com as horas que têm resgates
+    matriz = contagens[:, colunas]
+    horas = np.flatnonzero(matriz.sum(axis=1))
+    return pd.DataFrame(matriz[horas],
+                        index=pd.Index(horas, name="hour"),
+                        columns=pd.Index(categorias[colunas], name="categoria_estabelecimento"))
+
+def criar_grafico_heatmap(contagens, categorias, top=15):
     """
     Cria um heatmap (mapa de calor) mostrando a relação entre horário do dia 
     e categoria do estabelecimento para resgates de cupons.
@@ -252,31 +396,15 @@ def criar_grafico_heatmap(df):
     otimizar estratégias de marketing e operações.
     
     Args:
-        df: DataFrame contendo as colunas 'hora', 'categoria_estabelecimento' e 'id_cupom'
+        contagens: Matriz [hora (0-23), categoria] com os resgates (ver
+            utils.cubo.TensorAtividade)
+        categorias: Nome das categorias, na ordem das colunas da matriz
+        top: Número de categorias exibidas (as com mais resgates)
     
     Returns:
         figura Plotly com o heatmap de horário x categoria
     """
-    # Preparação do horário: extrai apenas a hora se necessário
-    if 'hour' not in df.columns:
-        df['hour'] = pd.to_datetime(df['hora'], format='%H:%M:%S').dt.hour
-    
-    # Remove dados ausentes e agrupa por hora e categoria
-    df_hm = df.dropna(subset=["hour","categoria_estabelecimento","id_cupom"])
-    df_hm = (df_hm.groupby(["hour","categoria_estabelecimento"], as_index=False)
-             ["id_cupom"].count()
-             .rename(columns={"id_cupom":"count"}))
-    
-    # Seleciona as 15 categorias com mais resgates para manter o visual limpo
-    top_categorias = (df_hm.groupby("categoria_estabelecimento")["count"]
-                     .sum().nlargest(15).index)
-    df_hm = df_hm[df_hm["categoria_estabelecimento"].isin(top_categorias)]
-    
-    # Cria matriz pivô para o heatmap
-    hm = (df_hm.pivot(index="hour", 
-                      columns="categoria_estabelecimento", 
-                      values="count")
-          .fillna(0))  # Preenche valores ausentes com 0
+    hm = dados_heatmap(contagens, categorias, top)
     
     # Cria o heatmap
     fig = px.imshow(hm, 
@@ -287,6 +415,18 @@ def criar_grafico_heatmap(df):
     fig.update_layout(template='plotly_white')
     return fig
 
+def dados_faixa_etaria(df, df_players):
+    """Resgates por faixa etária e tipo de cupom (ver criar_grafico_faixa_etaria)."""
+    # Mescla dados de transações com a faixa etária (calculada no
+    # pré-processamento da base de usuários) pela chave inteira do cliente
+    if "faixa_etaria" in df.columns:
+        df_tx = df
+    else:
+        df_tx = df.merge(df_players[["cliente_id","faixa_etaria"]], on="cliente_id", how="left")
+    
+    # Agrupa dados por faixa etária e tipo de cupom
+    return _contar_resgates(df_tx, ["faixa_etaria","tipo_cupom"])
+
 def criar_grafico_faixa_etaria(df, df_players):
     """
     Cria um gráfico de barras agrupadas mostrando a distribuição de resgates 
@@ -296,28 +436,16 @@ def criar_grafico_faixa_etaria(df, df_players):
     e como diferentes tipos de cupons se comportam em cada faixa etária.
     
     Args:
-        df: DataFrame com dados de transações
-        df_players: DataFrame com dados dos usuários
+        df: DataFrame com dados de transações (ou a tabela agregada de usuários,
+            ou já com 'faixa_etaria', como nos rollups do cross-filter)
+        df_players: DataFrame com dados dos usuários (não usado se df já tiver
+            'faixa_etaria')
     
     Returns:
         figura Plotly com o gráfico de barras agrupadas
     """
-    # Mescla dados de transações com dados de usuários
-    df_tx = df.merge(df_players[["celular","idade"]], on="celular", how="left")
-    # Converte idade para numérico, tratando erros
-    df_tx["idade"] = pd.to_numeric(df_tx["idade"], errors="coerce")
-    
-    # Define as faixas etárias
-    bins = [0,17,24,34,44,54,64,200]  # Limites das faixas
-    labels = ["<=17","18-24","25-34","35-44","45-54","55-64","65+"]  # Rótulos
-    
-    # Categoriza as idades em faixas
-    df_tx["faixa_etaria"] = pd.cut(df_tx["idade"], bins=bins, labels=labels)
-    
-    # Agrupa dados por faixa etária e tipo de cupom
-    df_age_coupon = (df_tx.dropna(subset=["faixa_etaria","tipo_cupom"])
-                     .groupby(["faixa_etaria","tipo_cupom"], as_index=False)["id_cupom"].count()
-                     .rename(columns={"id_cupom":"resgates"}))
+    # Resgates por faixa etária e tipo de cupom
+    df_age_coupon = dados_faixa_etaria(df, df_players)
     
     # Cria o gráfico de barras agrupadas
     fig = px.bar(df_age_coupon, 
@@ -325,11 +453,22 @@ def criar_grafico_faixa_etaria(df, df_players):
                  y="resgates",      # Eixo Y: quantidade de resgates
                  color="tipo_cupom", # Cor: diferencia tipos de cupom
                  barmode="group",    # Agrupa barras por faixa etária
+                 custom_data=["tipo_cupom"],  # Tipo de cupom no clique (cross-filter)
                  title="Resgates por faixa etária e tipo de cupom")
     
     fig.update_layout(template='plotly_white')
     return fig
 
+def dados_segmento_tipo(df):
+    """Matriz pivô tipo de cupom x segmento com os resgates."""
+    # Processa os dados para o heatmap
+    df_ht = _contar_resgates(df, ["categoria_estabelecimento","tipo_cupom"])
+    
+    # Cria matriz pivô para o heatmap
+    return df_ht.pivot(index="tipo_cupom", 
+                       columns="categoria_estabelecimento", 
+                       values="resgates").fillna(0)
+
 def criar_grafico_segmento_tipo(df):
     """
     Cria um heatmap relacionando segmentos de lojas com tipos de cupons.
@@ -343,14 +482,8 @@ def criar_grafico_segmento_tipo(df):
     Returns:
         figura Plotly com o heatmap
     """
-    # Processa os dados para o heatmap
-    df_ht = (df.dropna(subset=["categoria_estabelecimento","tipo_cupom", "id_cupom"])
-             .groupby(["categoria_estabelecimento","tipo_cupom"], as_index=False)["id_cupom"].count())
-    
-    # Cria matriz pivô para o heatmap
-    pivot = df_ht.pivot(index="tipo_cupom", 
-                       columns="categoria_estabelecimento", 
-                       values="id_cupom").fillna(0)
+    # Matriz pivô tipo de cupom x segmento para o heatmap
+    pivot = dados_segmento_tipo(df)
     
     # Cria o heatmap
     fig = px.imshow(pivot, 
@@ -370,25 +503,22 @@ def criar_grafico_dispositivos(df_pedestres):
     móveis entre os usuários, auxiliando em decisões de desenvolvimento.
     
     Args:
-        df_pedestres: DataFrame com dados de pedestres e dispositivos
+        df_pedestres: DataFrame com dados de pedestres e dispositivos (com a
+            coluna booleana 'possui_app' do pré-processamento)
     
     Returns:
         figura Plotly com o gráfico de pizza
     """
     # Verifica se os dados de tipo de celular estão disponíveis
     if "tipo_celular" in df_pedestres.columns:
-        # Normaliza a coluna de possui_app para facilitar filtragem
-        df_pedestres['possui_app_str'] = (df_pedestres['possui_app_picmoney']
-                                        .astype(str).str.lower().str.strip())
-        
         # Filtra apenas usuários que têm o app
-        df_d = df_pedestres[df_pedestres['possui_app_str']
-                          .isin(['true', '1', '1.0', 'sim', 'yes'])]
+        df_d = df_pedestres[df_pedestres['possui_app'].to_numpy()]
         
         # Conta usuários únicos por tipo de dispositivo
-        dd = (df_d.groupby("tipo_celular", as_index=False)["celular"]
-              .nunique()
-              .rename(columns={"celular":"usuarios"}))
+        dd = (df_d.groupby("tipo_celular", observed=True)["cliente_id"]
+              .agg(contar_distintos)
+              .rename("usuarios")
+              .reset_index())
         
         # Cria o gráfico de pizza
         fig = px.pie(dd, 
@@ -405,10 +535,222 @@ def criar_grafico_dispositivos(df_pedestres):
     fig.update_layout(template='plotly_white')
     return fig
 
-# Gráficos estáticos para uso inicial (remova se não for usar)
-fig_df_resg_seg = criar_grafico_resgates_segmento(df_trans)
-fig_df_week = criar_grafico_dia_semana(df_trans)
-fig_df_hm = criar_grafico_heatmap(df_trans)
-fig_df_age_coupon = criar_grafico_faixa_etaria(df_trans, df_players)
-fig_df_ht = criar_grafico_segmento_tipo(df_trans)
-fig_df_d = criar_grafico_dispositivos(df_pedestres)
\ No newline at end of file
+
+# =============================================================================
+# FIGURAS REMONTADAS A PARTIR DE OUTRAS
+# =============================================================================
+
+# Tipos numéricos com vetor tipado no plotly.js (chave 'dtype' dos vetores)
+_TIPOS_PLOTLY = {
+    "int8": "i1", "uint8": "u1", "int16": "i2", "uint16": "u2",
+    "int32": "i4", "uint32": "u4", "float32": "f4", "float64": "f8",
+}
+
+
+def _vetor_plotly(valor):
+    """
+    Vetor numpy no formato de Figure.to_dict() (dict com 'dtype' e 'bdata' em
+    base64). Inteiros de 64 bits vão para o menor tipo que comporta os
+    valores, já que o plotly.js não tem vetores de 64 bits; vetores vazios ou
+    sem tipo equivalente voltam sem conversão.
+    """
+    if valor.size == 0:
+        return valor
+    if valor.dtype.kind in "iu" and valor.dtype.itemsize == 8:
+        candidatos = ((np.int8, np.int16, np.int32) if valor.dtype.kind == "i"
+                      else (np.uint8, np.uint16, np.uint32))
+        menor, maior = valor.min(), valor.max()
+        tipo = next((t for t in candidatos
+                     if np.iinfo(t).min <= menor and maior <= np.iinfo(t).max), None)
+        if tipo is None:
+            return valor
+        valor = valor.astype(tipo)
+    tipo = _TIPOS_PLOTLY.get(valor.dtype.name)
+    if tipo is None:
+        return valor
+    bdata = base64.b64encode(np.ascontiguousarray(valor).tobytes()).decode("ascii")
+    vetor = {"dtype": tipo, "bdata": bdata}
+    if valor.ndim > 1:
+        vetor["shape"] = ", ".join(str(n) for n in valor.shape)
+    return vetor
+
+
+def com_valores(figura, *tracos):
+    """
+    Cópia de uma figura serializada com os valores dos traços substituídos.
+
+    Montar uma figura no plotly leva dezenas de ms (quase tudo validando o
+    layout e o template); quando só os dados mudam (ex.: cross-filter do CEO),
+    basta trocar os vetores da figura já pronta. Vetores numéricos ficam no
+    mesmo formato de Figure.to_dict(), para que a comparação com outras
+    figuras (utils.saidas) continue achando o que não mudou.
+
+    Args:
+        figura: Figura em dict (ex.: do cache_figuras), que não é alterada
+        *tracos: Um dicionário propriedade -> valores por traço, na ordem de
+            figura['data']
+
+    Returns:
+        Nova figura em dict (o layout é compartilhado com a original)
+    """
+    dados = []
+    for traco, valores in zip(figura["data"], tracos):
+        novo = dict(traco)
+        for propriedade, valor in valores.items():
+            valor = np.asarray(valor)
+            novo[propriedade] = _vetor_plotly(valor) if valor.dtype.kind in "iuf" else valor
+        dados.append(novo)
+    return {**figura, "data": dados + list(figura["data"][len(tracos):])}
+
+
+# =============================================================================
+# CACHE DE FIGURAS
+# =============================================================================
+
+# Número máximo de entradas guardadas pelo cache de figuras
+CAPACIDADE_CACHE_FIGURAS = 64
+
+# Memória máxima (bytes estimados, ver tamanho_figura) das figuras do cache.
+# Com os dados de exemplo uma figura ocupa cerca de 10 kB; a maior, o scatter
+# de cupom x compra, cerca de 50 kB (até LIMITE_PONTOS_SCATTER pontos ou a grade)
+CAPACIDADE_BYTES_CACHE_FIGURAS = 32 * 2 ** 20
+
+# Filtros de período (normalizados para o dia)
+_FILTROS_DATA = ("inicio", "fim")
+
+
+def normalizar_filtros(filtros):
+    """
+    Converte os filtros de um callback em uma tupla usável como chave.
+
+    Valores vazios (None, '') equivalem a 'all' e as datas do período são
+    reduzidas ao dia, então estados equivalentes geram a mesma chave.
+    """
+    normalizados = []
+    for nome, valor in sorted(filtros.items()):
+        if nome in _FILTROS_DATA:
+            valor = pd.Timestamp(valor).date().isoformat() if valor else None
+        elif valor in (None, ""):
+            valor = "all"
+        normalizados.append((nome, valor))
+    return tuple(normalizados)
+
+
+def _como_dict(resultado):
+    """Serializa uma figura (ou tupla de figuras) no dict aceito pelo dcc.Graph."""
+    if isinstance(resultado, (tuple, list)):
+        return tuple(_como_dict(item) for item in resultado)
+    return resultado.to_dict() if hasattr(resultado, "to_dict") else resultado
+
+
+def tamanho_figura(valor):
+    """
+    Tamanho aproximado (bytes) de uma figura em dict: bytes dos vetores numpy,
+    comprimento dos textos (os vetores em base64 são textos) e 8 bytes por
+    número ou item de lista e de dicionário.
+    """
+    if isinstance(valor, dict):
+        return sum(8 + len(k) + tamanho_figura(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sum(8 + tamanho_figura(v) for v in valor)
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes if valor.dtype.kind != "O" else sum(tamanho_figura(v) for v in valor)
+    if isinstance(valor, str):
+        return len(valor)
+    return 8
+
+
+class CacheFiguras:
+    """
+    Cache LRU de figuras já serializadas.
+
+    A chave é (nome, filtros normalizados); as entradas valem para uma versão
+    dos dados e o cache é esvaziado quando chega uma versão nova (ex.: após
+    registro.recarregar()). O cache é limitado pelo número de entradas e pela
+    soma dos tamanhos estimados das figuras (tamanho_figura), o que vier
+    primeiro; uma figura maior que o limite de bytes não é guardada.
+
+    Args:
+        capacidade: Número máximo de entradas (as menos usadas saem primeiro)
+        capacidade_bytes: Soma máxima dos tamanhos das figuras guardadas
+    """
+
+    def __init__(self, capacidade=CAPACIDADE_CACHE_FIGURAS,
+                 capacidade_bytes=CAPACIDADE_BYTES_CACHE_FIGURAS):
+        self.capacidade = capacidade
+        self.capacidade_bytes = capacidade_bytes
+        self.acertos = 0
+        self.faltas = 0
+        self._figuras = OrderedDict()
+        self._tamanhos = {}
+        self.bytes = 0
+        self._versao = None
+        self._trava = threading.Lock()
+
+    def _descartar_tudo(self):
+        self._figuras.clear()
+        self._tamanhos.clear()
+        self.bytes = 0
+
+    def obter(self, nome, filtros, versao, construir):
+        """
+        Retorna a figura em cache ou a constrói.
+
+        Args:
+            nome: Nome da figura (ou do grupo de figuras)
+            filtros: Dicionário com o estado dos filtros
+            versao: Versão dos dados usados (ex.: registro.versao)
+            construir: Função sem argumentos que monta a(s) figura(s)
+
+        Returns:
+            dict da figura, ou tupla de dicts se construir retornar várias
+        """
+        chave = (nome, normalizar_filtros(filtros))
+        with self._trava:
+            if versao != self._versao:
+                self._descartar_tudo()
+                self._versao = versao
+            if chave in self._figuras:
+                self._figuras.move_to_end(chave)
+                self.acertos += 1
+                return self._figuras[chave]
+            self.faltas += 1
+
+        figura = _como_dict(construir())
+        tamanho = tamanho_figura(figura)
+
+        with self._trava:
+            if versao == self._versao and tamanho <= self.capacidade_bytes:
+                self.bytes += tamanho - self._tamanhos.get(chave, 0)
+                self._figuras[chave] = figura
+                self._figuras.move_to_end(chave)
+                self._tamanhos[chave] = tamanho
+                while (len(self._figuras) > self.capacidade
+                       or self.bytes > self.capacidade_bytes):
+                    antiga, _ = self._figuras.popitem(last=False)
+                    self.bytes -= self._tamanhos.pop(antiga)
+        return figura
+
+    def consultar(self, nome, filtros, versao):
+        """Figura já guardada para a chave, sem construí-la (None se não houver)."""
+        chave = (nome, normalizar_filtros(filtros))
+        with self._trava:
+            if versao != self._versao:
+                return None
+            return self._figuras.get(chave)
+
+    def limpar(self):
+        """Descarta todas as figuras guardadas."""
+        with self._trava:
+            self._descartar_tudo()
+
+    def estatisticas(self):
+        """Acertos, faltas e tamanho atual do cache."""
+        with self._trava:
+            return {"acertos": self.acertos, "faltas": self.faltas,
+                    "entradas": len(self._figuras), "capacidade": self.capacidade,
+                    "bytes": self.bytes, "capacidade_bytes": self.capacidade_bytes}
+
+
+# Cache compartilhado pelas páginas
+cache_figuras = CacheFiguras()
@@ -0,0 +1,211 @@
+# =============================================================================
+# ÍNDICE DE FILTROS EM BITMAPS
+# =============================================================================
+
+"""
+Índice pré-calculado para os filtros dos dashboards (categoria, tipo de
+cupom, bairro e período), seleção de períodos por busca binária nos
+datasets mantidos ordenados por data (intervalo_periodo) e listas invertidas
+para as chaves inteiras de loja (IndiceChaves).
+
+Para cada valor presente em cada coluna filtrável é guardado um bitmap (bits
+empacotados com np.packbits) com as linhas em que o valor aparece. As linhas
+da tabela indexada estão ordenadas por dia, então o período vira um intervalo
+de linhas encontrado por busca binária. Uma combinação qualquer de filtros é
+resolvida com alguns ANDs de bytes restritos a esse intervalo, sem comparar
+colunas inteiras a cada clique.
+"""
+
+import numpy as np   # Bitmaps e buscas binárias
+import pandas as pd  # Datas dos filtros e colunas categóricas
+
+# Colunas filtráveis nas tabelas das transações (as lojas, de cardinalidade
+# alta, são filtradas pelas chaves conformadas em IndiceChaves)
+COLUNAS_INDICE = ["categoria_estabelecimento", "tipo_cupom", "bairro_estabelecimento"]
+
+# Dia usado para datas ausentes: fica antes de qualquer dia válido
+DIA_AUSENTE = np.iinfo(np.int64).min
+
+
+def dias_desde_epoca(datas):
+    """Converte datas em inteiros (dias desde 1970-01-01); ausentes viram DIA_AUSENTE."""
+    dias = np.asarray(datas, dtype="datetime64[D]")
+    return np.where(np.isnat(dias), DIA_AUSENTE, dias.astype(np.int64))
+
+
+def _dia(data):
+    return pd.Timestamp(data).normalize().to_datetime64().astype("datetime64[D]").astype(np.int64)
+
+
+class IndiceBitmap:
+    """
+    Índice de bitmaps de uma tabela ordenada por dia.
+
+    Args:
+        colunas: nome da coluna -> (códigos inteiros por linha, Index de rótulos);
+            códigos negativos indicam valor ausente
+        dias: vetor ordenado com o dia de cada linha (ver dias_desde_epoca)
+    """
+
+    def __init__(self, colunas, dias):
+        self.n = len(dias)
+        self.dias = dias
+        self.rotulos = {}
+        self.bitmaps = {}
+        self._linhas = {}
+        for nome, (codigos, rotulos) in colunas.items():
+            self.rotulos[nome] = rotulos
+            # Uma linha de bits por valor presente na coluna; os rótulos do
+            # dicionário sem nenhuma linha na tabela não ocupam memória
+            presentes = np.unique(codigos[codigos >= 0])
+            linhas = np.full(len(rotulos), -1, dtype=np.int64)
+            linhas[presentes] = np.arange(len(presentes))
+            self._linhas[nome] = linhas
+            self.bitmaps[nome] = np.stack([
+                np.packbits(codigos == k) for k in presentes
+            ]) if len(presentes) else np.zeros((0, (self.n + 7) // 8), dtype=np.uint8)
+
+    @classmethod
+    def de_tabela(cls, df, colunas=COLUNAS_INDICE):
+        """
+        Indexa as colunas categóricas de um DataFrame ordenado por 'data'.
+
+        Colunas da lista que não existem na tabela são ignoradas.
+        """
+        indexadas = {
+            c: (df[c].cat.codes.to_numpy(), df[c].cat.categories)
+            for c in colunas if c in df.columns
+        }
+        return cls(indexadas, dias_desde_epoca(df["data"]))
+
+    def intervalo(self, inicio=None, fim=None):
+        """Intervalo [a, b) das linhas do período (datas inclusivas)."""
+        a = np.searchsorted(self.dias, _dia(inicio), side="left") if inicio else 0
+        b = np.searchsorted(self.dias, _dia(fim), side="right") if fim else self.n
+        return int(a), int(max(a, b))
+
+    def selecionar(self, filtros, inicio=None, fim=None):
+        """
+        Resolve uma combinação de filtros.
+
+        Args:
+            filtros: coluna -> valor selecionado ('all' ou None = sem filtro)
+            inicio: Primeiro dia do período (opcional)
+            fim: Último dia do período (opcional)
+
+        Returns:
+            Vetor com as posições das linhas selecionadas, em ordem crescente
+        """
+        a, b = self.intervalo(inicio, fim)
+        if a == b:
+            return np.empty(0, dtype=np.int64)
+
+        # Bytes que cobrem o intervalo de linhas
+        byte_a, byte_b = a // 8, (b + 7) // 8
+        resultado = None
+        for coluna, valor in filtros.items():
+            if valor in (None, "all"):
+                continue
+            rotulos = self.rotulos[coluna]
+            linha = self._linhas[coluna][rotulos.get_loc(valor)] if valor in rotulos else -1
+            if linha < 0:
+                return np.empty(0, dtype=np.int64)
+            bits = self.bitmaps[coluna][linha, byte_a:byte_b]
+            resultado = bits.copy() if resultado is None else np.bitwise_and(resultado, bits, out=resultado)
+
+        if resultado is None:
+            return np.arange(a, b, dtype=np.int64)
+        deslocamento = byte_a * 8
+        mascara = np.unpackbits(resultado, count=b - deslocamento)[a - deslocamento:]
+        return np.flatnonzero(mascara) + a
+
+
+# =============================================================================
+# ÍNDICE TEMPORAL DOS DATASETS LINHA A LINHA
+# =============================================================================
+
+def intervalo_periodo(df, coluna, inicio=None, fim=None):
+    """
+    Intervalo [a, b) das linhas de um período em um DataFrame ordenado pela
+    coluna de data.
+
+    Os limites são encontrados por busca binária (searchsorted), então o
+    período vira uma fatia de linhas contíguas (iloc), sem comparar a coluna
+    inteira. As datas são inclusivas: 'fim' inclui o dia inteiro, inclusive
+    para colunas com horário.
+
+    Args:
+        df: DataFrame ordenado por 'coluna' (ausentes no fim)
+        coluna: Coluna de data ou data/hora (ex.: 'data_captura', 'datetime')
+        inicio: Primeiro dia do período (opcional)
+        fim: Último dia do período (opcional)
+
+    Returns:
+        Tupla (a, b) com as posições das linhas do período
+    """
+    datas = df[coluna]
+    a = datas.searchsorted(pd.Timestamp(inicio).normalize(), side="left") if inicio else 0
+    if fim:
+        b = datas.searchsorted(pd.Timestamp(fim).normalize() + pd.Timedelta(days=1), side="left")
+    else:
+        # Sem limite final: exclui apenas as datas ausentes do fim
+        b = len(df) - int(datas.isna().sum()) if inicio else len(df)
+    return int(a), int(max(a, b))
+
+
+# =============================================================================
+# ÍNDICE INVERTIDO DE CHAVES INTEIRAS
+# =============================================================================
+
+class IndiceChaves:
+    """
+    Posições das linhas de cada chave de uma tabela (listas invertidas).
+
+    Usado para as chaves conformadas de loja (utils.dimensoes), que têm
+    cardinalidade alta demais para um bitmap por valor. As posições de cada
+    chave ficam em ordem crescente, então o período (um intervalo de linhas
+    nas tabelas ordenadas por data) é aplicado por busca binária.
+
+    Args:
+        chaves: Vetor com a chave inteira de cada linha (negativas = ausente)
+    """
+
+    def __init__(self, chaves):
+        chaves = np.asarray(chaves)
+        self.n = len(chaves)
+        self._ordem = np.argsort(chaves, kind="stable")
+        n_chaves = int(chaves.max()) + 1 if self.n else 0
+        self._inicios = np.searchsorted(chaves[self._ordem], np.arange(n_chaves + 1))
+
+    def selecionar(self, chaves, a=0, b=None):
+        """
+        Posições, em ordem crescente, das linhas de [a, b) com alguma das chaves.
+        """
+        b = self.n if b is None else b
+        partes = []
+        for chave in np.unique(np.asarray(chaves, dtype=np.int64)):
+            if 0 <= chave < len(self._inicios) - 1:
+                posicoes = self._ordem[self._inicios[chave]:self._inicios[chave + 1]]
+                partes.append(posicoes[np.searchsorted(posicoes, a):np.searchsorted(posicoes, b)])
+        if not partes:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(partes)) if len(partes) > 1 else partes[0]
+
+
+def posicoes_das_listas(inicios, selecao):
+    """
+    Posições das listas selecionadas em valores guardados em sequência, lista
+    após lista (ex.: as lojas de cada célula do cubo).
+
+    Args:
+        inicios: Posição onde começa cada lista (n + 1 posições)
+        selecao: Vetor com as listas selecionadas
+
+    Returns:
+        (posições nos valores, tamanho de cada lista selecionada)
+    """
+    tamanhos = inicios[selecao + 1] - inicios[selecao]
+    fins = np.cumsum(tamanhos)
+    # Para cada posição da saída: início da sua lista + deslocamento dentro dela
+    deslocamentos = np.arange(fins[-1] if len(fins) else 0) - np.repeat(fins - tamanhos, tamanhos)
+    return np.repeat(inicios[selecao], tamanhos) + deslocamentos, tamanhos
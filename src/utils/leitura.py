@@ -0,0 +1,247 @@
+# =============================================================================
+# LEITURA TIPADA DOS CSVs E RELATÓRIO DE CARGA
+# =============================================================================
+
+"""
+Leitura dos arquivos CSV a partir dos esquemas declarados em utils.schemas.
+
+O arquivo é lido pelo engine C do pandas com separador, decimal e tipos
+conhecidos. Datas e horários são convertidos com o formato declarado (muito
+mais rápido que a inferência com dayfirst=True) e valores em dinheiro viram
+centavos inteiros (utils.moeda). Cada leitura gera um
+RelatorioCarga com as linhas lidas, as linhas descartadas por formatação, as
+falhas de conversão por coluna e o tempo gasto, permitindo detectar quando um
+arquivo noturno mudou de formato.
+
+Arquivos grandes podem ser lidos em blocos (ler_csv_tipado_em_blocos), sem
+materializar todas as linhas de uma vez.
+"""
+
+import logging    # Emissão do relatório de carga
+import threading  # Proteção da captura de avisos do parser
+import time       # Medição do tempo de leitura
+import warnings   # Captura das linhas ignoradas pelo parser
+from dataclasses import dataclass, field, asdict
+
+import pandas as pd  # Para leitura e conversão dos dados
+
+from utils.moeda import para_centavos
+from utils.schemas import CATEGORIA, DATA, HORA, MOEDA, NUMERO
+
+logger = logging.getLogger(__name__)
+
+# Data de referência usada para transformar horários em timedelta
+_BASE_HORA = pd.Timestamp("1900-01-01")
+
+# warnings.catch_warnings altera estado global; leituras simultâneas são serializadas
+_trava_avisos = threading.Lock()
+
+
+@dataclass
+class RelatorioCarga:
+    """Resumo de uma carga de arquivo CSV."""
+    dataset: str
+    arquivo: str
+    origem: str = "csv"            # "csv" ou "snapshot"
+    linhas_lidas: int = 0
+    linhas_ignoradas: int = 0      # Linhas descartadas por número de campos inválido
+    falhas_coercao: dict = field(default_factory=dict)  # coluna -> valores que não converteram
+    colunas_ausentes: list = field(default_factory=list)
+    colunas_extras: list = field(default_factory=list)
+    tempo_parse_s: float = 0.0
+
+    @property
+    def formato_alterado(self):
+        """Indica se o cabeçalho do arquivo difere do esquema declarado."""
+        return bool(self.colunas_ausentes or self.colunas_extras)
+
+    @property
+    def com_problemas(self):
+        return bool(self.linhas_ignoradas or self.falhas_coercao or self.formato_alterado)
+
+    def como_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def de_dict(cls, dados):
+        return cls(**dados)
+
+    def resumo(self):
+        partes = [
+            f"[{self.dataset}] {self.linhas_lidas:,} linhas lidas de {self.arquivo} "
+            f"({self.origem}, {self.tempo_parse_s:.2f}s)"
+        ]
+        if self.linhas_ignoradas:
+            partes.append(f"{self.linhas_ignoradas:,} linhas ignoradas")
+        if self.falhas_coercao:
+            falhas = ", ".join(f"{c}={n:,}" for c, n in self.falhas_coercao.items())
+            partes.append(f"falhas de conversão: {falhas}")
+        if self.colunas_ausentes:
+            partes.append(f"colunas ausentes: {', '.join(self.colunas_ausentes)}")
+        if self.colunas_extras:
+            partes.append(f"colunas extras: {', '.join(self.colunas_extras)}")
+        return "; ".join(partes)
+
+
+def emitir_relatorio(relatorio):
+    """Registra o relatório no log (como aviso quando houver problemas)."""
+    if relatorio.com_problemas:
+        logger.warning(relatorio.resumo())
+    else:
+        logger.info(relatorio.resumo())
+
+
+def _dtypes_leitura(esquema, presentes, numeros_como_texto=False):
+    """
+    Monta o dicionário de dtypes passado ao read_csv.
+
+    Datas e horários são lidos como texto e convertidos depois com o formato
+    declarado, para que valores inválidos sejam contados em vez de derrubar a carga.
+    """
+    dtype = {}
+    for coluna in esquema.colunas:
+        if coluna.nome not in presentes:
+            continue
+        if coluna.tipo == NUMERO and not numeros_como_texto:
+            dtype[coluna.nome] = "float64"
+        elif coluna.tipo == CATEGORIA:
+            dtype[coluna.nome] = "category"
+        else:
+            dtype[coluna.nome] = str
+    return dtype
+
+
+def _contar_descartes(avisos):
+    return sum(
+        str(a.message).count("Skipping line")
+        for a in avisos if issubclass(a.category, pd.errors.ParserWarning)
+    )
+
+
+def _ler_contando_descartes(path, **opcoes):
+    """Executa o read_csv e conta as linhas descartadas pelo parser."""
+    with _trava_avisos, warnings.catch_warnings(record=True) as avisos:
+        warnings.simplefilter("always", pd.errors.ParserWarning)
+        df = pd.read_csv(path, engine="c", on_bad_lines="warn", **opcoes)
+    return df, _contar_descartes(avisos)
+
+
+def _contar_falhas(bruto, convertido):
+    """Conta valores presentes no arquivo que viraram ausentes na conversão."""
+    return int((bruto.notna() & convertido.isna()).sum())
+
+
+def _conferir_cabecalho(esquema, path, relatorio, opcoes):
+    """Compara o cabeçalho do arquivo com o esquema e retorna as colunas presentes."""
+    cabecalho = list(pd.read_csv(path, nrows=0, **opcoes).columns)
+    presentes = set(cabecalho)
+    relatorio.colunas_ausentes = [c for c in esquema.nomes if c not in presentes]
+    relatorio.colunas_extras = [c for c in cabecalho if c not in esquema.nomes]
+    return presentes
+
+
+def _converter_colunas(df, esquema, presentes, numeros_como_texto, relatorio):
+    """Converte números (lidos como texto), valores em dinheiro, datas e horários, contando as falhas."""
+    for coluna in esquema.colunas:
+        if coluna.nome not in presentes:
+            continue
+        bruto = df[coluna.nome]
+        if coluna.tipo == NUMERO and numeros_como_texto:
+            texto = bruto
+            if esquema.decimal != ".":
+                texto = (texto.str.replace(".", "", regex=False)
+                              .str.replace(esquema.decimal, ".", regex=False))
+            convertido = pd.to_numeric(texto, errors="coerce")
+        elif coluna.tipo == MOEDA:
+            convertido = para_centavos(bruto)
+        elif coluna.tipo == DATA:
+            convertido = pd.to_datetime(bruto, format=coluna.formato, errors="coerce")
+        elif coluna.tipo == HORA:
+            convertido = pd.to_datetime(bruto, format=coluna.formato, errors="coerce") - _BASE_HORA
+        else:
+            continue
+        falhas = _contar_falhas(bruto, convertido)
+        if falhas:
+            relatorio.falhas_coercao[coluna.nome] = relatorio.falhas_coercao.get(coluna.nome, 0) + falhas
+        df[coluna.nome] = convertido
+
+
+def ler_csv_tipado(esquema, path=None):
+    """
+    Lê um CSV de acordo com o esquema declarado.
+
+    Args:
+        esquema: Esquema do dataset (utils.schemas)
+        path: Caminho alternativo do arquivo (padrão: esquema.arquivo)
+
+    Returns:
+        Tupla (DataFrame tipado, RelatorioCarga)
+    """
+    path = path or esquema.arquivo
+    relatorio = RelatorioCarga(dataset=esquema.nome, arquivo=path)
+    inicio = time.perf_counter()
+
+    opcoes = dict(sep=esquema.sep, decimal=esquema.decimal, encoding=esquema.encoding)
+
+    # Confere o cabeçalho contra o esquema antes de ler o arquivo inteiro
+    presentes = _conferir_cabecalho(esquema, path, relatorio, opcoes)
+
+    numeros_como_texto = False
+    try:
+        df, ignoradas = _ler_contando_descartes(
+            path, dtype=_dtypes_leitura(esquema, presentes), **opcoes)
+    except ValueError:
+        # Algum valor numérico não converteu: relê como texto e converte coluna a coluna
+        numeros_como_texto = True
+        df, ignoradas = _ler_contando_descartes(
+            path, dtype=_dtypes_leitura(esquema, presentes, True), **opcoes)
+    relatorio.linhas_ignoradas = ignoradas
+
+    _converter_colunas(df, esquema, presentes, numeros_como_texto, relatorio)
+
+    relatorio.linhas_lidas = len(df)
+    relatorio.tempo_parse_s = time.perf_counter() - inicio
+    return df, relatorio
+
+
+def ler_csv_tipado_em_blocos(esquema, tamanho_bloco, path=None):
+    """
+    Lê um CSV de acordo com o esquema declarado, em blocos de linhas.
+
+    Como um bloco já lido não pode ser relido, os números são sempre lidos como
+    texto e convertidos depois, para que um valor inválido seja contado como
+    falha de conversão em vez de interromper a leitura.
+
+    Args:
+        esquema: Esquema do dataset (utils.schemas)
+        tamanho_bloco: Número de linhas por bloco
+        path: Caminho alternativo do arquivo (padrão: esquema.arquivo)
+
+    Returns:
+        Tupla (iterador de DataFrames tipados, RelatorioCarga). O relatório é
+        preenchido à medida que os blocos são consumidos.
+    """
+    path = path or esquema.arquivo
+    relatorio = RelatorioCarga(dataset=esquema.nome, arquivo=path)
+    opcoes = dict(sep=esquema.sep, decimal=esquema.decimal, encoding=esquema.encoding)
+
+    def blocos():
+        inicio = time.perf_counter()
+        presentes = _conferir_cabecalho(esquema, path, relatorio, opcoes)
+        leitor = pd.read_csv(
+            path, engine="c", on_bad_lines="warn", chunksize=tamanho_bloco,
+            dtype=_dtypes_leitura(esquema, presentes, True), **opcoes)
+        with leitor:
+            while True:
+                with _trava_avisos, warnings.catch_warnings(record=True) as avisos:
+                    warnings.simplefilter("always", pd.errors.ParserWarning)
+                    bloco = next(leitor, None)
+                relatorio.linhas_ignoradas += _contar_descartes(avisos)
+                if bloco is None:
+                    break
+                _converter_colunas(bloco, esquema, presentes, True, relatorio)
+                relatorio.linhas_lidas += len(bloco)
+                relatorio.tempo_parse_s = time.perf_counter() - inicio
+                yield bloco
+
+    return blocos(), relatorio
@@ -0,0 +1,112 @@
+# =============================================================================
+# VALORES EM DINHEIRO (CENTAVOS INTEIROS)
+# =============================================================================
+
+"""
+Conversão dos valores monetários dos CSVs para centavos inteiros.
+
+As colunas do tipo MOEDA (utils.schemas) são guardadas como centavos em
+inteiros de 64 bits (Int64, com ausentes), então somas, receitas e margens
+são exatas e fecham com o financeiro, sem o arredondamento acumulado das
+somas em float. A conversão para reais (float) acontece só na exibição:
+KPIs, eixos dos gráficos, médias e medianas.
+
+O texto aceito cobre as formas que aparecem nos arquivos: "848.2",
+"1.234,56" (padrão brasileiro), "1,234.56", "1.234.567" (só milhares) e
+"R$ 12,90". O separador seguido de uma ou duas casas no fim é o decimal; os
+separadores de milhar precisam vir em grupos de três dígitos. Fora o prefixo
+"R$" e os espaços nas pontas, nada é descartado: textos como "1e3", "abc1,50",
+"1.2.3" ou "848.205" (milhar ou três casas decimais?) viram ausentes e entram
+nas falhas de conversão do relatório de carga.
+
+Para conferir os exemplos: python -m utils.moeda
+"""
+
+import numpy as np   # Conversão para reais
+import pandas as pd  # Parsing vetorizado dos textos
+
+CENTAVOS_POR_REAL = 100
+
+# Sinal, parte inteira e até duas casas decimais. A parte inteira é só
+# dígitos, ou grupos de milhar com o outro separador antes do decimal
+# ("1.234,56", "1,234.56"), ou dois ou mais grupos sem decimal ("1.234.567")
+_PADRAO_MOEDA = (r"^(?P<sinal>-?)(?P<inteiro>\d*"
+                 r"|\d{1,3}(?:\.\d{3})+(?=,)|\d{1,3}(?:,\d{3})+(?=\.)"
+                 r"|\d{1,3}(?:\.\d{3}){2,}(?![.,])|\d{1,3}(?:,\d{3}){2,}(?![.,]))"
+                 r"(?:[.,](?P<decimal>\d{1,2}))?$")
+
+# Texto -> centavos esperados (None = rejeitado), conferidos por python -m utils.moeda
+_EXEMPLOS = {
+    "848.2": 84820, "848,20": 84820, "R$ 12,90": 1290, "-R$ 5": -500, "R$ -5,5": -550,
+    "1.234,56": 123456, "1,234.56": 123456, "1.234.567": 123456700, "1,234,567.8": 123456780,
+    "1e3": None, "abc1,50": None, "1.2.3": None, "848.205": None, "1.234.567.89": None,
+    "12 34": None, "-": None, "": None,
+}
+
+
+def _centavos_de_textos(texto):
+    """Centavos (Int64) de textos em qualquer das formas aceitas."""
+    # Remove só o símbolo da moeda (antes ou depois do sinal) e os espaços nas pontas
+    texto = texto.str.strip().str.replace(r"^(-?)R\$\s*", r"\1", regex=True)
+    partes = texto.str.extract(_PADRAO_MOEDA)
+    valido = partes["inteiro"].notna() & ((partes["inteiro"] != "") | partes["decimal"].notna())
+
+    inteiro = pd.to_numeric(partes["inteiro"].str.replace(r"[.,]", "", regex=True).replace("", "0"),
+                            errors="coerce")
+    decimal = pd.to_numeric(partes["decimal"].fillna("0").str.ljust(2, "0"), errors="coerce")
+    centavos = (inteiro * CENTAVOS_POR_REAL + decimal).where(valido).astype("Int64")
+    return centavos.where(partes["sinal"] != "-", -centavos)
+
+
+def para_centavos(valores):
+    """
+    Converte textos (ou números) em centavos inteiros.
+
+    Os textos distintos são convertidos uma única vez. A forma mais comum
+    ("848.2") é lida direto como número e arredondada para o centavo (exato
+    para até duas casas); as demais passam pelo parsing completo. Valores que
+    não seguem nenhuma das formas aceitas viram ausentes (e entram nas falhas
+    de conversão do relatório de carga).
+
+    Args:
+        valores: Series com os valores lidos do CSV
+
+    Returns:
+        Series Int64 com os centavos (mesmo índice)
+    """
+    if pd.api.types.is_numeric_dtype(valores):
+        # Já numérico (ex.: float lido pelo parser): arredonda para o centavo
+        return (valores.astype("float64") * CENTAVOS_POR_REAL).round().astype("Int64")
+
+    codigos, distintos = pd.factorize(valores)
+    texto = pd.Series(distintos, dtype=object).astype(str)
+    centavos = pd.Series(pd.NA, index=texto.index, dtype="Int64")
+    simples = texto.str.fullmatch(r"-?\d+(?:\.\d{1,2})?")
+    centavos[simples] = (pd.to_numeric(texto[simples]) * CENTAVOS_POR_REAL).round().astype("Int64")
+    if not simples.all():
+        centavos[~simples] = _centavos_de_textos(texto[~simples])
+
+    resultado = centavos.array.take(codigos, allow_fill=True)
+    return pd.Series(resultado, index=valores.index, name=valores.name)
+
+
+def reais(centavos):
+    """
+    Converte centavos em reais (float; ausentes viram NaN).
+
+    Aceita escalares, arrays e Series (inclusive Int64 com ausentes).
+    """
+    if isinstance(centavos, pd.Series):
+        return pd.Series(centavos.to_numpy("float64", na_value=np.nan) / CENTAVOS_POR_REAL,
+                         index=centavos.index, name=centavos.name)
+    if np.ndim(centavos):
+        return np.asarray(centavos, dtype="float64") / CENTAVOS_POR_REAL
+    return float(centavos) / CENTAVOS_POR_REAL
+
+
+if __name__ == "__main__":
+    obtidos = para_centavos(pd.Series(list(_EXEMPLOS), dtype=object))
+    for (texto, esperado), obtido in zip(_EXEMPLOS.items(), obtidos):
+        obtido = None if pd.isna(obtido) else int(obtido)
+        assert obtido == esperado, f"{texto!r}: esperado {esperado}, obtido {obtido}"
+    print(f"{len(_EXEMPLOS)} exemplos conferidos")
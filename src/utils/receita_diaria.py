@@ -0,0 +1,212 @@
+# =============================================================================
+# RECEITA DIÁRIA POR LOJA (KPIs E META MENSAL DO CFO)
+# =============================================================================
+
+"""
+Rollup diário das medidas financeiras por ponto (par loja e segmento) da
+dimensão conformada.
+
+Para cada dia e id_ponto (utils.dimensoes) com movimento são guardadas as
+somas de MEDIDAS_RECEITA: valor dos cupons, repasse à PicMoney e número de
+cupons com valor (das transações) e valor e número das compras (de
+lojas_valores), que dão o ticket médio de cada loja. Valores (em centavos,
+utils.moeda) e contagens são inteiros, então as somas são int64 e os totais,
+exatos.
+
+O rollup é esparso: uma linha por par (ponto, dia) existente, e não uma
+matriz dias x pontos, então a memória cresce com o movimento e não com o
+número de lojas do cadastro. As linhas ficam ordenadas por ponto e dia e
+guardam a soma acumulada ao longo da tabela; as linhas de um ponto são
+contíguas, então o total de um ponto em qualquer período é a diferença de
+duas linhas do acumulado, localizadas por busca binária. Os KPIs e a meta do
+mês custam duas buscas por ponto do filtro, sem percorrer as linhas.
+
+Segmentos e lojas não precisam de eixo próprio: um filtro de segmento e loja
+é um conjunto de pontos (DimensaoLojas.resolver).
+
+adicionar() soma novas linhas (de dias ou pontos novos ou já existentes) e
+refaz o acumulado.
+"""
+
+import numpy as np   # Linhas (ponto, dia) e somas acumuladas
+import pandas as pd  # Datas dos filtros
+
+from utils.indice import DIA_AUSENTE, dias_desde_epoca
+
+# Medidas do rollup, na ordem das colunas do acumulado
+MEDIDAS_RECEITA = ["valor_cupom", "repasse_picmoney", "valor_cupom_n", "valor_compra", "compras"]
+
+# Colunas de cada tabela de origem que alimentam as medidas
+_MEDIDAS_FATOS = ["valor_cupom", "repasse_picmoney", "valor_cupom_n"]
+_MEDIDAS_MASSA = ["valor_compra"]
+
+# Chave de cada linha: (id_ponto + 1) nos bits altos e o dia deslocado de
+# _DESLOCAMENTO_DIA nos 32 bits baixos. As linhas sem loja ficam com o ponto
+# -1 e as sem data com o dia 0, o menor possível
+_BITS_DIA = 32
+_DESLOCAMENTO_DIA = 2 ** 31
+
+
+_EPOCA = pd.Timestamp("1970-01-01")
+
+
+def dia_do_filtro(data):
+    """Dia (inteiro, como em utils.indice.dias_desde_epoca) de uma data dos filtros."""
+    return (pd.Timestamp(data).normalize() - _EPOCA).days
+
+
+def _chaves(pontos, dias):
+    """Chave de ordenação (ponto, dia) das linhas; 'dias' já deslocados."""
+    return ((np.asarray(pontos, dtype=np.int64) + 1) << _BITS_DIA) + np.asarray(dias, dtype=np.int64)
+
+
+class ReceitaDiaria:
+    """
+    Somas por (ponto, dia) com movimento, com acumulado ao longo das linhas.
+
+    As linhas sem loja só entram nos totais sem filtro de loja. Linhas sem
+    data ficam antes do primeiro dia de cada ponto e, como no IndiceBitmap, só
+    entram em períodos sem data inicial.
+    """
+
+    def __init__(self):
+        self._chaves = np.zeros(0, dtype=np.int64)
+        # Linha i + 1: soma das linhas 0..i (a linha 0 é zero)
+        self._acumulado = np.zeros((1, len(MEDIDAS_RECEITA)), dtype=np.int64)
+        self.n_pontos = 0
+        self._ultimo_dia = None
+
+    @classmethod
+    def de_tabelas(cls, fatos, massa):
+        """
+        Monta o rollup a partir das tabelas já conformadas (utils.dimensoes).
+
+        Args:
+            fatos: Tabela de fatos de utils.agregados
+            massa: lojas_valores
+        """
+        receita = cls()
+        receita.adicionar(fatos["data"], fatos["id_ponto"], fatos[_MEDIDAS_FATOS])
+        receita.adicionar(massa["data_captura"], massa["id_ponto"],
+                          massa[_MEDIDAS_MASSA].assign(compras=massa["valor_compra"].notna()))
+        return receita
+
+    # ---------------------- Atualização incremental ----------------------
+
+    def __len__(self):
+        """Número de linhas (ponto, dia) guardadas."""
+        return len(self._chaves)
+
+    @property
+    def nbytes(self):
+        return self._chaves.nbytes + self._acumulado.nbytes
+
+    def adicionar(self, datas, pontos, medidas):
+        """
+        Soma linhas ao rollup.
+
+        Args:
+            datas: Data de cada linha (ausentes só entram em períodos sem início)
+            pontos: id_ponto de cada linha (negativo = sem loja)
+            medidas: DataFrame com algumas das colunas de MEDIDAS_RECEITA, em
+                centavos ou contagens (ausentes contam como zero)
+        """
+        dias = dias_desde_epoca(datas)
+        pontos = np.asarray(pontos, dtype=np.int64)
+        valores = np.zeros((len(dias), len(MEDIDAS_RECEITA)), dtype=np.int64)
+        for coluna in medidas.columns:
+            valores[:, MEDIDAS_RECEITA.index(coluna)] = medidas[coluna].to_numpy("int64", na_value=0)
+
+        com_data = dias != DIA_AUSENTE
+        if com_data.any():
+            ultimo = int(dias[com_data].max())
+            self._ultimo_dia = ultimo if self._ultimo_dia is None else max(self._ultimo_dia, ultimo)
+        self.n_pontos = max(self.n_pontos, int(pontos.max()) + 1 if len(pontos) else 0)
+
+        # Linhas atuais (diferenças do acumulado) e novas, somadas por chave
+        chaves = np.concatenate([
+            self._chaves,
+            _chaves(np.maximum(pontos, -1), np.where(com_data, dias + _DESLOCAMENTO_DIA, 0)),
+        ])
+        valores = np.concatenate([np.diff(self._acumulado, axis=0), valores])
+        self._chaves, inversa = np.unique(chaves, return_inverse=True)
+        somas = np.zeros((len(self._chaves), len(MEDIDAS_RECEITA)), dtype=np.int64)
+        np.add.at(somas, inversa, valores)
+        self._acumulado = np.zeros((len(self._chaves) + 1, len(MEDIDAS_RECEITA)), dtype=np.int64)
+        np.cumsum(somas, axis=0, out=self._acumulado[1:])
+
+    # ---------------------- Consultas ----------------------
+
+    @property
+    def ultimo_dia(self):
+        """Último dia com dados (Timestamp), ou None se o rollup estiver vazio."""
+        if self._ultimo_dia is None:
+            return None
+        return pd.Timestamp(self._ultimo_dia, unit="D")
+
+    def _somas(self, pontos, inicio=None, fim=None):
+        """
+        Somas de cada ponto (-1 = linhas sem loja) no período.
+
+        Returns:
+            Matriz (pontos x MEDIDAS_RECEITA)
+        """
+        # Dias (deslocados) do período [a, b); sem início, as linhas sem data entram
+        a = dia_do_filtro(inicio) + _DESLOCAMENTO_DIA if inicio else 0
+        b = dia_do_filtro(fim) + 1 + _DESLOCAMENTO_DIA if fim else 1 << _BITS_DIA
+        b = max(a, b)
+        primeiras = np.searchsorted(self._chaves, _chaves(pontos, a))
+        ultimas = np.searchsorted(self._chaves, _chaves(pontos, b))
+        return self._acumulado[ultimas] - self._acumulado[primeiras]
+
+    def _ids(self, pontos):
+        """id_ponto válidos e distintos de um filtro (None = todos os pontos)."""
+        if pontos is None:
+            return np.arange(self.n_pontos)
+        ids = np.unique(np.asarray(pontos, dtype=np.int64))
+        return ids[(ids >= 0) & (ids < self.n_pontos)]
+
+    def totais(self, pontos=None, inicio=None, fim=None):
+        """
+        Somas das medidas no período e nos pontos selecionados.
+
+        Args:
+            pontos: Conjunto de id_ponto (None = todas as linhas)
+            inicio: Primeiro dia do período (opcional)
+            fim: Último dia do período (opcional)
+
+        Returns:
+            Dicionário medida -> soma (valores em centavos)
+        """
+        if pontos is None and not inicio and not fim:
+            somas = self._acumulado[-1]
+        else:
+            ids = self._ids(pontos)
+            if pontos is None:
+                ids = np.append(ids, -1)
+            somas = self._somas(ids, inicio, fim).sum(axis=0)
+        return dict(zip(MEDIDAS_RECEITA, somas.tolist()))
+
+    def por_ponto(self, pontos=None, inicio=None, fim=None):
+        """
+        Somas das medidas de cada ponto no período.
+
+        Args:
+            pontos: Conjunto de id_ponto (None = todos os pontos)
+
+        Returns:
+            DataFrame indexado por id_ponto com as colunas de MEDIDAS_RECEITA
+        """
+        ids = self._ids(pontos)
+        return pd.DataFrame(self._somas(ids, inicio, fim), index=pd.Index(ids, name="id_ponto"),
+                            columns=MEDIDAS_RECEITA)
+
+    def mes_ate(self, dia, pontos=None):
+        """
+        Somas do mês de 'dia' até 'dia' (inclusive), nos pontos selecionados.
+
+        Returns:
+            Dicionário medida -> soma
+        """
+        dia = pd.Timestamp(dia).normalize()
+        return self.totais(pontos, inicio=dia.replace(day=1), fim=dia)
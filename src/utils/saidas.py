@@ -0,0 +1,125 @@
+# =============================================================================
+# SAÍDAS DOS CALLBACKS DEPENDENTES DOS FILTROS
+# =============================================================================
+
+"""
+Decide quais saídas de um callback de filtros precisam ser recalculadas.
+
+Cada página declara de quais filtros cada saída depende. O callback guarda o
+último estado aplicado (em um dcc.Store) e, a cada clique, recalcula apenas as
+saídas com algum desses filtros alterado; as demais voltam como no_update e
+não são reenviadas ao navegador. Saídas sem dependências são montadas no
+layout, uma vez por versão dos dados, e nunca pelo callback.
+
+Para figuras, atualizar_figura compara a figura nova com a do estado anterior
+(guardada no cache de figuras) e envia um Patch apenas com as propriedades
+dos traços e do layout que mudaram.
+"""
+
+import numpy as np  # Comparação dos vetores das figuras
+from dash import Patch, no_update
+
+from utils.graphs import cache_figuras, normalizar_filtros
+
+
+def estado_filtros(filtros):
+    """Estado normalizado dos filtros, serializável para um dcc.Store."""
+    return dict(normalizar_filtros(filtros))
+
+
+def filtros_alterados(anterior, atual):
+    """Nomes dos filtros que mudaram (todos, se não houver estado anterior)."""
+    if anterior is None:
+        return set(atual)
+    return {nome for nome, valor in atual.items() if anterior.get(nome) != valor}
+
+
+def responder(dependencias, anterior, atual, calcular):
+    """
+    Monta as saídas de um callback, recalculando só as afetadas pelos filtros.
+
+    Args:
+        dependencias: saída -> filtros de que ela depende (vazio = independente)
+        anterior: estado_filtros do último clique (None se desconhecido)
+        atual: estado_filtros deste clique
+        calcular: função que recebe a lista de saídas a recalcular e retorna
+            um dicionário saída -> valor
+
+    Returns:
+        Lista com o valor (ou no_update) de cada saída, na ordem de 'dependencias'
+    """
+    alterados = filtros_alterados(anterior, atual)
+    recalcular = [saida for saida, filtros in dependencias.items() if alterados & set(filtros)]
+    valores = calcular(recalcular) if recalcular else {}
+    return [valores.get(saida, no_update) for saida in dependencias]
+
+
+def _iguais(a, b):
+    """Compara valores de uma figura serializada (dicts, listas e arrays)."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_iguais(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple, np.ndarray)) or isinstance(b, (list, tuple, np.ndarray)):
+        if len(a) != len(b):
+            return False
+        try:
+            a, b = np.asarray(a), np.asarray(b)
+        except ValueError:
+            # Listas irregulares (ex.: customdata de tamanhos diferentes)
+            return all(_iguais(x, y) for x, y in zip(a, b))
+        if a.shape != b.shape:
+            return False
+        if a.dtype != object and b.dtype != object:
+            return bool(np.array_equal(a, b))
+        return all(_iguais(x, y) for x, y in zip(a.ravel(), b.ravel()))
+    return bool(a == b)
+
+
+def atualizacao_parcial(anterior, nova):
+    """
+    Diferença entre duas figuras serializadas.
+
+    Returns:
+        no_update se forem iguais; um Patch com as propriedades alteradas se
+        os traços tiverem a mesma estrutura; senão a figura nova inteira
+    """
+    if anterior is None:
+        return nova
+    tracos_a, tracos_n = anterior.get("data", []), nova.get("data", [])
+    if (len(tracos_a) != len(tracos_n)
+            or any(a.keys() != n.keys() for a, n in zip(tracos_a, tracos_n))
+            or anterior.get("layout", {}).keys() != nova.get("layout", {}).keys()):
+        return nova
+
+    patch = Patch()
+    alterada = False
+    for i, (traco_a, traco_n) in enumerate(zip(tracos_a, tracos_n)):
+        for chave, valor in traco_n.items():
+            if not _iguais(traco_a[chave], valor):
+                patch["data"][i][chave] = valor
+                alterada = True
+    for chave, valor in nova.get("layout", {}).items():
+        if not _iguais(anterior["layout"][chave], valor):
+            patch["layout"][chave] = valor
+            alterada = True
+    return patch if alterada else no_update
+
+
+def atualizar_figura(nome, dependencias, anterior, atual, versao, construir):
+    """
+    Saída de um callback de figura: no_update, Patch ou a figura inteira.
+
+    Args:
+        nome: Nome da figura no cache de figuras
+        dependencias: Filtros de que a figura depende
+        anterior: estado_filtros do último clique (None se desconhecido)
+        atual: estado_filtros deste clique
+        versao: Versão dos dados (registro.versao)
+        construir: Função sem argumentos que monta a figura
+    """
+    if anterior is not None and not (filtros_alterados(anterior, atual) & set(dependencias)):
+        return no_update
+    nova = cache_figuras.obter(nome, {f: atual[f] for f in dependencias}, versao, construir)
+    if anterior is None:
+        return nova
+    velha = cache_figuras.consultar(nome, {f: anterior.get(f) for f in dependencias}, versao)
+    return atualizacao_parcial(velha, nova)
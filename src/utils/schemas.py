@@ -0,0 +1,136 @@
+# =============================================================================
+# REGISTRO DE ESQUEMAS DOS DATASETS
+# =============================================================================
+
+"""
+Declaração explícita do formato de cada arquivo CSV do sistema.
+
+Cada esquema informa o separador, a convenção decimal, as colunas esperadas
+com seus tipos e os formatos de data/hora. Com isso o carregamento usa o
+engine C do pandas com tipos definidos, sem detecção de separador nem
+inferência de formato de data, e é possível comparar o arquivo recebido com o
+formato esperado (colunas ausentes ou extras, valores que não convertem).
+"""
+
+from dataclasses import dataclass
+
+# Tipos lógicos de coluna aceitos nos esquemas
+TEXTO = "texto"          # String livre (ex.: endereço, id do cupom)
+CATEGORIA = "categoria"  # String de baixa cardinalidade (ex.: tipo_cupom)
+NUMERO = "numero"        # Valor numérico (float64)
+MOEDA = "moeda"          # Valor em reais, guardado em centavos (Int64; ver utils.moeda)
+DATA = "data"            # Data no formato declarado em 'formato'
+HORA = "hora"            # Horário do dia no formato declarado em 'formato'
+
+# Formatos padrão dos arquivos da PicMoney
+FORMATO_DATA = "%d/%m/%Y"
+FORMATO_HORA = "%H:%M:%S"
+
+
+@dataclass(frozen=True)
+class Coluna:
+    """Declaração de uma coluna do CSV."""
+    nome: str
+    tipo: str
+    formato: str = None  # Usado apenas por colunas do tipo DATA e HORA
+
+
+@dataclass(frozen=True)
+class Esquema:
+    """Declaração completa de um arquivo CSV."""
+    nome: str
+    arquivo: str
+    colunas: tuple
+    sep: str = ";"
+    decimal: str = "."
+    encoding: str = "utf-8"
+
+    @property
+    def nomes(self):
+        return [c.nome for c in self.colunas]
+
+    def colunas_do_tipo(self, *tipos):
+        return [c for c in self.colunas if c.tipo in tipos]
+
+
+ESQUEMA_MASSA = Esquema(
+    nome="massa",
+    arquivo="data/lojas_valores.csv",
+    colunas=(
+        Coluna("numero_celular", TEXTO),
+        Coluna("data_captura", DATA, FORMATO_DATA),
+        Coluna("tipo_cupom", CATEGORIA),
+        Coluna("tipo_loja", CATEGORIA),
+        Coluna("local_captura", CATEGORIA),
+        Coluna("latitude", TEXTO),   # Exportado com separadores de milhar corrompidos
+        Coluna("longitude", TEXTO),
+        Coluna("nome_loja", CATEGORIA),
+        Coluna("endereco_loja", TEXTO),
+        Coluna("valor_compra", MOEDA),
+        Coluna("valor_cupom", MOEDA),
+    ),
+)
+
+ESQUEMA_PEDESTRES = Esquema(
+    nome="pedestres",
+    arquivo="data/pedestres_paulista.csv",
+    colunas=(
+        Coluna("celular", TEXTO),
+        Coluna("data", DATA, FORMATO_DATA),
+        Coluna("horario", HORA, FORMATO_HORA),
+        Coluna("local", CATEGORIA),
+        Coluna("latitude", TEXTO),
+        Coluna("longitude", TEXTO),
+        Coluna("tipo_celular", CATEGORIA),
+        Coluna("modelo_celular", CATEGORIA),
+        Coluna("possui_app_picmoney", CATEGORIA),
+        Coluna("data_ultima_compra", DATA, FORMATO_DATA),
+        Coluna("ultimo_tipo_cupom", CATEGORIA),
+        Coluna("ultimo_valor_capturado", MOEDA),
+        Coluna("ultimo_tipo_loja", CATEGORIA),
+        Coluna("idade", NUMERO),
+        Coluna("sexo", CATEGORIA),
+    ),
+)
+
+ESQUEMA_TRANS = Esquema(
+    nome="trans",
+    arquivo="data/transacoes_cupons.csv",
+    colunas=(
+        Coluna("celular", TEXTO),
+        Coluna("data", DATA, FORMATO_DATA),
+        Coluna("hora", HORA, FORMATO_HORA),
+        Coluna("nome_estabelecimento", CATEGORIA),
+        Coluna("bairro_estabelecimento", CATEGORIA),
+        Coluna("categoria_estabelecimento", CATEGORIA),
+        Coluna("id_campanha", TEXTO),
+        Coluna("id_cupom", TEXTO),
+        Coluna("tipo_cupom", CATEGORIA),
+        Coluna("produto", TEXTO),
+        Coluna("valor_cupom", MOEDA),
+        Coluna("repasse_picmoney", MOEDA),
+    ),
+)
+
+ESQUEMA_PLAYERS = Esquema(
+    nome="players",
+    arquivo="data/base_players.csv",
+    colunas=(
+        Coluna("celular", TEXTO),
+        Coluna("data_nascimento", DATA, FORMATO_DATA),
+        Coluna("idade", NUMERO),
+        Coluna("sexo", CATEGORIA),
+        Coluna("cidade_residencial", CATEGORIA),
+        Coluna("bairro_residencial", CATEGORIA),
+        Coluna("cidade_trabalho", CATEGORIA),
+        Coluna("bairro_trabalho", CATEGORIA),
+        Coluna("cidade_escola", CATEGORIA),
+        Coluna("bairro_escola", CATEGORIA),
+        Coluna("categoria_frequentada", CATEGORIA),
+    ),
+)
+
+# Registro central: nome do dataset -> esquema
+ESQUEMAS = {
+    e.nome: e for e in (ESQUEMA_MASSA, ESQUEMA_PEDESTRES, ESQUEMA_TRANS, ESQUEMA_PLAYERS)
+}
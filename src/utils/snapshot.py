@@ -0,0 +1,266 @@
+# =============================================================================
+# SNAPSHOTS COLUNARES DOS DATASETS PRÉ-PROCESSADOS
+# =============================================================================
+
+"""
+Camada de cache em disco para os DataFrames já limpos e tipados.
+
+Na primeira carga, o resultado do pré-processamento de cada CSV é gravado em
+um arquivo Feather (formato colunar do Apache Arrow) ao lado dos dados. A
+chave do snapshot combina o hash do conteúdo do CSV e a versão do pipeline;
+nas próximas inicializações o arquivo é mapeado em memória em vez de
+reprocessar o CSV inteiro.
+
+O hash do conteúdo fica guardado na pasta dos snapshots junto com o tamanho e
+a data de modificação (st_mtime_ns) do CSV. Enquanto esses dois não mudam, o
+hash guardado é reaproveitado e o CSV não é lido; só um arquivo alterado (ou
+apenas tocado) é lido de novo para recalcular o hash.
+
+O pyarrow é opcional: sem ele, os dados são sempre carregados do CSV.
+"""
+
+import hashlib  # Hash do conteúdo dos arquivos de origem
+import json     # Serialização dos metadados gravados junto ao snapshot
+import logging  # Avisos de falha na leitura/gravação dos snapshots
+import os       # Manipulação de caminhos e arquivos
+
+import pandas as pd  # Índice vazio dos snapshots com várias tabelas
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow não instalado
+    pa = None
+    feather = None
+
+logger = logging.getLogger(__name__)
+
+# Versão do pré-processamento. Deve ser incrementada sempre que a limpeza ou
+# as colunas derivadas mudarem, para invalidar snapshots antigos.
+VERSAO_PIPELINE = 11
+
+# Nome da pasta (dentro da pasta de dados) onde os snapshots são gravados
+PASTA_SNAPSHOTS = ".snapshots"
+
+# Chave dos metadados da PicMoney no esquema Arrow do snapshot
+_CHAVE_METADADOS = b"picmoney"
+
+# Tamanho do bloco de leitura usado no cálculo do hash
+_TAMANHO_BLOCO_HASH = 1024 * 1024
+
+# Arquivo (na pasta dos snapshots) com o hash de cada CSV, por tamanho e data
+_ARQUIVO_HASHES = "hashes.json"
+
+
+def snapshots_disponiveis():
+    """Indica se o pyarrow está instalado e os snapshots podem ser usados."""
+    return feather is not None
+
+
+def hash_conteudo(path):
+    """SHA1 do conteúdo de um arquivo, lido em blocos."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(_TAMANHO_BLOCO_HASH), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _hash_guardado(path):
+    """
+    Hash do conteúdo do arquivo, reaproveitado enquanto o tamanho e a data de
+    modificação forem os mesmos da última vez em que foi calculado.
+    """
+    info = os.stat(path)
+    assinatura = [info.st_size, info.st_mtime_ns]
+    pasta = os.path.join(os.path.dirname(path), PASTA_SNAPSHOTS)
+    arquivo = os.path.join(pasta, _ARQUIVO_HASHES)
+    try:
+        with open(arquivo, encoding="utf-8") as f:
+            hashes = json.load(f)
+    except (OSError, ValueError):
+        hashes = {}
+    nome = os.path.basename(path)
+    guardado = hashes.get(nome)
+    if isinstance(guardado, dict) and guardado.get("assinatura") == assinatura:
+        return guardado["hash"]
+
+    hashes[nome] = {"assinatura": assinatura, "hash": hash_conteudo(path)}
+    # Gravação atômica, como a dos snapshots; sem permissão, só não há cache
+    temporario = f"{arquivo}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(hashes, f)
+        os.replace(temporario, arquivo)
+    except OSError as e:
+        logger.warning("não foi possível guardar o hash de '%s': %s", nome, e)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return hashes[nome]["hash"]
+
+
+def chave_arquivo(path):
+    """
+    Calcula a chave de um arquivo de origem.
+
+    O conteúdo só é lido quando o tamanho ou a data de modificação do arquivo
+    mudaram desde o último cálculo (ver _hash_guardado).
+
+    Args:
+        path: Caminho do arquivo CSV
+
+    Returns:
+        String hexadecimal derivada do conteúdo e da versão do pipeline
+    """
+    return hashlib.sha1(f"{_hash_guardado(path)}|v{VERSAO_PIPELINE}".encode()).hexdigest()
+
+
+def _caminho_snapshot(nome, path, chave):
+    pasta = os.path.join(os.path.dirname(path), PASTA_SNAPSHOTS)
+    return pasta, os.path.join(pasta, f"{nome}-{chave[:20]}.feather")
+
+
+def _remover_snapshots_antigos(pasta, nome, atual):
+    """Apaga snapshots do mesmo dataset gerados a partir de versões anteriores do CSV."""
+    for arquivo in os.listdir(pasta):
+        caminho = os.path.join(pasta, arquivo)
+        if arquivo.startswith(f"{nome}-") and arquivo.endswith(".feather") and caminho != atual:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+
+def ler_snapshot(destino):
+    """
+    Lê um snapshot Feather usando mapeamento de memória.
+
+    A tabela Arrow aponta para as páginas do arquivo mapeado, sem cópia; a
+    conversão para pandas copia cada coluna uma vez para a memória do
+    processo (os DataFrames precisam ser graváveis). Com self_destruct, cada
+    coluna Arrow é liberada logo depois de convertida, então o pico fica
+    perto de uma única cópia dos dados.
+
+    Returns:
+        Tupla (DataFrame, dicionário de metadados gravado junto ao snapshot)
+    """
+    tabela = feather.read_table(destino, memory_map=True)
+    bruto = (tabela.schema.metadata or {}).get(_CHAVE_METADADOS)
+    metadados = json.loads(bruto) if bruto else {}
+    # A tabela não é usada depois da conversão (exigência do self_destruct)
+    return tabela.to_pandas(split_blocks=True, self_destruct=True), metadados
+
+
+def gravar_snapshot(df, destino, metadados=None):
+    """
+    Grava o DataFrame em formato Feather de forma atômica.
+
+    O arquivo é escrito com um nome temporário e renomeado ao final, para que
+    outros processos (workers do servidor) nunca leiam um snapshot incompleto.
+    """
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    try:
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        if metadados:
+            tabela = tabela.replace_schema_metadata({
+                **(tabela.schema.metadata or {}),
+                _CHAVE_METADADOS: json.dumps(metadados).encode(),
+            })
+        feather.write_feather(tabela, temporario, compression="uncompressed")
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def carregar_com_snapshot(nome, path, preparar):
+    """
+    Carrega um dataset pré-processado, reaproveitando o snapshot quando válido.
+
+    Args:
+        nome: Identificador curto do dataset (ex.: "trans")
+        path: Caminho do CSV de origem
+        preparar: Função sem argumentos que lê o CSV, aplica o pré-processamento
+            e retorna a tupla (DataFrame, metadados)
+
+    Returns:
+        Tupla (DataFrame pré-processado, metadados, origem), onde origem é
+        "snapshot" ou "csv"
+    """
+    if not snapshots_disponiveis() or not os.path.exists(path):
+        df, metadados = preparar()
+        return df, metadados, "csv"
+
+    chave = chave_arquivo(path)
+    pasta, destino = _caminho_snapshot(nome, path, chave)
+
+    if os.path.exists(destino):
+        try:
+            df, metadados = ler_snapshot(destino)
+            return df, metadados, "snapshot"
+        except Exception as e:
+            # Snapshot corrompido ou incompatível: reprocessa a partir do CSV
+            logger.warning("snapshot inválido para '%s' (%s); recarregando CSV", nome, e)
+
+    df, metadados = preparar()
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        gravar_snapshot(df, destino, metadados)
+        _remover_snapshots_antigos(pasta, nome, destino)
+    except Exception as e:
+        logger.warning("não foi possível gravar o snapshot de '%s': %s", nome, e)
+    return df, metadados, "csv"
+
+
+def carregar_tabelas_com_snapshot(nome, path, preparar, dependencias=()):
+    """
+    Versão de carregar_com_snapshot para estruturas formadas por várias tabelas
+    (ex.: os agregados das transações). Cada tabela vira um arquivo Feather
+    próprio, todos com a mesma chave do arquivo de origem.
+
+    Args:
+        nome: Identificador curto da estrutura (ex.: "trans_agregados")
+        path: Caminho do CSV de origem
+        preparar: Função sem argumentos que retorna a tupla
+            (dicionário nome da tabela -> DataFrame, metadados)
+        dependencias: Outros arquivos lidos por 'preparar' (ex.: a base de
+            players); alterar qualquer um deles também invalida o snapshot
+
+    Returns:
+        Tupla (dicionário de DataFrames, metadados, origem)
+    """
+    if not snapshots_disponiveis() or not os.path.exists(path):
+        tabelas, metadados = preparar()
+        return tabelas, metadados, "csv"
+
+    chave = chave_arquivo(path)
+    if dependencias:
+        chaves = [chave] + [chave_arquivo(d) if os.path.exists(d) else "" for d in dependencias]
+        chave = hashlib.sha1("|".join(chaves).encode()).hexdigest()
+    pasta, indice = _caminho_snapshot(nome, path, chave)
+
+    # O índice lista as tabelas gravadas e só é escrito depois de todas elas
+    if os.path.exists(indice):
+        try:
+            _, metadados = ler_snapshot(indice)
+            tabelas = {}
+            for tabela in metadados.pop("tabelas"):
+                tabelas[tabela], _ = ler_snapshot(_caminho_snapshot(f"{nome}.{tabela}", path, chave)[1])
+            return tabelas, metadados, "snapshot"
+        except Exception as e:
+            logger.warning("snapshot inválido para '%s' (%s); recarregando CSV", nome, e)
+
+    tabelas, metadados = preparar()
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        for tabela, df in tabelas.items():
+            destino = _caminho_snapshot(f"{nome}.{tabela}", path, chave)[1]
+            gravar_snapshot(df, destino)
+            _remover_snapshots_antigos(pasta, f"{nome}.{tabela}", destino)
+        gravar_snapshot(pd.DataFrame(), indice, {**metadados, "tabelas": list(tabelas)})
+        _remover_snapshots_antigos(pasta, nome, indice)
+    except Exception as e:
+        logger.warning("não foi possível gravar o snapshot de '%s': %s", nome, e)
+    return tabelas, metadados, "csv"
@@ -0,0 +1,146 @@
+# =============================================================================
+# CALLBACKS EM SEGUNDO PLANO (TAREFAS)
+# =============================================================================
+
+"""
+Execução de callbacks pesados fora das threads do servidor.
+
+Os relatórios em PDF (e, opcionalmente, os callbacks dos filtros) rodam como
+callbacks "background" do Dash: cada clique vira uma tarefa executada em um
+processo separado, com o resultado gravado em um cache em disco (diskcache),
+sem broker externo. A thread do servidor só dispara a tarefa e responde às
+consultas periódicas do navegador, então alguns relatórios simultâneos não
+bloqueiam a navegação normal.
+
+Sobre o gerenciador padrão do Dash (DiskcacheManager), GerenciadorTarefas:
+    - deduplica tarefas idênticas em andamento: um segundo clique (ou outra
+      aba) com os mesmos argumentos acompanha o processo já iniciado em vez
+      de abrir outro;
+    - mantém o resultado no cache por EXPIRACAO_TAREFAS segundos (por versão
+      dos dados), para que todos os clientes da mesma tarefa o recebam;
+    - inclui no identificador da tarefa a chave do callback, já que callbacks
+      registrados em laço têm o mesmo código-fonte.
+
+As dependências (dash[diskcache]: diskcache, multiprocess e psutil) são
+opcionais: sem elas os callbacks continuam síncronos, como antes.
+
+Com PICMONEY_FILTROS_SEGUNDO_PLANO=1 os callbacks dos filtros do CEO e do CFO
+também rodam em segundo plano. Fica desligado por padrão: cada tarefa roda em
+outro processo, então as figuras que ela monta não alimentam o cache de
+figuras do servidor.
+"""
+
+import functools
+import hashlib
+import os
+import tempfile
+
+from utils.db_utils import registro
+
+try:
+    import diskcache
+    from dash import DiskcacheManager
+    import multiprocess  # noqa: F401 (exigido pelo DiskcacheManager)
+    import psutil        # noqa: F401
+except ImportError:  # dash[diskcache] não instalado
+    diskcache = None
+    DiskcacheManager = object
+
+# Pasta do cache em disco das tarefas (resultados e progresso)
+PASTA_TAREFAS = os.environ.get(
+    "PICMONEY_PASTA_TAREFAS", os.path.join(tempfile.gettempdir(), "picmoney-tarefas"))
+
+# Tempo (s) que o resultado de uma tarefa fica disponível sem ser consultado
+EXPIRACAO_TAREFAS = 600
+
+# Com PICMONEY_FILTROS_SEGUNDO_PLANO=1, os filtros dos dashboards também viram tarefas
+FILTROS_EM_SEGUNDO_PLANO = os.environ.get("PICMONEY_FILTROS_SEGUNDO_PLANO", "") not in ("", "0")
+
+
+class GerenciadorTarefas(DiskcacheManager):
+    """DiskcacheManager com deduplicação das tarefas em andamento."""
+
+    def build_cache_key(self, fn, args, cache_args_to_ignore, triggered):
+        chave = super().build_cache_key(fn, args, cache_args_to_ignore, triggered)
+        chave_callback = getattr(fn, "chave_tarefa", "")
+        return hashlib.sha256(f"{chave}:{chave_callback}".encode("utf-8")).hexdigest()
+
+    def call_job_fn(self, key, job_fn, args, context):
+        # Transação do diskcache: dois cliques simultâneos não abrem dois processos
+        with self.handle.transact():
+            processo = self.handle.get(f"{key}-processo")
+            if processo is not None and self.job_running(processo):
+                return processo
+            processo = super().call_job_fn(key, job_fn, args, context)
+            self.handle.set(f"{key}-processo", processo, expire=EXPIRACAO_TAREFAS)
+        return processo
+
+
+def criar_gerenciador(pasta=PASTA_TAREFAS):
+    """
+    Gerenciador das tarefas em segundo plano.
+
+    Returns:
+        GerenciadorTarefas, ou None se as dependências não estiverem instaladas
+    """
+    if diskcache is None:
+        return None
+    return GerenciadorTarefas(
+        diskcache.Cache(pasta),
+        # Resultados valem para a versão atual dos dados
+        cache_by=[lambda: registro.versao],
+        expire=EXPIRACAO_TAREFAS,
+    )
+
+
+# Gerenciador global (passado ao Dash em app.py)
+gerenciador_tarefas = criar_gerenciador()
+
+
+def _sem_progresso(*valores):
+    """set_progress usado quando o callback roda de forma síncrona."""
+
+
+def callback_tarefa(app, *args, chave="", progress=None, cancel=None, running=None,
+                    segundo_plano=True, **kwargs):
+    """
+    Registra um callback que roda como tarefa em segundo plano quando possível.
+
+    Com progress, a função recebe set_progress como primeiro argumento (como
+    nos callbacks background do Dash); sem gerenciador disponível, o callback
+    é registrado como síncrono e set_progress não faz nada.
+
+    Args:
+        app: Aplicação Dash
+        *args: Saídas, entradas e estados, como em app.callback
+        chave: Identificador do callback na chave das tarefas (obrigatório
+            para callbacks registrados em laço)
+        progress: Saídas de progresso
+        cancel: Entradas que cancelam a tarefa em andamento
+        running: Propriedades alteradas enquanto a tarefa roda
+        segundo_plano: False força o modo síncrono
+        **kwargs: Demais opções de app.callback (ex.: cache_args_to_ignore=[0]
+            para que cliques repetidos com os mesmos dados reaproveitem a tarefa)
+    """
+    def registrar(funcao):
+        if gerenciador_tarefas is not None and segundo_plano:
+            funcao.chave_tarefa = chave
+            return app.callback(*args, background=True, manager=gerenciador_tarefas,
+                                progress=progress, cancel=cancel, running=running,
+                                **kwargs)(funcao)
+
+        # Sem tarefa não há o que cancelar: o botão de cancelar fica escondido
+        ids_cancelar = {c.component_id for c in (cancel if isinstance(cancel, list) else [cancel]) if c}
+        sincrono_running = [r for r in running or [] if r[0].component_id not in ids_cancelar] or None
+        opcoes = {k: v for k, v in kwargs.items() if k != "progress_default"}
+
+        if progress is None:
+            return app.callback(*args, running=sincrono_running, **opcoes)(funcao)
+
+        @functools.wraps(funcao)
+        def sincrono(*valores):
+            return funcao(_sem_progresso, *valores)
+        app.callback(*args, running=sincrono_running, **opcoes)(sincrono)
+        return funcao
+
+    return registrar